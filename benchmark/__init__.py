@@ -0,0 +1 @@
+"""Benchmarks of the M-Files client against a local mock server."""
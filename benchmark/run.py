@@ -0,0 +1,169 @@
+"""Benchmark harness for the M-Files client.
+
+Runs uploads, downloads, object creation, search and metadata lookups
+against the local stub server for every combination of object count, file
+size and number of workers, and writes the results as JSON.
+
+Usage::
+
+    python -m benchmark.run --objects 10,100 --file-sizes 1024,1048576 \\
+        --workers 1,8 --latency 0.005 --output results.json
+"""
+
+# Standard modules
+import argparse
+import json
+from os.path import join
+import sys
+from tempfile import TemporaryDirectory
+import time
+
+# External modules
+from requests import RequestException
+
+# Internal modules
+from benchmark.stub_server import StubServer, VAULT
+from mfiles.bulk import run_parallel
+from mfiles.client import MFilesClient
+from mfiles.errors import MFilesException
+from mfiles.retry import RetryPolicy
+
+def _count_errors(func, operations):
+    """Call ``func(i)`` for each operation, returns the number of failures."""
+    errors = 0
+    for i in range(operations):
+        try:
+            func(i)
+        except (MFilesException, RequestException):
+            errors += 1
+    return errors
+
+def _measure(server, name, config, operations, func):
+    """Run ``func`` and build a result record."""
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    requests_before = len(server.vault.requests)
+    started = time.perf_counter()
+    errors = func()
+    seconds = time.perf_counter() - started
+    result = dict(config, benchmark=name, operations=operations,
+                  seconds=seconds, errors=errors,
+                  requests=len(server.vault.requests) - requests_before)
+    result["operations_per_second"] = operations / seconds if seconds else None
+    if name in ("upload", "download"):
+        result["megabytes_per_second"] = \
+            operations * config["file_size"] / 1e6 / seconds
+    return result
+
+def run_config(objects, file_size, workers, directory, **server_options):
+    """Run all benchmarks for one configuration.
+
+    Parameters:
+        objects (int): Number of objects to upload, download and create.
+        file_size (int): Size in bytes of each file.
+        workers (int): Number of worker threads.
+        directory (str): Directory for temporary files.
+        server_options: Options for the stub server, see ``StubVault``.
+
+    Returns:
+        list: Result records.
+    """
+    config = dict(server_options, objects=objects, file_size=file_size,
+                  workers=workers)
+    paths = []
+    for i in range(objects):
+        paths.append(join(directory, "file%d.bin" % i))
+        with open(paths[-1], mode="wb") as file_stream:
+            file_stream.write(b"x" * file_size)
+    results = []
+    with StubServer(**server_options) as server:
+        client = MFilesClient(server=server.url, user="benchmark",
+                              password="benchmark", vault=VAULT,
+                              retry_policy=RetryPolicy(backoff=0.01,
+                                                       budget=objects))
+        def count_errors(bulk_results):
+            return sum(1 for result in bulk_results if result.error)
+        def lookup(_i):
+            client.get_value_id("Item 0", 101, [])
+            client.translate_name("Drawing", "class")
+        results.append(_measure(
+            server, "metadata_cold", config, 1,
+            lambda: _count_errors(lookup, 1)))
+        results.append(_measure(
+            server, "metadata_warm", config, objects,
+            lambda: _count_errors(lookup, objects)))
+        results.append(_measure(
+            server, "upload", config, objects,
+            lambda: count_errors(client.upload_many(
+                [(path, "Document", "Drawing", {"Customer": "ACME"})
+                 for path in paths], workers))))
+        results.append(_measure(
+            server, "create_object", config, objects,
+            lambda: count_errors(run_parallel(
+                lambda i: client.create_object("object %d" % i, "Document",
+                                               "Drawing",
+                                               {"Customer": "Initech"}),
+                range(objects), workers))))
+        results.append(_measure(
+            server, "search", config, 1,
+            lambda: _count_errors(
+                lambda _i: sum(1 for _item in client.iter_search(
+                    "q=file", page_size=100, prefetch=True)), 1)))
+        results.append(_measure(
+            server, "download", config, objects,
+            lambda: sum(entry["status"] == "failed"
+                        for entry in client.download_many(
+                            client.search("q=file"), join(directory, "out"),
+                            workers))))
+    return results
+
+def run_benchmarks(objects, file_sizes, workers, **server_options):
+    """Run benchmarks for all combinations of parameters.
+
+    Parameters:
+        objects (list): Object counts.
+        file_sizes (list): File sizes in bytes.
+        workers (list): Numbers of worker threads.
+        server_options: Options for the stub server, see ``StubVault``.
+
+    Returns:
+        list: Result records, one dict per benchmark and configuration.
+    """
+    results = []
+    for object_count in objects:
+        for file_size in file_sizes:
+            for worker_count in workers:
+                with TemporaryDirectory() as directory:
+                    results.extend(run_config(object_count, file_size,
+                                              worker_count, directory,
+                                              **server_options))
+    return results
+
+def _int_list(text):
+    return [int(value) for value in text.split(",")]
+
+def main(args=None):
+    """Run benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--objects", type=_int_list, default=[10, 100])
+    parser.add_argument("--file-sizes", type=_int_list, default=[1024])
+    parser.add_argument("--workers", type=_int_list, default=[1, 8])
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Server latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests failing with 503")
+    parser.add_argument("--value-list-size", type=int, default=1000)
+    parser.add_argument("--extra-properties", type=int, default=100)
+    parser.add_argument("--output", help="JSON output file, default stdout")
+    args = parser.parse_args(args)
+    results = run_benchmarks(args.objects, args.file_sizes, args.workers,
+                             latency=args.latency, error_rate=args.error_rate,
+                             value_list_size=args.value_list_size,
+                             extra_properties=args.extra_properties, seed=0)
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as file_stream:
+            json.dump(results, file_stream, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""Local stub of the M-Files REST API used by the tests and benchmarks.
+
+Implements enough of the API to exercise the client: authentication,
+structure, value lists, temporary file uploads, object creation, file
+content (with HTTP Range support), search, check in/out, property updates
+and deletion. GET responses carry an ETag and are revalidated with
+``If-None-Match``.
+Latency, error rate and structure and value list sizes are configurable.
+"""
+
+# Standard modules
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+from itertools import count
+import json
+import random
+import re
+import socket
+from threading import Lock, Thread
+import time
+from urllib.parse import parse_qs, urlsplit
+
+TOKEN = "stub-token"
+
+VAULT = "{00000000-0000-0000-0000-000000000000}"
+
+STRUCTURE = {
+    "objecttypes": [{"ID": 0, "Name": "Document"},
+                    {"ID": 9, "Name": "Project"}],
+    "classes": [{"ID": 0, "Name": "Unclassified document"},
+                {"ID": 1, "Name": "Drawing"}],
+    "properties": [{"ID": 0, "Name": "Name or title", "DataType": 1},
+                   {"ID": 1020, "Name": "Customer", "DataType": 9,
+                    "ValueList": 101},
+                   {"ID": 1021, "Name": "Comment", "DataType": 13}]
+}
+
+VALUE_LISTS = {
+    101: [{"ID": 1, "Name": "ACME", "HasOwner": False, "OwnerID": 0},
+          {"ID": 2, "Name": "Initech", "HasOwner": False, "OwnerID": 0}]
+}
+
+class StubVault():
+    """In-memory vault state shared by all requests.
+
+    Parameters:
+        latency (float): Seconds each request is delayed.
+        error_rate (float): Fraction of requests failing with status 503.
+        extra_properties (int): Number of generated property definitions
+                                added to the structure.
+        value_list_size (int): Number of generated items added to value
+                               list 101.
+        seed (int): Seed for the error generator.
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+    def __init__(self, latency=0.0, error_rate=0.0, extra_properties=0,
+                 value_list_size=0, seed=None):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.lock = Lock()
+        self.uploads = {}
+        self.upload_ids = count(1)
+        self.objects = {}
+        self.checkouts = {}
+        self.clock = 0
+        self.requests = []
+        self.token = TOKEN
+        self.failures = []
+        self.max_page_size = None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.structure = deepcopy(STRUCTURE)
+        self.structure["properties"].extend(
+            {"ID": 2000 + i, "Name": "Property %d" % i, "DataType": 1}
+            for i in range(extra_properties))
+        self.value_lists = deepcopy(VALUE_LISTS)
+        self.value_lists[101].extend(
+            {"ID": 1000 + i, "Name": "Item %d" % i, "HasOwner": False,
+             "OwnerID": 0} for i in range(value_list_size))
+
+    def tick(self):
+        """Advance the vault clock one second, returns the new time."""
+        self.clock += 1
+        moment = datetime(2024, 1, 1, tzinfo=timezone.utc) + \
+            timedelta(seconds=self.clock)
+        return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def add_object(self, obj_type, title, content, extra=None):
+        """Add an object with a single file, returns its ObjectVersion."""
+        with self.lock:
+            obj_id = len(self.objects) + 1
+            obj = {
+                "ObjVer": {"Type": obj_type, "ID": obj_id, "Version": 1},
+                "Title": title,
+                "Files": [{"ID": obj_id, "Name": title, "Extension": "bin",
+                           "Size": len(content), "Version": 1}],
+                "LastModifiedUtc": self.tick(),
+                "Deleted": False,
+                "ObjectCheckedOut": False,
+                "Properties": extra or []
+            }
+            self.objects[(obj_type, obj_id)] = (obj, content)
+        return obj
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler for the stub server."""
+    # pylint: disable=too-many-public-methods
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Avoid delayed ACK stalls when headers and body are sent separately
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+    @property
+    def vault(self):
+        """Vault state of the server."""
+        return self.server.vault
+
+    def send_json(self, data, status=200):
+        """Send a JSON response, with an ETag for successful GET requests."""
+        body = json.dumps(data).encode()
+        etag = None
+        if self.command == "GET" and status == 200:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, query, items):
+        """Send a page of items, capped at ``max_page_size`` items."""
+        limit = int(query.get("limit", [len(items) or 1])[0])
+        if self.vault.max_page_size is not None:
+            limit = min(limit, self.vault.max_page_size)
+        start = (int(query.get("page", [1])[0]) - 1) * limit
+        self.send_json({"Items": items[start:start + limit],
+                        "MoreResults": start + limit < len(items)})
+
+    def send_error_json(self, status, message):
+        """Send an M-Files style error response."""
+        self.send_json({"Status": status, "Message": message}, status)
+
+    def read_body(self):
+        """Read the request body."""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            return self.rfile.read(length)
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    break
+                chunks.append(chunk)
+            return b"".join(chunks)
+        return b""
+
+    def route(self, method):
+        """Dispatch a request to the matching handler."""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if query.pop("_method", ["POST"])[0] == "PUT":
+            method = "PUT"
+        path = url.path.strip("/")
+        if path.startswith("REST/"):
+            path = path[len("REST/"):]
+        body = self.read_body() if method in ("POST", "PUT") else b""
+        with self.vault.lock:
+            self.vault.requests.append((method, path))
+        if path == "server/authenticationtokens":
+            self.send_json({"Value": self.vault.token})
+            return
+        if self.headers.get("X-Authentication") != self.vault.token:
+            self.send_error_json(403, "Not authenticated")
+            return
+        if self.vault.latency:
+            time.sleep(self.vault.latency)
+        with self.vault.lock:
+            failure = self.vault.failures.pop(0) if self.vault.failures \
+                else None
+            if not failure and self.vault.error_rate and \
+                    self.vault.random.random() < self.vault.error_rate:
+                failure = 503
+        if failure:
+            self.send_error_json(failure, "Injected failure")
+            return
+        for pattern, handler in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and handler.__name__.startswith(method.lower()):
+                handler(self, query, body, *match.groups())
+                return
+        self.send_error_json(404, "Not found: %s %s" % (method, path))
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Handle GET request."""
+        self.route("GET")
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Handle POST request."""
+        self.route("POST")
+
+    def do_DELETE(self): # pylint: disable=invalid-name
+        """Handle DELETE request."""
+        self.route("DELETE")
+
+    def get_structure(self, _query, _body, category):
+        """Get structure list."""
+        self.send_json(self.vault.structure[category])
+
+    def get_value_list(self, query, _body, list_id):
+        """Get value list items with paging and name filter."""
+        items = self.vault.value_lists.get(int(list_id), [])
+        if "filter" in query:
+            items = [item for item in items
+                     if item["Name"] == query["filter"][0]]
+        self.send_page(query, items)
+
+    def post_file(self, _query, body):
+        """Upload file to temporary storage."""
+        with self.vault.lock:
+            upload_id = next(self.vault.upload_ids)
+            self.vault.uploads[upload_id] = body
+        self.send_json({"UploadID": upload_id, "Size": len(body)})
+
+    def delete_file(self, _query, _body, upload_id):
+        """Discard a file in temporary storage."""
+        with self.vault.lock:
+            content = self.vault.uploads.pop(int(upload_id), None)
+        if content is None:
+            self.send_error_json(404, "Upload not found")
+            return
+        self.send_json({})
+
+    def post_object(self, _query, body, obj_type):
+        """Create object from uploaded files."""
+        data = json.loads(body)
+        title = data["PropertyValues"][0]["TypedValue"]["Value"]
+        content = b""
+        for file_info in data.get("Files", []):
+            if file_info:
+                content += self.vault.uploads[file_info["UploadID"]]
+        obj = self.vault.add_object(int(obj_type), title, content,
+                                    data["PropertyValues"])
+        self.send_json(obj)
+
+    def get_objects(self, query, _body):
+        """Search objects by title and last modification, with paging.
+
+        Deleted objects are included with ``d=include``. As in M-Files the
+        results hold no property values.
+        """
+        text = query.get("q", [""])[0]
+        modified = query.get("p21>>", [""])[0]
+        deleted = query.get("d", [""])[0] == "include"
+        with self.vault.lock:
+            items = [{key: value for key, value in obj.items()
+                      if key != "Properties"}
+                     for obj, _content in self.vault.objects.values()
+                     if text in obj["Title"] and
+                     obj["LastModifiedUtc"] >= modified and
+                     (deleted or not obj["Deleted"])]
+        self.send_page(query, items)
+
+    def get_object(self, _query, _body, obj_type, obj_id, _version):
+        """Get an object version."""
+        entry = self.vault.objects.get((int(obj_type), int(obj_id)))
+        if entry is None:
+            self.send_error_json(404, "Object not found")
+            return
+        self.send_json(entry[0])
+
+    def get_content(self, _query, _body, obj_type, obj_id, _version,
+                    _file_id):
+        """Get file content, supporting single open ended ranges."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        entry = self.vault.objects.get((int(obj_type), int(obj_id)))
+        if entry is None:
+            self.send_error_json(404, "Object not found")
+            return
+        content = entry[1]
+        status = 200
+        byte_range = re.fullmatch(r"bytes=(\d+)-",
+                                  self.headers.get("Range") or "")
+        if byte_range:
+            start = int(byte_range.group(1))
+            if start >= len(content):
+                self.send_error_json(416, "Range not satisfiable")
+                return
+            content = content[start:]
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def put_checkedout(self, _query, body, obj_type, obj_id, _version):
+        """Check in or out an object, check out creates a new version."""
+        key = (int(obj_type), int(obj_id))
+        entry = self.vault.objects.get(key)
+        if entry is None:
+            self.send_error_json(404, "Object not found")
+            return
+        obj = entry[0]
+        check_out = json.loads(body)["Value"] == "2"
+        with self.vault.lock:
+            conflict = check_out and obj["ObjectCheckedOut"]
+            if check_out and not conflict:
+                self.vault.checkouts[key] = deepcopy(obj)
+                obj["ObjVer"]["Version"] += 1
+            elif not check_out:
+                self.vault.checkouts.pop(key, None)
+                obj["LastModifiedUtc"] = self.vault.tick()
+            obj["ObjectCheckedOut"] = check_out
+        if conflict:
+            self.send_error_json(409, "Already checked out")
+            return
+        self.send_json(obj)
+
+    def get_properties(self, _query, _body, obj_type, obj_id, _version):
+        """Get property values of an object version."""
+        entry = self.vault.objects.get((int(obj_type), int(obj_id)))
+        if entry is None:
+            self.send_error_json(404, "Object not found")
+            return
+        self.send_json(entry[0]["Properties"])
+
+    def post_properties(self, _query, body, obj_type, obj_id, _version):
+        """Set properties of a checked out object."""
+        entry = self.vault.objects.get((int(obj_type), int(obj_id)))
+        if entry is None or not entry[0]["ObjectCheckedOut"]:
+            self.send_error_json(400, "Object not checked out")
+            return
+        values = json.loads(body)
+        for value in values:
+            typed_value = value["TypedValue"]
+            if typed_value["DataType"] == 1 and \
+                    len(str(typed_value["Value"])) > 100:
+                self.send_error_json(400, "Text value too long")
+                return
+        defs = {value["PropertyDef"] for value in values}
+        entry[0]["Properties"] = [value for value in entry[0]["Properties"]
+                                  if value["PropertyDef"] not in defs] + values
+        self.send_json(entry[0])
+
+    def delete_version(self, _query, _body, obj_type, obj_id, _version):
+        """Undo the check out of an object."""
+        key = (int(obj_type), int(obj_id))
+        with self.vault.lock:
+            backup = self.vault.checkouts.pop(key, None)
+            if backup is not None:
+                self.vault.objects[key] = (backup, self.vault.objects[key][1])
+        if backup is None:
+            self.send_error_json(400, "Object not checked out")
+            return
+        self.send_json(backup)
+
+    def put_deleted(self, _query, _body, obj_type, obj_id):
+        """Flag an object as deleted."""
+        entry = self.vault.objects.get((int(obj_type), int(obj_id)))
+        if entry is None:
+            self.send_error_json(404, "Object not found")
+            return
+        with self.vault.lock:
+            entry[0]["Deleted"] = True
+            entry[0]["LastModifiedUtc"] = self.vault.tick()
+        self.send_json(entry[0])
+
+    def delete_object(self, _query, _body, obj_type, obj_id):
+        """Destroy an object."""
+        with self.vault.lock:
+            entry = self.vault.objects.pop((int(obj_type), int(obj_id)), None)
+        if entry is None:
+            self.send_error_json(404, "Object not found")
+            return
+        self.send_json(entry[0])
+
+ROUTES = [
+    (r"structure/(objecttypes|classes|properties)", StubHandler.get_structure),
+    (r"valuelists/(\d+)/items", StubHandler.get_value_list),
+    (r"files", StubHandler.post_file),
+    (r"files/(\d+)", StubHandler.delete_file),
+    (r"objects/(\d+)", StubHandler.post_object),
+    (r"objects", StubHandler.get_objects),
+    (r"objects/(\d+)/(\d+)/(\w+)/files/(\d+)/content",
+     StubHandler.get_content),
+    (r"objects/(\d+)/(\d+)/(\w+)/checkedout", StubHandler.put_checkedout),
+    (r"objects/(\d+)/(\d+)/(\w+)/properties", StubHandler.get_properties),
+    (r"objects/(\d+)/(\d+)/(\w+)/properties", StubHandler.post_properties),
+    (r"objects/(\d+)/(\d+)/deleted", StubHandler.put_deleted),
+    (r"objects/(\d+)/(\d+)/(\w+)", StubHandler.get_object),
+    (r"objects/(\d+)/(\d+)/latest", StubHandler.delete_object),
+    (r"objects/(\d+)/(\d+)/(\d+)", StubHandler.delete_version),
+]
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """Threading HTTP server accepting many concurrent connections."""
+    daemon_threads = True
+    request_queue_size = 128
+
+class StubServer():
+    """Stub M-Files server running in a background thread.
+
+    Use as a context manager, ``url`` is the REST API URL to connect to.
+    Keyword arguments are passed to ``StubVault``.
+    """
+
+    def __init__(self, **options):
+        self.httpd = StubHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.vault = StubVault(**options)
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """REST API URL of the server."""
+        return "http://127.0.0.1:%d/REST/" % self.httpd.server_address[1]
+
+    @property
+    def vault(self):
+        """Vault state of the server."""
+        return self.httpd.vault
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
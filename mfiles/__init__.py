@@ -10,7 +10,39 @@ object with username and password.
 M-Files property IDs for all object types are abstracted, so you can upload a
 ``Document`` using ``upload_file()`` with ``object_type="Document"`` and
 correct IDs will be fetched from the server.
+
+``AsyncMFilesClient()`` offers the same methods as coroutines for use with
+``asyncio``. It requires ``aiohttp``. ``MFilesClientPool()`` manages clients
+for many vaults and servers.
+
+The clients are imported on first access, so ``import mfiles`` does not load
+``requests`` or ``aiohttp``.
 """
 
-from mfiles.client import MFilesClient
+# Standard modules
+from importlib import import_module
+
+# Internal modules
 from mfiles.errors import MFilesException
+
+# Modules of the attributes imported on first access
+_LAZY = {
+    "AsyncMFilesClient": "mfiles.async_client",
+    "MFilesClient": "mfiles.client",
+    "MFilesClientPool": "mfiles.pool"
+}
+
+# The clients are resolved by __getattr__
+# pylint: disable-next=undefined-all-variable
+__all__ = ["AsyncMFilesClient", "MFilesClient", "MFilesClientPool",
+           "MFilesException"]
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
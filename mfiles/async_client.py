@@ -0,0 +1,633 @@
+"""Asynchronous M-Files client methods.
+
+Requires ``aiohttp``, install with ``pip install mfiles[async]``.
+
+For more information, see:
+https://developer.m-files.com/APIs/REST-API/Reference
+"""
+
+# Standard modules
+import asyncio
+import json
+import time
+from os import PathLike, fspath, getenv
+from os.path import splitext
+
+# External modules
+try:
+    import aiohttp
+except ImportError: # pragma: no cover
+    aiohttp = None
+
+# Internal modules
+from mfiles.cache import DEFAULT_TTL, StructureCache, ValueListIndex, found
+from mfiles.definitions import DEFAULT_URL, LOOKUP_DATATYPES
+from mfiles.errors import MFilesException
+from mfiles.metrics import RequestEvent, data_size, endpoint_template
+from mfiles.paging import more_pages, value_list_endpoint
+from mfiles.properties import build_object, build_property, dumps
+from mfiles.retry import AUTH_STATUSES, RequestAttempts, RetryPolicy, \
+    session_expired
+from mfiles.transfer import DEFAULT_CHUNK_SIZE, hash_file, resume_offset, \
+    upload_file_info, write_chunk
+from mfiles.token_cache import cached_token
+
+# Default maximum number of open connections
+DEFAULT_POOL_SIZE = 100
+
+# Default maximum number of requests in flight
+DEFAULT_CONCURRENCY = 32
+
+class AsyncMFilesClient():
+    """Asynchronous M-Files client.
+
+    Covers the same methods as ``MFilesClient`` as coroutines. All requests
+    share one connection pool. The client logs in on the first request, use
+    it as an async context manager or call ``close()`` when done.
+
+    Credentials not supplied are fetched from environment variables
+    ``MFILES_URL``, ``MFILES_USER``, ``MFILES_PASS`` and ``MFILES_VAULT``.
+    Unlike ``MFilesClient`` the user is never prompted.
+
+    Parameters:
+        server (str): API URL. Defaults to ``"http://localhost/m-files/REST/"``
+        user (str): User to login with.
+        password (str): User password.
+        vault (str): M-Files vault GUID to connect to.
+        pool_size (int): Maximum number of open connections. Defaults to 100.
+        concurrency (int): Maximum number of requests in flight. Defaults
+                           to 32.
+        structure_ttl (float): Seconds before cached vault structure is
+                               fetched again. Defaults to 300.
+        retry_policy (RetryPolicy): Policy for retrying failed requests.
+                                    Defaults to ``RetryPolicy()``.
+        token (str): Authentication token to use instead of logging in.
+        token_cache (TokenCache): Optional store of authentication tokens
+                                  shared between processes.
+
+    Raises:
+        MFilesException: If ``aiohttp`` is not installed.
+    """
+    # pylint: disable=too-many-public-methods,too-many-instance-attributes
+
+    def __init__(self, server=DEFAULT_URL, user=None, password=None, vault=None,
+                 pool_size=DEFAULT_POOL_SIZE, concurrency=DEFAULT_CONCURRENCY,
+                 structure_ttl=DEFAULT_TTL, retry_policy=None, token=None,
+                 token_cache=None):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.metrics_sinks = []
+        if aiohttp is None:
+            raise MFilesException("AsyncMFilesClient requires aiohttp")
+        server = server or getenv("MFILES_URL")
+        if server[-1] != "/":
+            server += "/"
+        self.server = server
+        self.user = user or getenv("MFILES_USER")
+        self.password = password or getenv("MFILES_PASS")
+        self.vault = vault or getenv("MFILES_VAULT")
+        self.pool_size = pool_size
+        self.headers = {"X-Authentication": token} if token else {}
+        self.token_cache = token_cache
+        self.structure = StructureCache(None, structure_ttl)
+        self.structure.set_scope(self.server, self.vault)
+        self.value_list_index = ValueListIndex(None, ttl=structure_ttl)
+        self.value_list_index.set_scope(self.server, self.vault)
+        self._limit = asyncio.Semaphore(concurrency)
+        self._login_lock = asyncio.Lock()
+        self._fetch_locks = {}
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close all connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def has_credentials(self):
+        """Check if the client can log in."""
+        return all([self.server, self.user, self.password, self.vault])
+
+    async def login(self):
+        """Logs in the user to M-Files.
+
+        Raises:
+            MFilesException: If credentials are missing or rejected.
+        """
+        if not self.has_credentials():
+            raise MFilesException("Missing M-Files credentials")
+        auth = json.dumps({"Username": self.user,
+                           "Password": self.password,
+                           "VaultGuid": self.vault})
+        request_url = self.server + "server/authenticationtokens"
+        async with self._get_session().post(request_url, data=auth) as response:
+            text = await response.text()
+            if response.status != 200:
+                raise MFilesException(text)
+        self.headers = {"X-Authentication": json.loads(text)["Value"]}
+        if self.token_cache is not None:
+            self.token_cache.put(self.server, self.vault, self.user,
+                                 self.headers["X-Authentication"])
+
+    async def _ensure_login(self):
+        async with self._login_lock:
+            if self.headers:
+                return
+            token = cached_token(self)
+            if not token:
+                await self.login()
+                return
+            self.headers = {"X-Authentication": token}
+
+    async def _renew(self, auth_headers):
+        """Log in again unless another task already renewed the token."""
+        async with self._login_lock:
+            if self.headers is auth_headers:
+                await self.login()
+
+    async def _request(self, method, endpoint, data=None, headers=None,
+                       handle=None):
+        """Send a request, see ``MFilesClient._request()``.
+
+        Parameters:
+            method (str): HTTP method.
+            endpoint (str): Endpoint on form ``"path/to/endpoint"``.
+            data (any): Request body.
+            headers (dict): Headers in addition to authentication.
+            handle (coroutine function): Called with the final response,
+                                         whatever its status, to read it.
+                                         Defaults to decoding the JSON body
+                                         of a ``200`` response.
+
+        Returns:
+            any: The decoded body, or the result of ``handle``.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # pylint: disable=too-many-locals,too-many-branches
+        # Same retry and renewal loop as MFilesClient._request()
+        if endpoint[0] == "/":
+            endpoint = endpoint[1:]
+        await self._ensure_login()
+        request_url = self.server + endpoint
+        http_method = "POST" if "_method=PUT" in endpoint else method
+        attempts = RequestAttempts(self.retry_policy, method, data)
+        while True:
+            auth_headers = self.headers
+            action = None
+            handled = False
+            async with self._limit:
+                try:
+                    async with self._get_session().request(
+                            http_method, request_url, data=data,
+                            headers=dict(auth_headers, **(headers or {}))) \
+                            as response:
+                        status = response.status
+                        size = response.content_length
+                        if status in AUTH_STATUSES and not attempts.renewed \
+                                and self.has_credentials() and \
+                                session_expired(status, await response.read()):
+                            action = "login"
+                        elif status >= 400 and attempts.should_retry(status):
+                            action = "retry"
+                        if action is None and handle is not None:
+                            handled = True
+                            result = await handle(response)
+                        else:
+                            result = await response.read()
+                            size = len(result)
+                except (aiohttp.ClientConnectionError,
+                        asyncio.TimeoutError) as error:
+                    connect_error = isinstance(error,
+                                               aiohttp.ClientConnectorError)
+                    if handled or not attempts.should_retry(
+                            connect_error=connect_error):
+                        self._emit_metrics(method, endpoint, None, None, data,
+                                           attempts)
+                        raise
+                    action = "retry"
+            if action == "login":
+                # Token may have expired, log in again once
+                attempts.renewed = True
+                await self._renew(auth_headers)
+                if attempts.replayable:
+                    continue
+            elif action == "retry":
+                await asyncio.sleep(attempts.next_delay())
+                continue
+            attempts.done(status)
+            self._emit_metrics(method, endpoint, status, size, data, attempts)
+            if handled:
+                return result
+            if status != 200:
+                raise MFilesException(result.decode(errors="replace"))
+            return json.loads(result)
+
+    def add_metrics_sink(self, sink):
+        """Report metrics of every request to ``sink``.
+
+        See ``MFilesClient.add_metrics_sink()``.
+        """
+        self.metrics_sinks.append(sink)
+
+    def _emit_metrics(self, method, endpoint, status, bytes_in, data,
+                      attempts):
+        """Report a request to all metrics sinks."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        if not self.metrics_sinks:
+            return
+        event = RequestEvent(method=method,
+                             endpoint=endpoint_template(endpoint),
+                             status=status, bytes_in=bytes_in,
+                             bytes_out=data_size(data),
+                             latency=time.perf_counter() - attempts.started,
+                             retries=attempts.count, cache=None)
+        for sink in self.metrics_sinks:
+            sink(event)
+
+    async def get(self, endpoint):
+        """General purpose GET method.
+
+        Parameters:
+            endpoint (str): Endpoint on form ``"path/to/endpoint"``.
+
+        Raises:
+            MFilesException: If request returns status code != 200.
+
+        Returns:
+            dict: Dictionary with request result.
+        """
+        return await self._request("GET", endpoint)
+
+    async def put(self, endpoint, data=None):
+        """General purpose PUT method.
+
+        Parameters:
+            endpoint (str): Endpoint on form ``"path/to/endpoint"``.
+            data (str): Data to use in PUT request.
+
+        Raises:
+            MFilesException: If request returns status code != 200.
+
+        Returns:
+            dict: Dictionary with request result.
+        """
+        return await self._request("PUT", endpoint + "?_method=PUT", data)
+
+    async def post(self, endpoint, data=None):
+        """General purpose POST method.
+
+        Parameters:
+            endpoint (str): Endpoint on form ``"path/to/endpoint"``.
+            data (str): Data to use in POST request.
+
+        Raises:
+            MFilesException: If request returns status code != 200.
+
+        Returns:
+            dict: Dictionary with request result.
+        """
+        return await self._request("POST", endpoint, data)
+
+    async def quick_search(self, query):
+        """Perform a quick search in the M-Files vault."""
+        return await self.get("objects?q=" + query)
+
+    async def search(self, query):
+        """Perform a search in the M-Files vault."""
+        return await self.get("objects?" + query)
+
+    async def objects(self):
+        """Get all object types in the M-Files vault."""
+        return await self.get("structure/objecttypes")
+
+    async def classes(self):
+        """Get all classes in the M-Files vault."""
+        return await self.get("structure/classes")
+
+    async def properties(self):
+        """Get all property definitions in the M-Files vault."""
+        return await self.get("structure/properties")
+
+    async def class_details(self, class_id):
+        """Get details for a specific class in the M-Files vault."""
+        return await self.get("structure/classes/%d" % class_id)
+
+    async def value_lists(self):
+        """Get all value lists in the M-Files vault."""
+        return await self.get("valuelists")
+
+    async def value_list_items(self, list_id, page=None, limit=None,
+                               name_filter=None):
+        """Get items for a specific value list in the M-Files vault.
+
+        See ``MFilesClient.value_list_items()``.
+        """
+        endpoint = value_list_endpoint(list_id, page, limit, name_filter)
+        return await self.get(endpoint)
+
+    async def _value_list_all(self, list_id, name_filter=None):
+        page_size = self.value_list_index.page_size
+        items = []
+        page = 1
+        while True:
+            result = await self.value_list_items(list_id, page, page_size,
+                                                 name_filter)
+            page_items = result.get("Items", [])
+            items.extend(page_items)
+            if not more_pages(result, len(page_items)):
+                return items
+            page += 1
+
+    def _fetch_lock(self, key):
+        """Get the lock making concurrent tasks fetch ``key`` once."""
+        return self._fetch_locks.setdefault(key, asyncio.Lock())
+
+    async def get_value_id(self, value_name, list_id, owner_ids):
+        """Get the ID of a specific value in a specific value list.
+
+        See ``MFilesClient.get_value_id()``.
+        """
+        index = self.value_list_index
+        item = None
+        if index.fresh(list_id):
+            item = index.find(list_id, value_name, owner_ids)
+        if item is None:
+            async with self._fetch_lock(("list", list_id)):
+                if index.fresh(list_id):
+                    # Another task may have fetched the item meanwhile
+                    item = index.find(list_id, value_name, owner_ids)
+                    if item is None:
+                        index.count_miss()
+                        items = await self._value_list_all(list_id, value_name)
+                        index.update(list_id, items, merge=True)
+                        item = index.find(list_id, value_name, owner_ids)
+                else:
+                    index.count_miss()
+                    index.update(list_id, await self._value_list_all(list_id))
+                    item = index.find(list_id, value_name, owner_ids)
+        if item is None:
+            raise MFilesException("Value name %s not recognized" % value_name)
+        return item["ID"]
+
+    async def get_types(self, category="object"):
+        """Get info for all types from a type category.
+
+        See ``MFilesClient.get_types()``.
+        """
+        if not self.structure.fresh(category):
+            async with self._fetch_lock(("structure", category)):
+                # Another task may have fetched the types meanwhile
+                if not self.structure.fresh(category):
+                    if category == "object":
+                        types = await self.objects()
+                    elif category == "class":
+                        types = await self.classes()
+                    elif category == "property":
+                        types = await self.properties()
+                    else:
+                        raise MFilesException("Type name %s not recognized" %
+                                              category)
+                    self.structure.update(category, types)
+                    return types
+        return self.structure.types(category)
+
+    async def get_info(self, name, category="object"):
+        """Get general info of a type by name.
+
+        See ``MFilesClient.get_info()``.
+        """
+        await self.get_types(category)
+        return found(self.structure.by_name(category, name),
+                      "Property %s could not be found in vault", name)
+
+    async def get_info_id(self, type_id, category="object"):
+        """Get general info of a type by id.
+
+        See ``MFilesClient.get_info_id()``.
+        """
+        await self.get_types(category)
+        return found(self.structure.by_id(category, type_id),
+                      "Property ID %s could not be found in vault", type_id)
+
+    async def translate_name(self, name, category="object"):
+        """Translate a name into its ID as recognized by the server."""
+        return (await self.get_info(name, category))["ID"]
+
+    async def get_property(self, property_name, owners, property_value):
+        """Get a certain property built as M-Files expects it.
+
+        See ``MFilesClient.get_property()``.
+        """
+        property_info = await self.get_info(property_name, "property")
+        if property_info["DataType"] in LOOKUP_DATATYPES:
+            property_value = await self.get_value_id(property_value,
+                                                     property_info["ValueList"],
+                                                     owners)
+        return build_property(property_info, property_value)
+
+    async def create_object(self, name, object_type=0, object_class=0,
+                            extra_info=None, file_info=None):
+        """Create M-Files object and upload it to the vault.
+
+        See ``MFilesClient.create_object()``.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        if isinstance(object_type, str):
+            object_type = await self.translate_name(object_type, "object")
+        if isinstance(object_class, str):
+            object_class = await self.translate_name(object_class, "class")
+        owners = [object_class, object_type]
+        properties = await asyncio.gather(
+            *[self.get_property(property_name, owners, value)
+              for property_name, value in (extra_info or {}).items()])
+        data = dumps(build_object(name, object_class, properties, file_info))
+        return await self.post("objects/%s" % object_type, data)
+
+    async def check_out(self, object_id, object_version="latest",
+                        object_type=0):
+        """Check out an object from M-Files."""
+        data = json.dumps({"Value": "2"}) # Checked out by me
+        endpoint = "objects/%s/%s/%s/checkedout" % \
+            (object_type, object_id, object_version)
+        return await self.put(endpoint, data)
+
+    async def check_in(self, object_id, object_version="latest", object_type=0):
+        """Check in an object to M-Files."""
+        data = json.dumps({"Value": "0"}) # Checked in
+        endpoint = "objects/%s/%s/%s/checkedout" % \
+            (object_type, object_id, object_version)
+        return await self.put(endpoint, data)
+
+    async def upload_temporary_file(self, source, chunk_size=DEFAULT_CHUNK_SIZE,
+                                    progress=None):
+        """Upload file content to the temporary upload area of the vault.
+
+        The content is streamed with chunked transfer encoding.
+
+        Parameters:
+            source (str, PathLike, file, iterable): Path to file, open binary
+                                                    file, iterable or async
+                                                    iterable of ``bytes``
+                                                    chunks.
+            chunk_size (int): Bytes read from files at a time.
+            progress (callable): Optional callback called as
+                                 ``progress(bytes_done, bytes_total)``.
+
+        Returns:
+            dict: Upload info with keys ``UploadID`` and ``Size``.
+        """
+        if isinstance(source, (str, PathLike)):
+            return await self._upload_path(fspath(source), chunk_size,
+                                           progress)
+        status, body = await self._upload(source, chunk_size, progress)
+        if status != 200:
+            raise MFilesException(body.decode(errors="replace"))
+        return json.loads(body)
+
+    async def _upload_path(self, file_path, chunk_size, progress):
+        """Send a local file, see ``MFilesClient._upload_path()``."""
+        # Same retry loop as MFilesClient._upload_path(), the file is opened
+        # once and read again from the start for every attempt
+        attempts = RequestAttempts(self.retry_policy, "POST")
+        with open(file_path, mode="rb") as file_stream:
+            while True:
+                auth_headers = self.headers
+                file_stream.seek(0)
+                try:
+                    status, body = await self._upload(file_stream, chunk_size,
+                                                      progress)
+                except (aiohttp.ClientConnectionError,
+                        asyncio.TimeoutError) as error:
+                    if not attempts.should_retry(connect_error=isinstance(
+                            error, aiohttp.ClientConnectorError)):
+                        raise
+                except MFilesException:
+                    # The token was rejected, send the file again once renewed
+                    if attempts.renewed or self.headers is auth_headers:
+                        raise
+                    attempts.renewed = True
+                    continue
+                else:
+                    if status == 200:
+                        return json.loads(body)
+                    if not attempts.should_retry(status):
+                        raise MFilesException(body.decode(errors="replace"))
+                await asyncio.sleep(attempts.next_delay())
+
+    async def _upload(self, source, chunk_size, progress):
+        """Send file content to the temporary upload area.
+
+        Returns:
+            tuple: Response status and body.
+        """
+        async def chunks():
+            done = 0
+            if hasattr(source, "read"):
+                parts = iter(lambda: source.read(chunk_size), b"")
+            else:
+                parts = source
+            if hasattr(parts, "__aiter__"):
+                async for chunk in parts:
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, None)
+                    yield chunk
+                return
+            for chunk in parts:
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, None)
+                yield chunk
+        async def read(response):
+            return response.status, await response.read()
+        return await self._request("POST", "files", chunks(), handle=read)
+
+    async def upload_file(self, file_path, object_type=0, object_class=0,
+                          extra_info=None, progress=None):
+        """Upload a file to M-Files.
+
+        See ``MFilesClient.upload_file()``.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        upload_info = await self.upload_temporary_file(file_path,
+                                                       progress=progress)
+        object_name = splitext(file_path)[0]
+        file_info = upload_file_info(file_path, upload_info)
+        return await self.create_object(object_name, object_type, object_class,
+                                        extra_info, file_info)
+
+    async def download_file(self, local_path, object_type, object_id, file_id,
+                            object_version="latest",
+                            chunk_size=DEFAULT_CHUNK_SIZE, resume=False,
+                            checksum=None, progress=None):
+        """Download a file from M-Files.
+
+        See ``MFilesClient.download_file()``.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        endpoint = "objects/%s/%s/%s/files/%s/content" % \
+            (object_type, object_id, object_version, file_id)
+        is_path = not hasattr(local_path, "write")
+        offset = resume_offset(local_path, resume)
+        headers = {"Range": "bytes=%d-" % offset} if offset else {}
+        async def write(response):
+            if response.status == 416 and offset:
+                # Requested range not satisfiable, file already complete
+                if checksum is not None:
+                    hash_file(local_path, checksum)
+                return True
+            if response.status == 200:
+                start = 0
+            elif response.status == 206 and offset:
+                start = offset
+            else:
+                raise MFilesException(await response.text())
+            total = response.content_length
+            if total is not None:
+                total += start
+            if is_path:
+                if start and checksum is not None:
+                    hash_file(local_path, checksum)
+                file_stream = open(local_path, # pylint: disable=consider-using-with
+                                   mode="ab" if start else "wb")
+            else:
+                file_stream = local_path
+            try:
+                done = start
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    done = write_chunk(file_stream, chunk, done, total,
+                                       checksum, progress)
+            finally:
+                if is_path:
+                    file_stream.close()
+            return True
+        return await self._request("GET", endpoint, headers=headers,
+                                   handle=write)
+
+    async def delete_object(self, object_type, object_id):
+        """Delete M-Files object.
+
+        See ``MFilesClient.delete_object()``.
+        """
+        return await self.put("objects/%s/%s/deleted" % (object_type, object_id))
+
+    async def destroy_object(self, object_type, object_id):
+        """Destroy M-Files object.
+
+        See ``MFilesClient.destroy_object()``.
+        """
+        endpoint = "objects/%s/%s/latest?allVersions=true" % \
+            (object_type, object_id)
+        return await self._request("DELETE", endpoint)
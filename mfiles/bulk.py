@@ -0,0 +1,507 @@
+"""Running many M-Files requests in parallel.
+
+``BulkMixin`` holds the bulk methods of ``MFilesClient``, uploading,
+downloading, updating and removing many objects with a pool of worker
+threads.
+"""
+
+# Standard modules
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+from itertools import islice
+import json
+from os import PathLike, fspath, makedirs, replace
+from os.path import dirname, getsize, isfile, splitext
+from threading import Lock
+import time
+
+# External modules
+import requests
+
+# Internal modules
+from mfiles.errors import MFilesException
+from mfiles.transfer import download_tasks, is_present, part_file, \
+    upload_file_info
+
+# Default number of worker threads for bulk operations
+DEFAULT_WORKERS = 8
+
+# Marks the end of the items
+_DONE = object()
+
+BulkResult = namedtuple("BulkResult", ["item", "result", "error"])
+BulkResult.__doc__ = """Result of one item of a bulk operation.
+
+Attributes:
+    item (any): The item as supplied by the caller.
+    result (any): Return value for the item, ``None`` if it failed.
+    error (Exception): Exception raised for the item, ``None`` if it
+                       succeeded.
+"""
+
+def run_parallel(func, items, workers=DEFAULT_WORKERS):
+    """Call ``func`` for each item using a pool of worker threads.
+
+    Items are consumed lazily, at most ``2 * workers`` are in flight at a
+    time, so ``items`` can be a generator over a very large input.
+
+    Parameters:
+        func (callable): Function called with one item.
+        items (iterable): Items to process.
+        workers (int): Number of worker threads.
+
+    Yields:
+        BulkResult: Result for each item, in order of completion. Exceptions
+                    raised by ``func`` are returned, not raised.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(func, item): item
+                   for item in islice(items, 2 * workers)}
+        while pending:
+            done = wait(pending, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                result = None if error else future.result()
+                next_item = next(items, _DONE)
+                if next_item is not _DONE:
+                    pending[executor.submit(func, next_item)] = next_item
+                yield BulkResult(item, result, error)
+
+class RateLimiter():
+    """Limit the rate of calls shared by many threads.
+
+    Parameters:
+        rate (float): Maximum calls per second.
+        burst (int): Calls allowed at once after a quiet period. Defaults
+                     to 1.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """Wait until a call is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait_time:
+            time.sleep(wait_time)
+
+class Checkpoint():
+    """Append-only record of completed items, for resuming bulk operations.
+
+    Each completed item is written as one line and flushed immediately, so
+    an interrupted run loses at most the items in flight.
+
+    Parameters:
+        path (str): Path of the checkpoint file, created if missing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if isfile(path):
+            with open(path, encoding="utf-8") as file_stream:
+                self.done = {line.strip() for line in file_stream
+                             if line.strip()}
+        self._lock = Lock()
+        # pylint: disable=consider-using-with
+        self._file = open(path, mode="a", encoding="utf-8")
+
+    def __contains__(self, key):
+        return str(key) in self.done
+
+    def add(self, key):
+        """Record ``key`` as completed."""
+        with self._lock:
+            self.done.add(str(key))
+            self._file.write("%s\n" % key)
+            self._file.flush()
+
+    def close(self):
+        """Close the checkpoint file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _upload_arguments(item):
+    """Get the ``upload_file()`` arguments of an ``upload_many()`` item."""
+    if isinstance(item, (str, PathLike)):
+        return (fspath(item),)
+    fields = tuple(item)
+    if not 1 <= len(fields) <= 5:
+        raise MFilesException("Invalid upload item %r" % (item,))
+    return (fspath(fields[0]),) + fields[1:]
+
+def _object_keys(items, object_type):
+    """Turn object IDs, ``(type, id)`` pairs or search results into keys."""
+    if isinstance(items, dict):
+        items = items["Items"]
+    for item in items:
+        if isinstance(item, dict):
+            yield item["ObjVer"]["Type"], item["ObjVer"]["ID"]
+        elif isinstance(item, (tuple, list)):
+            yield item[0], item[1]
+        else:
+            yield object_type, item
+
+class BulkMixin():
+    """Bulk methods of ``MFilesClient``.
+
+    Every item is handled by a worker thread with its own session, see
+    ``MFilesClient.threaded()``. A failing item does not stop the others.
+    """
+
+    def update_many(self, items, object_class=None, workers=DEFAULT_WORKERS):
+        """Update properties of many objects in parallel.
+
+        Every object is checked out, updated and checked in again. If the
+        update or check in fails the check out is undone, so no object is
+        left checked out with partial changes. Property definitions and
+        value lists are fetched once for the whole batch.
+
+        Parameters:
+            items (iterable): Items on form ``(object_type, object_id,
+                              properties)`` where ``properties`` is a dict
+                              of property values by property name, like
+                              ``extra_info`` of ``create_object()``.
+            object_class (int): Class of the objects, used as owner when
+                                looking up values. Defaults to None.
+            workers (int): Number of worker threads. Defaults to 8.
+
+        Returns:
+            list: Report with one dict per object with keys
+            ``object_type``, ``object_id``, ``status`` (``"updated"`` or
+            ``"failed"``), ``version`` (new version when updated),
+            ``rolled_back`` (True if a check out was undone) and ``error``.
+        """
+        items = [(self.translate_name(obj_type, "object")
+                  if isinstance(obj_type, str) else obj_type, obj_id, values)
+                 for obj_type, obj_id, values in items]
+        try:
+            self.property_resolver.prepare(
+                {(obj_type, object_class, tuple(values))
+                 for obj_type, _obj_id, values in items})
+        except MFilesException:
+            pass # Reported for the objects concerned
+        failures = (MFilesException, requests.RequestException)
+        def update(item):
+            obj_type, obj_id, values = item
+            report = {"object_type": obj_type, "object_id": obj_id,
+                      "status": "failed", "version": None,
+                      "rolled_back": False, "error": None}
+            try:
+                properties = self.property_resolver.resolve(
+                    obj_type, object_class, values)
+                version = self.check_out(obj_id, object_type=obj_type)
+                version = version["ObjVer"]["Version"]
+            except failures as error:
+                report["error"] = str(error)
+                return report
+            try:
+                self.set_properties(obj_id, properties, version, obj_type)
+                result = self.check_in(obj_id, version, obj_type)
+            except failures as error:
+                report["error"] = str(error)
+                try:
+                    self.undo_check_out(obj_id, version, obj_type)
+                    report["rolled_back"] = True
+                except failures:
+                    pass
+                return report
+            report.update(status="updated", version=result["ObjVer"]["Version"])
+            return report
+        return [result.result or {"object_type": result.item[0],
+                                  "object_id": result.item[1],
+                                  "status": "failed", "version": None,
+                                  "rolled_back": False,
+                                  "error": str(result.error)}
+                for result in run_parallel(self.threaded(update), items,
+                                             workers)]
+
+    def upload_many(self, items, workers=DEFAULT_WORKERS):
+        """Upload many files to M-Files in parallel.
+
+        Each file is uploaded and its object created by a pool of worker
+        threads, so uploads of some files overlap with object creation of
+        others. The vault structure is fetched once for the whole batch
+        before any worker starts, and the property templates and value
+        lists of each combination of type, class and properties are
+        resolved once, before the first item using them is handed to a
+        worker. A failing item does not stop the batch.
+
+        Parameters:
+            items (iterable): Items on form ``(file_path, object_type,
+                              object_class, extra_info, progress)``, see
+                              ``upload_file()``. Trailing elements can be
+                              left out, a plain file path is also accepted.
+                              Items are consumed lazily.
+            workers (int): Number of worker threads. Defaults to 8.
+
+        Yields:
+            BulkResult: Result for each item as it completes, ``result``
+                        holds the object info.
+        """
+        for category in self.structure.CATEGORIES:
+            self.get_types(category)
+        prepared = set()
+        def prepare(items):
+            for item in items:
+                try:
+                    # Defaults of upload_file() for left out elements
+                    obj_type, obj_class, extra_info = \
+                        (_upload_arguments(item) + (0, 0, None))[1:4]
+                    if isinstance(obj_type, str):
+                        obj_type = self.translate_name(obj_type, "object")
+                    if isinstance(obj_class, str):
+                        obj_class = self.translate_name(obj_class, "class")
+                    key = (obj_type, obj_class, tuple(extra_info or {}))
+                    if key not in prepared:
+                        prepared.add(key)
+                        self.property_resolver.prepare([key])
+                except (MFilesException, OSError, TypeError, ValueError):
+                    pass # Reported by the upload of the item
+                yield item
+        def upload(item):
+            return self.upload_file(*_upload_arguments(item))
+        yield from run_parallel(self.threaded(upload), prepare(items),
+                                workers)
+
+    def upload_files(self, file_paths, name=None, object_type=0,
+                     object_class=0, extra_info=None, workers=DEFAULT_WORKERS):
+        """Create one object from several files.
+
+        The files are streamed to temporary storage in parallel and the
+        object is created with a single request. If an upload or the object
+        creation fails, the files already uploaded are discarded.
+
+        Parameters:
+            file_paths (list): Paths of the files.
+            name (str): Name of new object. Defaults to the name of the
+                        first file without extension.
+            object_type (str, int): Object type, see ``upload_file()``.
+            object_class (str, int): Object class, see ``upload_file()``.
+            extra_info (dict): Additional object information.
+            workers (int): Number of files uploaded at a time. Defaults
+                           to 8.
+
+        Raises:
+            MFilesException: If a file can't be uploaded, the object can't
+                             be created or there are neither files nor a
+                             name.
+
+        Returns:
+            dict: Dictionary with object information.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        file_paths = list(file_paths)
+        if not file_paths and name is None:
+            raise MFilesException("No files to upload and no object name")
+        upload = self.threaded(self.upload_temporary_file)
+        # Keyed on position, the same file may be given twice
+        uploads = {}
+        error = None
+        for result in run_parallel(lambda item: upload(item[1]),
+                                   enumerate(file_paths), workers):
+            if result.error is None:
+                uploads[result.item[0]] = result.result
+            else:
+                error = error or result.error
+        try:
+            if error is not None:
+                raise MFilesException("Upload of files failed: %s" % error) \
+                    from error
+            file_info = [upload_file_info(path, uploads[index])
+                         for index, path in enumerate(file_paths)]
+            return self.create_object(name or splitext(file_paths[0])[0],
+                                      object_type, object_class, extra_info,
+                                      file_info)
+        except (MFilesException, requests.RequestException):
+            for upload_info in uploads.values():
+                self.delete_temporary_file(upload_info["UploadID"])
+            raise
+
+    def download_many(self, items, directory=None, workers=DEFAULT_WORKERS,
+                      verify="size", manifest_path=None):
+        """Download many files from M-Files in parallel.
+
+        Files are streamed to a ``.part`` file next to the target path and
+        renamed when complete, interrupted downloads of the same file version
+        are resumed. Files
+        already present locally are skipped, so reruns only fetch what is
+        missing or changed. Files of search results are downloaded to
+        ``<directory>/<object type>/<object ID>/<file name>``. When several
+        files have the same local path only the first is downloaded, the
+        others fail.
+
+        Parameters:
+            items (iterable, dict): Items on form ``(object_type, object_id,
+                                    file_id, version, local_path)``, or a
+                                    search result (or list of its
+                                    ``Items``) in which case all files of
+                                    all objects are downloaded.
+            directory (str): Directory to download search result files to.
+                             Defaults to current directory.
+            workers (int): Number of worker threads. Defaults to 8.
+            verify (str): How to detect files already present. ``"size"``
+                          compares file sizes, ``"checksum"`` compares
+                          SHA-256 checksums with the previous manifest.
+                          Either way a file recorded in the previous
+                          manifest at another version is downloaded.
+            manifest_path (str): Optional path to a JSON manifest. Entries
+                                 from a previous run are used to skip files
+                                 and the manifest is rewritten afterwards.
+
+        Returns:
+            list: Manifest with one dict per file with keys ``path``,
+            ``object_type``, ``object_id``, ``file_id``, ``version``,
+            ``size``, ``sha256``, ``status`` (``"downloaded"``,
+            ``"skipped"`` or ``"failed"``) and ``error``.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        previous = {}
+        if manifest_path and isfile(manifest_path):
+            with open(manifest_path, encoding="utf-8") as file_stream:
+                previous = {entry["path"]: entry
+                            for entry in json.load(file_stream)}
+        claimed = set()
+        def claim(tasks):
+            for task in tasks:
+                if task["path"] in claimed:
+                    task["duplicate"] = True
+                claimed.add(task["path"])
+                yield task
+        def download(task):
+            if task.pop("duplicate", False):
+                raise MFilesException("Another file is downloaded to %s" %
+                                      task["path"])
+            entry = previous.get(task["path"])
+            if is_present(task, entry, verify):
+                task.update(status="skipped", size=getsize(task["path"]),
+                            sha256=entry.get("sha256") if entry else None)
+                return task
+            if dirname(task["path"]):
+                makedirs(dirname(task["path"]), exist_ok=True)
+            part_path, resume = part_file(task)
+            checksum = hashlib.sha256()
+            self.download_file(part_path, task["object_type"],
+                               task["object_id"], task["file_id"],
+                               task["version"], resume=resume,
+                               checksum=checksum)
+            replace(part_path, task["path"])
+            task.update(status="downloaded", size=getsize(task["path"]),
+                        sha256=checksum.hexdigest())
+            return task
+        manifest = []
+        for result in run_parallel(self.threaded(download),
+                                   claim(download_tasks(items, directory)),
+                                   workers):
+            entry = result.result or dict(result.item, status="failed",
+                                          sha256=None)
+            entry["error"] = str(result.error) if result.error else None
+            manifest.append(entry)
+        if manifest_path:
+            with open(manifest_path, mode="w", encoding="utf-8") as file_stream:
+                json.dump(manifest, file_stream, indent=2)
+        return manifest
+
+    def delete_many(self, items, object_type=0, **options):
+        """Delete many M-Files objects in parallel.
+
+        Parameters:
+            items (iterable, dict): Object IDs, ``(object_type, object_id)``
+                                    pairs or search results, e.g. from
+                                    ``iter_search()``. Read completely
+                                    before the first object is removed,
+                                    so removals can't shift the pages of
+                                    a search still being read.
+            object_type (int): Object type of plain object IDs.
+            workers (int): Number of worker threads. Defaults to 8.
+            rate (float): Maximum requests per second. Defaults to no limit.
+            dry_run (bool): Only report what would be removed.
+            progress (callable): Optional callback called as
+                                 ``progress(done, failed)`` after each
+                                 object.
+            checkpoint_path (str): Optional path of a checkpoint file.
+                                   Objects recorded by an earlier run are
+                                   skipped and removed objects are recorded.
+
+        Returns:
+            list: Report with one dict per object with keys
+            ``object_type``, ``object_id``, ``status`` (``"deleted"``,
+            ``"dry run"`` or ``"failed"``) and ``error``.
+        """
+        return self._remove_many(self.delete_object, "deleted", items,
+                                 object_type, **options)
+
+    def destroy_many(self, items, object_type=0, **options):
+        """Destroy many M-Files objects in parallel.
+
+        Caution:
+            Destroying an object means unrecoverably deleting all
+            versions of the object. Use ``dry_run=True`` first.
+
+        Takes the same parameters as ``delete_many()``, removed objects are
+        reported with status ``"destroyed"``.
+        """
+        return self._remove_many(self.destroy_object, "destroyed", items,
+                                 object_type, **options)
+
+    def _remove_many(self, remove, status, items, object_type=0,
+                     workers=DEFAULT_WORKERS, rate=None, dry_run=False,
+                     progress=None, checkpoint_path=None):
+        """Delete or destroy many objects, see ``delete_many()``.
+
+        Parameters:
+            remove (callable): ``delete_object`` or ``destroy_object``.
+            status (str): Status reported for removed objects.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # pylint: disable=too-many-locals
+        limiter = RateLimiter(rate) if rate else None
+        checkpoint = Checkpoint(checkpoint_path) if checkpoint_path and \
+            not dry_run else None
+        # Removing objects while paging a search would shift its pages
+        keys = [key for key in _object_keys(items, object_type)
+                if checkpoint is None or "%s/%s" % key not in checkpoint]
+        def run(key):
+            if dry_run:
+                return "dry run"
+            if limiter is not None:
+                limiter.acquire()
+            remove(*key)
+            if checkpoint is not None:
+                checkpoint.add("%s/%s" % key)
+            return status
+        report = []
+        failed = 0
+        try:
+            for result in run_parallel(self.threaded(run), keys, workers):
+                failed += result.error is not None
+                report.append({"object_type": result.item[0],
+                               "object_id": result.item[1],
+                               "status": result.result or "failed",
+                               "error": str(result.error) if result.error
+                                        else None})
+                if progress is not None:
+                    progress(len(report), failed)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        return report
@@ -0,0 +1,438 @@
+"""M-Files metadata caches.
+
+Vault structure (object types, classes and property definitions) changes
+rarely but is needed for every object created, so it is cached locally and
+indexed by name and by ID. Value list items are indexed by name so lookup
+properties can be resolved without downloading the list every time.
+"""
+
+# Standard modules
+from collections import OrderedDict
+import json
+import os
+from os.path import basename, dirname
+from tempfile import mkstemp
+from threading import Lock, RLock
+import time
+
+# Internal modules
+from mfiles.errors import MFilesException
+from mfiles.paging import iter_pages
+
+# Default time in seconds before cached structure is fetched again
+DEFAULT_TTL = 300
+
+# Default number of value list items fetched per request
+DEFAULT_PAGE_SIZE = 1000
+
+# Default number of value lists kept in the value list index
+DEFAULT_MAX_LISTS = 32
+
+def found(type_info, message, key):
+    """Get a structure lookup result, raising if nothing was found.
+
+    Parameters:
+        type_info (dict): Result of ``StructureCache.by_name()`` or
+                          ``StructureCache.by_id()``.
+        message (str): Error message, formatted with ``key``.
+        key (any): Name or ID that was looked up.
+
+    Raises:
+        MFilesException: If ``type_info`` is ``None``.
+
+    Returns:
+        dict: ``type_info``.
+    """
+    if type_info is None:
+        raise MFilesException(message % key)
+    return type_info
+
+class StructureCache():
+    """Cache of vault structure indexed by name and by ID.
+
+    Parameters:
+        fetch (callable): Function that takes a category (``"object"``,
+                          ``"class"`` or ``"property"``) and returns a list
+                          of dicts with information about the types.
+                          ``None`` if the caller fills the cache with
+                          ``update()``, stored types are then used even if
+                          expired.
+        ttl (float): Seconds before a category is fetched again. ``None``
+                     keeps entries until invalidated. Defaults to 300.
+        snapshot_path (str): Optional path to a JSON snapshot. If it exists
+                             it is loaded on first use, so a new process
+                             starts warm.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    CATEGORIES = ("object", "class", "property")
+
+    def __init__(self, fetch, ttl=DEFAULT_TTL, snapshot_path=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.scope = None
+        self._lock = RLock()
+        self._entries = {}
+        self._fetch_locks = {}
+        self._snapshot_loaded = False
+
+    def set_scope(self, *scope):
+        """Set the scope (e.g. server and vault) the cache belongs to.
+
+        Changing scope drops all cached entries.
+        """
+        scope = list(scope)
+        with self._lock:
+            if scope != self.scope:
+                self._entries = {}
+                self._snapshot_loaded = False
+            self.scope = scope
+
+    def invalidate(self, category=None):
+        """Drop cached entries for ``category``, or all if not given."""
+        with self._lock:
+            if category is None:
+                self._entries = {}
+            else:
+                self._entries.pop(category, None)
+
+    def refresh(self, category=None):
+        """Fetch ``category``, or all categories if not given, again."""
+        categories = [category] if category else self.CATEGORIES
+        for cat in categories:
+            self._store(cat, self._fetch(cat), time.time())
+
+    def fresh(self, category):
+        """Check if ``category`` is cached and not expired."""
+        return self._cached(category) is not None
+
+    def update(self, category, types):
+        """Store ``types`` fetched by the caller as ``category``."""
+        self._store(category, types, time.time())
+        self._save_snapshot()
+
+    def types(self, category):
+        """Get list of all types in ``category``."""
+        return self._entry(category)["types"]
+
+    def by_name(self, category, name):
+        """Get type info by name, ``None`` if not found."""
+        return self._entry(category)["names"].get(name)
+
+    def by_id(self, category, type_id):
+        """Get type info by ID, ``None`` if not found."""
+        return self._entry(category)["ids"].get(type_id)
+
+    def save(self, path=None):
+        """Write cached structure to a JSON snapshot.
+
+        The file is replaced atomically, so concurrent writers and readers
+        never see a partial snapshot.
+
+        Parameters:
+            path (str): Snapshot path. Defaults to ``snapshot_path``.
+        """
+        path = path or self.snapshot_path
+        with self._lock:
+            snapshot = {
+                "scope": self.scope,
+                "categories": {cat: {"time": entry["time"],
+                                     "types": entry["types"]}
+                               for cat, entry in self._entries.items()}
+            }
+        handle, temporary = mkstemp(prefix="." + basename(path) + "-",
+                                    dir=dirname(path) or ".")
+        try:
+            with os.fdopen(handle, mode="w", encoding="utf-8") as file_stream:
+                json.dump(snapshot, file_stream)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def load(self, path=None):
+        """Load cached structure from a JSON snapshot.
+
+        Snapshots from another scope are ignored and expired categories are
+        not loaded.
+
+        Parameters:
+            path (str): Snapshot path. Defaults to ``snapshot_path``.
+
+        Returns:
+            bool: True if the snapshot was loaded.
+        """
+        path = path or self.snapshot_path
+        try:
+            with open(path, encoding="utf-8") as file_stream:
+                snapshot = json.load(file_stream)
+        except (OSError, ValueError):
+            return False
+        if snapshot.get("scope") != self.scope:
+            return False
+        for cat, entry in snapshot.get("categories", {}).items():
+            if not self._expired(entry["time"]):
+                self._store(cat, entry["types"], entry["time"])
+        return True
+
+    def _fetch(self, category):
+        if category not in self.CATEGORIES:
+            raise MFilesException("Type name %s not recognized" % category)
+        return self.fetch(category)
+
+    def _expired(self, timestamp):
+        return self.ttl is not None and time.time() - timestamp > self.ttl
+
+    def _store(self, category, types, timestamp):
+        names = {}
+        ids = {}
+        for type_info in types:
+            # First match wins, as for a linear scan
+            names.setdefault(type_info["Name"], type_info)
+            ids.setdefault(type_info["ID"], type_info)
+        entry = {"time": timestamp, "types": types, "names": names, "ids": ids}
+        with self._lock:
+            self._entries[category] = entry
+        return entry
+
+    def _load_snapshot(self):
+        if not self._snapshot_loaded and self.snapshot_path:
+            self._snapshot_loaded = True
+            self.load()
+
+    def _fetch_lock(self, category):
+        """Get the lock serializing fetches of ``category``."""
+        with self._lock:
+            return self._fetch_locks.setdefault(category, Lock())
+
+    def _save_snapshot(self):
+        if self.snapshot_path:
+            try:
+                self.save()
+            except OSError:
+                # The snapshot only warms up later processes
+                pass
+
+    def _cached(self, category):
+        """Get the entry of ``category``, ``None`` if missing or expired."""
+        with self._lock:
+            self._load_snapshot()
+            entry = self._entries.get(category)
+        if entry is None or self._expired(entry["time"]):
+            return None
+        return entry
+
+    def _entry(self, category):
+        entry = self._cached(category)
+        if entry is None and self.fetch is None:
+            with self._lock:
+                entry = self._entries.get(category)
+            if entry is None:
+                raise MFilesException("Type name %s not cached" % category)
+        if entry is None:
+            with self._fetch_lock(category):
+                # Another thread may have fetched the category meanwhile
+                entry = self._cached(category)
+                if entry is None:
+                    entry = self._store(category, self._fetch(category),
+                                        time.time())
+                    self._save_snapshot()
+        return entry
+
+
+class ValueListIndex():
+    """Index of value list items keyed on name and owner.
+
+    Each list is downloaded once, page by page, and indexed by item name.
+    Threads missing the same list wait for one download instead of each
+    fetching it.
+    Lookups that miss in an already indexed list fetch only the items
+    matching the name, so items added to the list after it was indexed are
+    still found without downloading the whole list again. The least recently
+    used lists are evicted when more than ``max_lists`` lists are indexed.
+
+    Parameters:
+        fetch (callable): Function taking ``list_id``, ``page``, ``limit``
+                          and ``name_filter`` keyword arguments and returning
+                          a dict, or an ``ItemStream``, with ``Items`` and
+                          optionally ``MoreResults``.
+        page_size (int): Items fetched per request. Defaults to 1000.
+        max_lists (int): Maximum number of indexed lists. Defaults to 32.
+        ttl (float): Seconds before a list is indexed again. ``None`` keeps
+                     lists until invalidated. Defaults to 300.
+
+    Attributes:
+        hits (int): Number of lookups answered from the index.
+        misses (int): Number of lookups that needed a server request.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, fetch, page_size=DEFAULT_PAGE_SIZE,
+                 max_lists=DEFAULT_MAX_LISTS, ttl=DEFAULT_TTL):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.max_lists = max_lists
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.scope = None
+        self._lock = RLock()
+        self._lists = OrderedDict()
+        self._list_locks = {}
+
+    def set_scope(self, *scope):
+        """Set the scope (e.g. server and vault) the index belongs to.
+
+        Changing scope drops all indexed lists.
+        """
+        scope = list(scope)
+        with self._lock:
+            if scope != self.scope:
+                self._lists.clear()
+            self.scope = scope
+
+    def invalidate(self, list_id=None):
+        """Drop the index for ``list_id``, or all lists if not given."""
+        with self._lock:
+            if list_id is None:
+                self._lists.clear()
+            else:
+                self._lists.pop(list_id, None)
+
+    def stats(self):
+        """Get index statistics.
+
+        Returns:
+            dict: Dictionary with keys ``hits``, ``misses`` and ``lists``.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "lists": len(self._lists)}
+
+    def items(self, list_id):
+        """Get all items in a value list.
+
+        Returns:
+            list: List of dicts with item information.
+        """
+        entry = self._entry(list_id)
+        return [item for items in entry["names"].values() for item in items]
+
+    def fresh(self, list_id):
+        """Check if ``list_id`` is indexed and not expired."""
+        with self._lock:
+            entry = self._lists.get(list_id)
+        return entry is not None and not self._expired(entry)
+
+    def update(self, list_id, items, merge=False):
+        """Index ``items`` fetched by the caller for ``list_id``.
+
+        Parameters:
+            list_id (int): ID of the value list.
+            items (iterable): Value list items.
+            merge (bool): If True the items are added to the indexed list,
+                          otherwise they replace it.
+        """
+        with self._lock:
+            entry = self._lists.get(list_id) if merge else None
+        if entry is None:
+            entry = {"time": time.time(), "names": {}}
+        for item in items:
+            self._add(entry, item)
+        with self._lock:
+            self._lists[list_id] = entry
+            self._lists.move_to_end(list_id)
+            while len(self._lists) > self.max_lists:
+                self._lists.popitem(last=False)
+
+    def find(self, list_id, value_name, owner_ids):
+        """Get an item from the index without any server requests.
+
+        Found items count as hits.
+
+        Returns:
+            dict: Item information, ``None`` if not indexed.
+        """
+        return self._find(list_id, value_name, owner_ids, True)
+
+    def lookup(self, list_id, value_name, owner_ids):
+        """Get the value list item matching a name and owner.
+
+        Parameters:
+            list_id (int): ID of the list to look in.
+            value_name (str): Name of the item to look for.
+            owner_ids (list): IDs of potential list owners.
+
+        Returns:
+            dict: Item information, ``None`` if not found.
+        """
+        if self.fresh(list_id):
+            item = self.find(list_id, value_name, owner_ids)
+            if item is not None:
+                return item
+        with self._list_lock(list_id):
+            if self.fresh(list_id):
+                # Another thread may have fetched the item meanwhile
+                item = self.find(list_id, value_name, owner_ids)
+                if item is not None:
+                    return item
+                # Item may have been added after the list was indexed
+                self.count_miss()
+                self.update(list_id, self._fetch_all(list_id, value_name),
+                            merge=True)
+            else:
+                self.count_miss()
+                self.update(list_id, self._fetch_all(list_id))
+        return self._find(list_id, value_name, owner_ids, False)
+
+    def _list_lock(self, list_id):
+        """Get the lock serializing downloads of ``list_id``."""
+        with self._lock:
+            return self._list_locks.setdefault(list_id, Lock())
+
+    def count_miss(self):
+        """Count a lookup that needed a server request."""
+        with self._lock:
+            self.misses += 1
+
+    def _find(self, list_id, value_name, owner_ids, count_hit):
+        with self._lock:
+            entry = self._lists.get(list_id)
+        if entry is None:
+            return None
+        item = self._match(entry, value_name, owner_ids)
+        if item is not None:
+            with self._lock:
+                self.hits += count_hit
+                if list_id in self._lists:
+                    self._lists.move_to_end(list_id)
+        return item
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry["time"] > self.ttl
+
+    @staticmethod
+    def _match(entry, value_name, owner_ids):
+        for item in entry["names"].get(value_name, ()):
+            if not item.get("HasOwner") or item.get("OwnerID") in owner_ids:
+                return item
+        return None
+
+    def _add(self, entry, item):
+        with self._lock:
+            items = entry["names"].setdefault(item["Name"], [])
+            if all(known["ID"] != item["ID"] for known in items):
+                items.append(item)
+
+    def _fetch_all(self, list_id, name_filter=None):
+        return iter_pages(lambda page: self.fetch(
+            list_id=list_id, page=page, limit=self.page_size,
+            name_filter=name_filter))
+
+    def _entry(self, list_id):
+        with self._list_lock(list_id):
+            if not self.fresh(list_id):
+                self.update(list_id, self._fetch_all(list_id))
+        with self._lock:
+            return self._lists[list_id]
@@ -5,25 +5,46 @@ https://developer.m-files.com/APIs/REST-API/Reference
 """
 
 # Standard modules
-from copy import deepcopy
 from getpass import getpass
+import hashlib
 import json
-from os import getcwd, getenv
-from os.path import splitext
+import time
+from os import getenv
+from threading import Lock, local
 
 # External modules
 import requests
+from requests.adapters import HTTPAdapter
 
 # Internal modules
-from mfiles.definitions import DATATYPE, LOOKUP_DATATYPE, LOOKUP_DATATYPES, \
-    OBJ, OBJ_PROPERTY
+from mfiles.bulk import BulkMixin
+from mfiles.cache import DEFAULT_PAGE_SIZE, DEFAULT_TTL, StructureCache, \
+    ValueListIndex, found
+from mfiles.definitions import DEFAULT_URL, LOOKUP_DATATYPES
 from mfiles.errors import MFilesException
+from mfiles.http_cache import is_immutable
+from mfiles.metrics import RequestEvent, body_size, data_size, \
+    endpoint_template
+from mfiles.paging import iter_pages, value_list_endpoint
+from mfiles.properties import PropertyResolver, build_property
+from mfiles.records import ObjectVersionBatch
+from mfiles.retry import AUTH_STATUSES, RequestAttempts, RetryPolicy, \
+    connect_failed, session_expired
+from mfiles.streaming import STREAM_CHUNK_SIZE, ItemStream
+from mfiles.token_cache import cached_token
+from mfiles.transfer import FileTransferMixin
+
+# Default maximum number of connections kept open per host
+DEFAULT_POOL_SIZE = 10
+
+class MFilesClient(FileTransferMixin, BulkMixin):
+    """M-Files client.
 
-# M-files server info
-DEFAULT_URL = "http://localhost/m-files/REST/"
+    Constructing a client makes no requests. The user is logged in on the
+    first request, or by calling ``login()``.
 
-class MFilesClient():
-    """M-Files client.
+    File methods come from ``mfiles.transfer.FileTransferMixin`` and bulk
+    methods from ``mfiles.bulk.BulkMixin``.
 
     Parameters:
         server (str): API URL. Defaults to ``"http://localhost/m-files/REST/"``
@@ -34,40 +55,202 @@ class MFilesClient():
                         fetched from environment variable ``MFILES_PASS``,
                         if not set it will be fetched using ``getpass()``.
         vault (str): M-Files vault GUID to connect to.
+        structure_ttl (float): Seconds before cached vault structure (object
+                               types, classes and properties) is fetched
+                               again. ``None`` caches until invalidated.
+                               Defaults to 300.
+        structure_snapshot (str): Optional path to a JSON snapshot of the
+                                  vault structure, used to start warm.
+        retry_policy (RetryPolicy): Policy for retrying failed requests.
+                                    Defaults to ``RetryPolicy()``, use
+                                    ``mfiles.retry.NO_RETRY`` to disable.
+        response_cache (ResponseCache): Optional cache of ``get()``
+                                        responses, revalidated with
+                                        conditional requests. See
+                                        ``mfiles.http_cache``.
+        file_cache (FileCache): Optional local cache of downloaded files of
+                                specific object versions. See
+                                ``mfiles.file_cache``.
+        pool_size (int): Maximum number of connections kept alive per host.
+                         Set it to the number of threads using the client.
+                         Defaults to 10.
+        thread_safe (bool): Give every thread its own session, sharing one
+                            connection pool, so the client can be used from
+                            many threads at once. Defaults to False. Threads
+                            started by the client itself, e.g. by bulk
+                            operations, always have their own sessions.
+        token (str): Authentication token to use instead of logging in, e.g.
+                     one shared by another process.
+        token_cache (TokenCache): Optional store of authentication tokens
+                                  shared between processes, see
+                                  ``mfiles.token_cache``.
+        adapter (HTTPAdapter): Connection pool to use, e.g. one shared with
+                               other clients of the same server. Defaults to
+                               a new pool of ``pool_size`` connections.
+        stream_items (bool): Decode the ``Items`` of value list and search
+                             responses one at a time as they arrive, see
+                             ``get_items()``. Defaults to False.
+
+    Note:
+        Renewal of an expired authentication token is always serialized:
+        one thread logs in again while the others wait and then reuse the
+        new token. Tokens are only renewed with stored credentials, the
+        user is never prompted when a token is rejected.
+
+    Attributes:
+        structure (StructureCache): Cache of the vault structure. Use
+                                    ``structure.refresh()`` or
+                                    ``structure.invalidate()`` after changing
+                                    the vault structure.
+        value_list_index (ValueListIndex): Index of value list items used by
+                                           ``get_value_id()``.
+        metrics_sinks (list): Callables receiving request metrics, see
+                              ``add_metrics_sink()``.
+        property_resolver (PropertyResolver): Resolves property values for
+                                              ``create_object()``, use
+                                              ``resolve_many()`` to resolve
+                                              a batch of objects at once.
+        adapter (HTTPAdapter): Connection pool shared by all sessions.
     """
-    # pylint: disable=too-many-public-methods
+    # pylint: disable=too-many-public-methods,too-many-instance-attributes
 
-    def __init__(self, server=DEFAULT_URL, user=None, password=None, vault=None):
+    def __init__(self, server=DEFAULT_URL, user=None, password=None, vault=None,
+                 structure_ttl=DEFAULT_TTL, structure_snapshot=None,
+                 retry_policy=None, response_cache=None, file_cache=None,
+                 pool_size=DEFAULT_POOL_SIZE, thread_safe=False, token=None,
+                 token_cache=None, adapter=None, stream_items=False):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # pylint: disable=too-many-locals
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.response_cache = response_cache
+        self.file_cache = file_cache
+        self.stream_items = stream_items
+        self.metrics_sinks = []
         self.user = user
         self.password = password
         self.vault = vault
         self.server = ""
-        self.headers = {"X-Authentication": ""}
+        self.headers = {"X-Authentication": token or ""}
+        self.token_cache = token_cache
+        self.structure = StructureCache(self._fetch_types, structure_ttl,
+                                        structure_snapshot)
+        self.value_list_index = ValueListIndex(self.value_list_items,
+                                               ttl=structure_ttl)
+        self.property_resolver = PropertyResolver(self)
         # need before set_server
-        self.session = requests.Session()
-        self.set_server(server)
+        self.adapter = adapter or HTTPAdapter(pool_connections=pool_size,
+                                              pool_maxsize=pool_size)
+        self.thread_safe = thread_safe
+        self._local = local()
+        self._session = self._new_session()
+        self._auth_lock = Lock()
+        if server[-1] != "/":
+            server += "/"
+        self._configure(server=server)
+
+    def _new_session(self):
+        """Create a session using the shared connection pool."""
+        session = requests.Session()
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        return session
+
+    @property
+    def session(self):
+        """Session of the current thread.
+
+        Without thread safe mode all threads share one session, except
+        threads running functions wrapped by ``threaded()``.
+        """
+        if not self.thread_safe and not getattr(self._local, "threaded",
+                                                False):
+            return self._session
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._new_session()
+        return session
+
+    def threaded(self, func):
+        """Wrap a function run in threads to give each thread its own session.
+
+        Every function the library runs in threads of its own is wrapped, so
+        those threads never share a session, whatever ``thread_safe`` is set
+        to.
+
+        Parameters:
+            func (callable): Function making requests with this client.
+
+        Returns:
+            callable: Function taking the same arguments.
+        """
+        def run(*args, **kwargs):
+            threaded = getattr(self._local, "threaded", False)
+            self._local.threaded = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.threaded = threaded
+        return run
 
     def set_server(self, server):
-        """Set the M-Files server API URL."""
+        """Set the M-Files server API URL, logs in on the next request."""
         if server[-1] != "/":
             server += "/"
         self.server = server
-        self.login()
+        self._logout()
 
     def set_user(self, user):
-        """Set the M-Files user."""
+        """Set the M-Files user, logs in on the next request."""
         self.user = user
-        self.login()
+        self._logout()
 
     def set_password(self, password):
-        """Set the M-Files user password."""
+        """Set the M-Files user password, logs in on the next request."""
         self.password = password
-        self.login()
+        self._logout()
 
     def set_vault(self, vault):
-        """Set the M-Files vault GUID to connect to."""
+        """Set the M-Files vault GUID, logs in on the next request."""
         self.vault = vault
-        self.login()
+        self._logout()
+
+    def _logout(self):
+        """Drop the authentication token after a change of settings."""
+        self._configure()
+        self.headers = {"X-Authentication": ""}
+
+    def _configure(self, server=None, user=None, password=None, vault=None):
+        """Apply settings, falling back to environment variables."""
+        self.server = server or self.server or getenv("MFILES_URL")
+        self.user = user or self.user or getenv("MFILES_USER")
+        self.password = password or self.password or getenv("MFILES_PASS")
+        self.vault = vault or self.vault or getenv("MFILES_VAULT")
+        self.structure.set_scope(self.server, self.vault)
+        self.value_list_index.set_scope(self.server, self.vault)
+
+    def _ensure_login(self):
+        """Log in unless there is a token, reusing a cached token first."""
+        if self.headers["X-Authentication"]:
+            return
+        with self._auth_lock:
+            if self.headers["X-Authentication"]:
+                return
+            token = cached_token(self)
+            if not token:
+                self.login()
+                return
+            self.headers = {"X-Authentication": token}
+
+    def _identity(self):
+        """Get the authenticated identity cached responses are scoped to.
+
+        The user if known, otherwise a hash of the authentication token the
+        client was given.
+        """
+        if self.user:
+            return self.user
+        token = self.headers["X-Authentication"] or ""
+        return "token:" + hashlib.sha256(token.encode()).hexdigest()
 
     def login(self, server=None, user=None, password=None, vault=None):
         """Logs in the user to M-Files.
@@ -84,30 +267,161 @@ class MFilesClient():
                             fetched from environment variable ``MFILES_PASS``,
                             if not set it will be fetched using ``getpass()``.
             vault (str): M-Files vault GUID to connect to.
+
+        Raises:
+            MFilesException: If the credentials are rejected.
+        """
+        self._configure(server, user, password, vault)
+        self.user = self.user or input("M-Files mail: ")
+        self.password = self.password or getpass("M-Files password: ")
+        if self.has_credentials():
+            self._authenticate()
+
+    def has_credentials(self):
+        """Check if the client can log in without prompting for anything."""
+        return all([self.server, self.user, self.password, self.vault])
+
+    def _authenticate(self):
+        """Get a new authentication token with the stored credentials.
+
+        Raises:
+            MFilesException: If the credentials are rejected.
         """
-        env_server = getenv("MFILES_URL")
-        env_user = getenv("MFILES_USER")
-        env_pass = getenv("MFILES_PASS")
-        env_vault = getenv("MFILES_VAULT")
-        programmatic_user = user or self.user or env_user
-        programmatic_pass = password or self.password or env_pass
-        self.server = server or self.server or env_server
-        self.user = programmatic_user or input("M-Files mail: ")
-        self.password = programmatic_pass or getpass("M-Files password: ")
-        self.vault = vault or self.vault or env_vault
-        if not all([self.server, self.user, self.password, self.vault]):
-            return
         auth = json.dumps({"Username": self.user,
                            "Password": self.password,
                            "VaultGuid": self.vault})
         request_url = self.server + "server/authenticationtokens"
         response = self.session.post(request_url, data=auth)
+        if response.status_code != 200:
+            raise MFilesException(response.text)
         auth_token = json.loads(response.text)["Value"]
         self.headers = {"X-Authentication": auth_token}
+        if self.token_cache is not None:
+            self.token_cache.put(self.server, self.vault, self.user,
+                                 auth_token)
+
+    def renew_token(self, auth_headers=None):
+        """Log in again with the stored credentials, never prompting.
+
+        Renewal is serialized with the renewal of rejected tokens by
+        requests of other threads.
+
+        Parameters:
+            auth_headers (dict): Headers holding the rejected token. Nothing
+                                 is done if another thread has already
+                                 replaced them. Defaults to always renewing.
+
+        Raises:
+            MFilesException: If the credentials are rejected.
+
+        Returns:
+            bool: True if the token was renewed, by this or another thread.
+        """
+        if not self.has_credentials():
+            return False
+        with self._auth_lock:
+            if auth_headers is None or self.headers is auth_headers:
+                self._authenticate()
+        return True
+
+    def _request(self, method, request_url, data=None, headers=None,
+                 stream=False, cached=False):
+        """Send a request to the server.
+
+        Transient failures are retried according to ``retry_policy`` and an
+        invalid or expired authentication token is renewed once, if the
+        client has stored credentials. Requests with a streamed body can't
+        be sent again and are never retried, a rejected token is still
+        renewed for the next request.
+
+        Parameters:
+            method (str): HTTP method. ``"PUT"`` is sent as a POST request,
+                          the URL must contain ``_method=PUT``.
+            request_url (str): Full request URL.
+            data (any): Request body.
+            headers (dict): Headers in addition to authentication.
+            stream (bool): Stream the response body.
+            cached (bool): The response is cacheable, a ``304`` response is
+                           reported as a cache hit and others as misses.
+
+        Returns:
+            requests.Response: The final response, whatever its status.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # pylint: disable=too-many-locals
+        self._ensure_login()
+        http_method = "POST" if method == "PUT" else method
+        attempts = RequestAttempts(self.retry_policy, method, data)
+        while True:
+            auth_headers = self.headers
+            try:
+                response = self.session.request(
+                    http_method, request_url, data=data, stream=stream,
+                    headers=dict(auth_headers, **(headers or {})))
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if not attempts.should_retry(
+                        connect_error=connect_failed(error)):
+                    self._emit_metrics(method, request_url, None, data,
+                                       attempts)
+                    raise
+                time.sleep(attempts.next_delay())
+                continue
+            status = response.status_code
+            if status in AUTH_STATUSES and not attempts.renewed and \
+                    session_expired(status, response.content):
+                # Token has expired, log in again once
+                attempts.renewed = True
+                if self.renew_token(auth_headers) and attempts.replayable:
+                    response.close()
+                    continue
+            if status >= 400 and attempts.should_retry(status):
+                response.close()
+                time.sleep(attempts.next_delay())
+                continue
+            attempts.done(status)
+            self._emit_metrics(
+                method, request_url, response, data, attempts,
+                ("hit" if status == 304 else "miss") if cached else None)
+            return response
+
+    def add_metrics_sink(self, sink):
+        """Report metrics of every request to ``sink``.
+
+        Parameters:
+            sink (callable): Called with a ``mfiles.metrics.RequestEvent``
+                             after each request.
+        """
+        self.metrics_sinks.append(sink)
+
+    def remove_metrics_sink(self, sink):
+        """Stop reporting metrics to ``sink``."""
+        self.metrics_sinks.remove(sink)
+
+    def _emit_metrics(self, method, request_url, response, data, attempts,
+                      cache=None):
+        """Report a request to all metrics sinks."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        if not self.metrics_sinks:
+            return
+        event = RequestEvent(
+            method=method,
+            endpoint=endpoint_template(request_url[len(self.server):]),
+            status=response.status_code if response is not None else None,
+            bytes_in=body_size(response),
+            bytes_out=data_size(data),
+            latency=time.perf_counter() - attempts.started,
+            retries=attempts.count,
+            cache=cache)
+        for sink in self.metrics_sinks:
+            sink(event)
 
     def get(self, endpoint):
         """General purpose GET method.
 
+        With a ``response_cache`` cached responses are revalidated with
+        ``If-None-Match`` and ``If-Modified-Since``, and a checked in object
+        version is returned without any request.
+
         Parameters:
             endpoint (str): Endpoint on form ``"path/to/endpoint"``.
 
@@ -120,11 +434,63 @@ class MFilesClient():
         if endpoint[0] == "/":
             endpoint = endpoint[1:]
         request_url = self.server + endpoint
-        response = self.session.get(request_url, headers=self.headers)
+        cache = self.response_cache
+        if cache is None:
+            response = self._request("GET", request_url)
+            if response.status_code != 200:
+                raise MFilesException(response.text)
+            return response.json()
+        self._ensure_login()
+        key = cache.key((self.server, self.vault, self._identity()), endpoint)
+        entry = cache.get(key)
+        if entry is not None and entry.immutable:
+            # Checked in object versions never change
+            if self.metrics_sinks:
+                event = RequestEvent("GET", endpoint_template(endpoint), 200,
+                                     len(entry.body), 0, 0.0, 0, "hit")
+                for sink in self.metrics_sinks:
+                    sink(event)
+            return json.loads(entry.body)
+        response = self._request("GET", request_url, cached=True,
+                                 headers=entry.validators() if entry else None)
+        if response.status_code == 304 and entry is not None:
+            return json.loads(entry.body)
         if response.status_code != 200:
             raise MFilesException(response.text)
+        immutable = is_immutable(endpoint, response.content)
+        if immutable or cache.cacheable(response.headers):
+            cache.put(key, response.content, response.headers.get("ETag"),
+                      response.headers.get("Last-Modified"), immutable)
         return response.json()
 
+    def get_items(self, endpoint):
+        """GET method decoding the ``Items`` of the response incrementally.
+
+        Items are decoded one at a time while the response is read, so
+        memory use does not depend on the number of items and a caller can
+        stop early. Responses are not cached.
+
+        Parameters:
+            endpoint (str): Endpoint on form ``"path/to/endpoint"``.
+
+        Raises:
+            MFilesException: If request returns status code != 200.
+
+        Returns:
+            ItemStream: Read-once view of the result, iterate
+            ``result.get("Items")`` before reading other fields.
+        """
+        if endpoint[0] == "/":
+            endpoint = endpoint[1:]
+        request_url = self.server + endpoint
+        response = self._request("GET", request_url, stream=True)
+        if response.status_code != 200:
+            text = response.text
+            response.close()
+            raise MFilesException(text)
+        return ItemStream(response.iter_content(STREAM_CHUNK_SIZE),
+                          close=response.close)
+
     def put(self, endpoint, data=None):
         """General purpose PUT method.
 
@@ -141,7 +507,7 @@ class MFilesClient():
         if endpoint[0] == "/":
             endpoint = endpoint[1:]
         request_url = self.server + endpoint + "?_method=PUT"
-        response = self.session.post(request_url, headers=self.headers, data=data)
+        response = self._request("PUT", request_url, data)
         if response.status_code != 200:
             raise MFilesException(response.text)
         return response.json()
@@ -162,7 +528,7 @@ class MFilesClient():
         if endpoint[0] == "/":
             endpoint = endpoint[1:]
         request_url = self.server + endpoint
-        response = self.session.post(request_url, headers=self.headers, data=data)
+        response = self._request("POST", request_url, data)
         if response.status_code != 200:
             raise MFilesException(response.text)
         return response.json()
@@ -194,6 +560,78 @@ class MFilesClient():
         search_query = "objects?" + query
         return self.get(search_query)
 
+    def iter_quick_search(self, query, page_size=DEFAULT_PAGE_SIZE,
+                          prefetch=False, stream=None):
+        """Perform a quick search and lazily yield matching items.
+
+        See ``iter_search()``.
+
+        Parameters:
+            query (str): Search query.
+            page_size (int): Items fetched per request. Defaults to 1000.
+            prefetch (bool): Fetch the next page in a background thread.
+            stream (bool): Decode items one at a time. Defaults to
+                           ``stream_items``.
+
+        Yields:
+            dict: Matching items.
+        """
+        yield from self._iter_pages("objects?q=" + query, page_size, prefetch,
+                                    stream)
+
+    def iter_search(self, query, page_size=DEFAULT_PAGE_SIZE, prefetch=False,
+                    stream=None):
+        """Perform a search and lazily yield matching items.
+
+        Results are fetched one page at a time using the ``page`` and
+        ``limit`` parameters, so only one page (two when prefetching) is
+        held in memory regardless of the number of hits. When streaming,
+        only one item is held in memory and pages are not prefetched.
+
+        Parameters:
+            query (str): Search query.
+            page_size (int): Items fetched per request. Defaults to 1000.
+            prefetch (bool): Fetch the next page in a background thread
+                             while the current page is consumed.
+            stream (bool): Decode items one at a time while the response is
+                           read, see ``get_items()``. Defaults to
+                           ``stream_items``.
+
+        Yields:
+            dict: Matching items.
+        """
+        yield from self._iter_pages("objects?" + query, page_size, prefetch,
+                                    stream)
+
+    def search_batch(self, query, page_size=DEFAULT_PAGE_SIZE, stream=None):
+        """Perform a search and collect the results in columnar form.
+
+        See ``mfiles.records``. With ``stream`` no more than one result is
+        held as a dict at a time.
+
+        Parameters:
+            query (str): Search query.
+            page_size (int): Items fetched per request. Defaults to 1000.
+            stream (bool): Decode items one at a time. Defaults to
+                           ``stream_items``.
+
+        Returns:
+            ObjectVersionBatch: Matching object versions.
+        """
+        return ObjectVersionBatch(self.iter_search(query, page_size,
+                                                   stream=stream))
+
+    def _iter_pages(self, endpoint, page_size, prefetch, stream=None):
+        """Yield items from all pages of a paged endpoint."""
+        separator = "&" if "?" in endpoint else "?"
+        stream = self.stream_items if stream is None else stream
+        get = self.get_items if stream else self.get
+        def fetch(page):
+            return get("%s%spage=%d&limit=%d" % \
+                       (endpoint, separator, page, page_size))
+        # The next page may be fetched in another thread
+        return iter_pages(self.threaded(fetch), prefetch)
+
     def objects(self):
         """Get all object types in the M-Files vault."""
         response = self.get("structure/objecttypes")
@@ -220,15 +658,35 @@ class MFilesClient():
         response = self.get("valuelists")
         return response
 
-    def value_list_items(self, list_id):
-        """Get items for a specific value list in the M-Files vault."""
-        endpoint = "valuelists/%d/items" % list_id
+    def value_list_items(self, list_id, page=None, limit=None,
+                         name_filter=None, stream=None):
+        """Get items for a specific value list in the M-Files vault.
+
+        Parameters:
+            list_id (int): ID of the value list.
+            page (int): Page of items to get, starting at 1.
+            limit (int): Maximum number of items per page.
+            name_filter (str): Only get items with names matching this.
+            stream (bool): Decode the items one at a time while the
+                           response is read, see ``get_items()``. Defaults
+                           to ``stream_items``.
+
+        Returns:
+            dict: Dictionary with the list items under key ``Items``, an
+            ``ItemStream`` when streaming.
+        """
+        endpoint = value_list_endpoint(list_id, page, limit, name_filter)
+        if self.stream_items if stream is None else stream:
+            return self.get_items(endpoint)
         response = self.get(endpoint)
         return response
 
     def get_value_id(self, value_name, list_id, owner_ids):
         """Get the ID of a specific value in a specific value list.
 
+        Lists are indexed by ``value_list_index`` the first time they are
+        used, later lookups are answered locally.
+
         Parameters:
             value_name (str): Name of the value list option to look for.
             list_id (int): ID of the list to look in.
@@ -240,17 +698,28 @@ class MFilesClient():
         Returns:
             int: ID of value in value list.
         """
-        list_items = self.value_list_items(list_id)
-        for item in list_items["Items"]:
-            same_name = item["Name"] == value_name
-            ok_owner = not item["HasOwner"] or item["OwnerID"] in owner_ids
-            if same_name and ok_owner:
-                return item["ID"]
-        raise MFilesException("Value name %s not recognized" % value_name)
+        item = self.value_list_index.lookup(list_id, value_name, owner_ids)
+        if item is None:
+            raise MFilesException("Value name %s not recognized" % value_name)
+        return item["ID"]
+
+    def _fetch_types(self, category):
+        """Fetch all types from a type category from the server."""
+        if category == "object":
+            types = self.objects()
+        elif category == "class":
+            types = self.classes()
+        elif category == "property":
+            types = self.properties()
+        else:
+            raise MFilesException("Type name %s not recognized" % category)
+        return types
 
     def get_types(self, category="object"):
         """Get info for all types from a type category.
 
+        Results are served from the structure cache.
+
         Parameters:
             category (str): Type category. Can be any of ``"object"``,
                             ``"class"``, ``"property"``. Defaults to
@@ -262,15 +731,7 @@ class MFilesClient():
         Returns:
             list: List of dicts with information about the types.
         """
-        if category == "object":
-            types = self.objects()
-        elif category == "class":
-            types = self.classes()
-        elif category == "property":
-            types = self.properties()
-        else:
-            raise MFilesException("Type name %s not recognized" % category)
-        return types
+        return self.structure.types(category)
 
     def get_info(self, name, category="object"):
         """Get general info of a type by name.
@@ -287,11 +748,8 @@ class MFilesClient():
         Returns:
             dict: Dictionary with information about the type.
         """
-        types = self.get_types(category)
-        for type_info in types:
-            if type_info["Name"] == name:
-                return type_info
-        raise MFilesException("Property %s could not be found in vault" % name)
+        return found(self.structure.by_name(category, name),
+                      "Property %s could not be found in vault", name)
 
     def get_info_id(self, type_id, category="object"):
         """Get general info of a type by id.
@@ -308,12 +766,8 @@ class MFilesClient():
         Returns:
             dict: Dictionary with information about the type.
         """
-        types = self.get_types(category)
-        for type_info in types:
-            if type_info["ID"] == type_id:
-                return type_info
-        raise MFilesException("Property ID %s could not be found in vault" % \
-                              type_id)
+        return found(self.structure.by_id(category, type_id),
+                      "Property ID %s could not be found in vault", type_id)
 
     def translate_name(self, name, category="object"):
         """Translate a name into its ID as recognized by the server.
@@ -341,21 +795,12 @@ class MFilesClient():
             dict: Property with required keys and values.
         """
         property_info = self.get_info(property_name, "property")
-        prop = deepcopy(OBJ_PROPERTY)
-        prop["PropertyDef"] = property_info["ID"]
-        prop["TypedValue"]["DataType"] = property_info["DataType"]
         if property_info["DataType"] in LOOKUP_DATATYPES:
             # DataType needs to be looked up
-            datatype_id = self.get_value_id(property_value,
-                                            property_info["ValueList"],
-                                            owners)
-            datatype = deepcopy(LOOKUP_DATATYPE)
-            datatype["Lookup"]["Item"] = datatype_id
-        else:
-            datatype = deepcopy(DATATYPE)
-            datatype["Value"] = property_value
-        prop["TypedValue"].update(datatype)
-        return prop
+            property_value = self.get_value_id(property_value,
+                                               property_info["ValueList"],
+                                               owners)
+        return build_property(property_info, property_value)
 
     def create_object(self, name, object_type=0, object_class=0,
                       extra_info=None, file_info=None):
@@ -371,9 +816,11 @@ class MFilesClient():
             object_class (str, int): Object class, same translation principle
                                      as for object_type.
             extra_info (dict): Additional object information.
-            file_info (dict): Eventual file information for object. Dict
-                              that must contain keys ``UploadID``, ``Title``,
-                              ``Extension``, ``Size``.
+            file_info (dict, list): Eventual file information for object.
+                                    Dict that must contain keys
+                                    ``UploadID``, ``Title``, ``Extension``,
+                                    ``Size``, or a list of such dicts for an
+                                    object with several files.
 
         Raises:
             MFilesException: If the object can't be created.
@@ -388,19 +835,10 @@ class MFilesClient():
             object_type = self.translate_name(object_type, "object")
         if isinstance(object_class, str):
             object_class = self.translate_name(object_class, "class")
-        # Start building object
-        obj = deepcopy(OBJ)
-        # Set mandatory info
-        obj["PropertyValues"][0]["TypedValue"]["Value"] = name
-        obj["PropertyValues"][1]["TypedValue"]["Lookup"]["Item"] = object_class
-        # Add any additionally supplied properties
-        for property_name in extra_info:
-            owners = [object_class, object_type]
-            prop = self.get_property(property_name, owners,
-                                     extra_info[property_name])
-            obj["PropertyValues"].append(prop)
-        obj["Files"] = [file_info]
-        data = json.dumps(obj)
+        # Build object from the compiled template of its properties
+        data = self.property_resolver.build_json(name, object_type,
+                                                 object_class, extra_info,
+                                                 file_info)
         endpoint = "objects/%s" % object_type
         return self.post(endpoint, data)
 
@@ -418,107 +856,65 @@ class MFilesClient():
             (object_type, object_id, object_version)
         return self.put(endpoint, data)
 
-    def upload_file(self, file_path, object_type=0, object_class=0,
-                    extra_info=None):
-        """Upload a file to M-Files.
+    def undo_check_out(self, object_id, object_version, object_type=0):
+        """Undo a check out, discarding changes made since.
 
         Parameters:
-            file_path (str): Path to file to upload.
-            object_type (str, int): Object type. If integer, the type will
-                                    not be attempted to be translated. If
-                                    string, the type will be transated into
-                                    the property ID the server expects for the
-                                    given type.
-            object_class (str, int): Object class, same translation principle
-                                     as for object_type.
-            extra_info (dict): Additional object information.
+            object_id (int): Object ID.
+            object_version (int): Checked out version, as returned by
+                                  ``check_out()``.
+            object_type (int): Object type ID.
 
         Raises:
-            MFilesException: If the file can't be uploaded.
+            MFilesException: If the check out can't be undone.
 
         Returns:
-            dict: Dictionary with API request result.
+            dict: Dictionary with object information.
         """
-        # Upload file to temporary storage
-        endpoint = "files"
-        with open(file_path, mode="rb") as file_stream:
-            content = file_stream.read()
-        upload_info = self.post(endpoint, content)
-
-        # Create object
-        object_name, objext_ext = splitext(file_path)
-        file_info = {
-            "UploadID": upload_info["UploadID"],
-            "Title": object_name,
-            "Extension": objext_ext[1:],
-            "Size": upload_info["Size"]
-        }
-
-        obj_info = self.create_object(object_name, object_type, object_class,
-                                      extra_info, file_info)
-        return obj_info
-
-    def download_file(self, local_path, object_type, object_id, file_id,
-                      object_version="latest"):
-        """Download a file from M-Files.
+        request_url = "%sobjects/%s/%s/%s" % \
+            (self.server, object_type, object_id, object_version)
+        response = self._request("DELETE", request_url)
+        if response.status_code != 200:
+            raise MFilesException(response.text)
+        return response.json()
+
+    def get_properties(self, object_id, object_version="latest",
+                       object_type=0):
+        """Get property values of an object version.
+
+        Search results hold no property values, this fetches them.
 
         Parameters:
-            object_type (int): Object type ID.
             object_id (int): Object ID.
-            file_id (int): File ID.
             object_version (int, str): Object version. Defaults to
                                        ``"latest"``.
-            local_path (str): Path to download file to.
-
-        Raises:
-            MFilesException: If the file can't be downloaded.
+            object_type (int): Object type ID.
 
         Returns:
-            bool: True if file is found and downloaded successfully.
+            list: Property values.
         """
-        # pylint: disable=too-many-arguments,too-many-positional-arguments
-        request_url = "%sobjects/%s/%s/%s/files/%s/content" % \
-            (self.server, object_type, object_id, object_version, file_id)
-        response = self.session.get(request_url, headers=self.headers)
-        if response.status_code != 200:
-            raise MFilesException(response.text)
-        with open(local_path, mode="wb+") as file_stream:
-            file_stream.write(response.content)
-        return True
-
-    def download_file_name(self, file_name, local_path=None):
-        """Download a file from M-Files by its name.
+        endpoint = "objects/%s/%s/%s/properties" % \
+            (object_type, object_id, object_version)
+        return self.get(endpoint)
 
-        Caution:
-            This searches for the file and downloads the top
-            result. This is not always guaranteed to be the
-            intended file. A better way is to use search to
-            find the correct file and then use the function
-            ``download_file()`` to download the file by using
-            file and object id.
+    def set_properties(self, object_id, properties, object_version="latest",
+                       object_type=0):
+        """Set properties of a checked out object.
 
         Parameters:
-            file_name (str): Name of file to download.
-            local_path (str): Path to download file to. Defaults
-                            to file name and current directory.
+            object_id (int): Object ID.
+            properties (list): Property values as built by
+                               ``get_property()``.
+            object_version (int, str): Checked out version. Defaults to
+                                       ``"latest"``.
+            object_type (int): Object type ID.
 
         Returns:
-            bool: True if file is found and downloaded.
+            dict: Dictionary with object information.
         """
-        items = self.quick_search(file_name)
-        if not items:
-            return False
-        item = items["Items"][0]
-        obj_type = item["ObjVer"]["Type"]
-        obj_id = item["ObjVer"]["ID"]
-        obj_version = item["ObjVer"]["Version"]
-        file_id = item["Files"][0]["ID"]
-        local_path = local_path or getcwd() + "\\" + file_name
-        download_ok = self.download_file(local_path=local_path,
-                                         object_type=obj_type,
-                                         object_id=obj_id, file_id=file_id,
-                                         object_version=obj_version)
-        return download_ok
+        endpoint = "objects/%s/%s/%s/properties" % \
+            (object_type, object_id, object_version)
+        return self.post(endpoint, json.dumps(properties))
 
     def delete_object(self, object_type, object_id):
         """Delete M-Files object.
@@ -540,7 +936,7 @@ class MFilesClient():
         """
         request_url = "%sobjects/%s/%s/latest?allVersions=true" % \
             (self.server, object_type, object_id)
-        response = self.session.delete(request_url, headers=self.headers)
+        response = self._request("DELETE", request_url)
         if response.status_code != 200:
             raise MFilesException(response.text)
         return response
@@ -0,0 +1,223 @@
+"""Local cache of downloaded file content.
+
+Files of a checked in object version never change, so they can be kept on
+disk and handed out again without contacting the server. Entries are keyed
+on vault, object type, object ID, object version and file ID.
+
+The cache directory can be shared by several processes on the same
+machine. Entries are written to a temporary file and renamed into place,
+so readers never see a partial file, and readers treat an entry removed by
+another process's eviction as a miss. Entries are handed out as hard links
+when requested, otherwise copied, which the operating system does without
+passing the data through Python where supported.
+"""
+
+# Standard modules
+import hashlib
+import os
+from os.path import isdir, join
+import shutil
+from tempfile import mkstemp
+from threading import Lock
+import time
+
+# Internal modules
+from mfiles.transfer import DEFAULT_CHUNK_SIZE
+
+# Default maximum cache size in bytes
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+# Seconds before a leftover temporary file is considered abandoned
+TEMPORARY_TTL = 24 * 60 * 60
+
+# Seconds between scans of the whole cache directory
+SCAN_INTERVAL = 10 * 60
+
+# Prefix of temporary files being written
+_TEMPORARY = ".tmp-"
+
+class FileCache():
+    """Content cache of downloaded files.
+
+    Parameters:
+        directory (str): Cache directory, created if missing.
+        max_size (int): Maximum total size of cached files in bytes.
+                        Defaults to 10 GiB.
+        link (bool): Hand out entries as hard links instead of copies.
+                     Linked files share content with the cache and must not
+                     be modified in place. Falls back to copying when
+                     linking is not possible. Defaults to False.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, link=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.link = link
+        self._lock = Lock()
+        self._size = None
+        self._scanned = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """Get path of the entry for ``key``.
+
+        Parameters:
+            key (tuple): ``(vault, object_type, object_id, version,
+                         file_id)``.
+        """
+        digest = hashlib.sha256(
+            "/".join(str(part) for part in key).encode()).hexdigest()
+        return join(self.directory, digest[:2], digest)
+
+    def __contains__(self, key):
+        return os.path.isfile(self.path(key))
+
+    def fetch(self, key, download):
+        """Get path of the entry for ``key``, downloading it if missing.
+
+        Parameters:
+            key (tuple): Entry key, see ``path()``.
+            download (callable): Called with a temporary file path to
+                                 download the file content to.
+
+        Returns:
+            str: Path of the cached file.
+        """
+        path = self.path(key)
+        try:
+            # Refresh recency for the least recently used eviction
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temporary = mkstemp(prefix=_TEMPORARY,
+                                    dir=os.path.dirname(path))
+        os.close(handle)
+        try:
+            download(temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self._count(os.path.getsize(path), keep=path)
+        return path
+
+    def _count(self, size, keep):
+        """Add a new entry to the running total, evicting if it is too large.
+
+        The running total misses entries added by other processes, so the
+        cache directory is also scanned every ``SCAN_INTERVAL`` seconds.
+        """
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            scan = self._size is None or self._size > self.max_size or \
+                time.time() - self._scanned > SCAN_INTERVAL
+        if scan:
+            self.evict(keep=keep)
+
+    def read(self, key, local_path, download, checksum=None):
+        """Write the file for ``key`` to ``local_path`` using the cache.
+
+        Parameters:
+            key (tuple): Entry key, see ``path()``.
+            local_path (str, file): Destination path or writable binary
+                                    file-like object.
+            download (callable): Called with a temporary file path to
+                                 download the file content to on a miss.
+            checksum (hash): Optional ``hashlib`` hash object, updated with
+                             the file content.
+
+        Returns:
+            int: Size of the file in bytes.
+        """
+        while True:
+            path = self.fetch(key, download)
+            try:
+                with open(path, mode="rb") as source:
+                    size = os.fstat(source.fileno()).st_size
+                    if hasattr(local_path, "write") or checksum is not None:
+                        for chunk in iter(
+                                lambda: source.read(DEFAULT_CHUNK_SIZE), b""):
+                            if checksum is not None:
+                                checksum.update(chunk)
+                            if hasattr(local_path, "write"):
+                                local_path.write(chunk)
+                    if not hasattr(local_path, "write"):
+                        self._place(path, local_path)
+                return size
+            except FileNotFoundError:
+                if os.path.exists(path):
+                    raise
+                # Evicted by another process in the meantime
+
+    def _place(self, path, local_path):
+        """Hard link or copy a cached file to ``local_path``."""
+        if self.link:
+            temporary = local_path + _TEMPORARY + str(os.getpid())
+            try:
+                os.link(path, temporary)
+                os.replace(temporary, local_path)
+                return
+            except FileNotFoundError:
+                raise
+            except OSError:
+                # Different file system or links not supported
+                pass
+        shutil.copyfile(path, local_path)
+
+    def size(self):
+        """Get total size of cached files in bytes."""
+        return sum(entry[2] for entry in self._entries())
+
+    def clear(self):
+        """Remove all cached files."""
+        for path, _mtime, _size in self._entries():
+            _remove(path)
+        with self._lock:
+            self._size = 0
+
+    def evict(self, keep=None):
+        """Remove least recently used files until below ``max_size``.
+
+        Scans the whole cache directory, which also removes abandoned
+        temporary files. The file at path ``keep`` is never removed.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(entry[2] for entry in entries)
+        for path, _mtime, size in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            _remove(path)
+            total -= size
+        with self._lock:
+            self._size = total
+            self._scanned = time.time()
+
+    def _entries(self):
+        """Yield ``(path, mtime, size)`` of all cached files."""
+        abandoned = time.time() - TEMPORARY_TTL
+        for prefix in os.listdir(self.directory):
+            subdirectory = join(self.directory, prefix)
+            if not isdir(subdirectory):
+                continue
+            for entry in os.scandir(subdirectory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(_TEMPORARY):
+                    if stat.st_mtime < abandoned:
+                        _remove(entry.path)
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+def _remove(path):
+    """Remove a file that may already be removed by another process."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,221 @@
+"""Persistent cache of M-Files GET responses.
+
+Responses are stored in SQLite together with their ``ETag`` and
+``Last-Modified`` validators. Cached responses are revalidated with a
+conditional request, so an unchanged response costs a ``304 Not Modified``
+without a body. A checked in object version (e.g. ``objects/0/123/4``)
+never changes and is served without any request. Checked out versions and
+the sub-resources of a version, such as its properties, are revalidated.
+
+Entries are keyed on a scope (server, vault and user) and the endpoint, so
+cached data from different users or vaults is kept apart. The least
+recently used entries are evicted when the cache grows above its size
+limit.
+"""
+
+# Standard modules
+import hashlib
+import json
+import re
+import sqlite3
+from threading import Lock
+import time
+
+# Default maximum cache size in bytes
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+# Access times of hits kept in memory before they are written
+ACCESS_BATCH = 100
+
+# Seconds before access times of hits are written
+ACCESS_INTERVAL = 5.0
+
+# Endpoints of a specific object version, which never change once checked in
+IMMUTABLE_ENDPOINT = re.compile(r"^objects/\d+/\d+/\d+(\?|$)")
+
+def is_checked_in(obj_ver):
+    """Check if an object version dict is a checked in version."""
+    return isinstance(obj_ver, dict) and "ObjVer" in obj_ver and \
+        not obj_ver.get("ObjectCheckedOut") and not obj_ver.get("CheckedOutTo")
+
+def is_immutable(endpoint, body):
+    """Check if a response never changes.
+
+    Only a checked in object version is immutable, a checked out version
+    changes until it is checked in.
+
+    Parameters:
+        endpoint (str): Endpoint of the response.
+        body (bytes): Response body.
+    """
+    if not IMMUTABLE_ENDPOINT.match(endpoint):
+        return False
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return False
+    return is_checked_in(data)
+
+class CachedResponse():
+    """Cached response body and validators."""
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("body", "etag", "last_modified", "immutable", "stored")
+
+    def __init__(self, body, etag, last_modified, immutable, stored):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.immutable = immutable
+        self.stored = stored
+
+    def validators(self):
+        """Get headers for a conditional request."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class ResponseCache():
+    """Cache of GET responses in SQLite.
+
+    Parameters:
+        path (str): Database file path. Defaults to ``":memory:"``, use a
+                    file to share the cache between runs.
+        max_size (int): Maximum total size of cached bodies in bytes.
+                        Defaults to 100 MiB.
+    """
+
+    def __init__(self, path=":memory:", max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         "key TEXT PRIMARY KEY, body BLOB, etag TEXT, "
+                         "last_modified TEXT, immutable INTEGER, "
+                         "stored REAL, accessed REAL, size INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed "
+                         "ON responses (accessed)")
+        self._db.commit()
+        # Running total of body sizes, recounted before evicting
+        self._total = self._count()
+        self._accessed = {}
+        self._flushed = time.time()
+
+    @staticmethod
+    def key(scope, endpoint):
+        """Get cache key of an endpoint within a scope.
+
+        Parameters:
+            scope (tuple): Values separating cached data, e.g. server, vault
+                           and user.
+            endpoint (str): Endpoint on form ``"path/to/endpoint"``.
+        """
+        scope_hash = hashlib.sha256(repr(tuple(scope)).encode()).hexdigest()
+        return scope_hash + ":" + endpoint
+
+    @staticmethod
+    def cacheable(headers):
+        """Check if a response with ``headers`` can be revalidated.
+
+        Immutable responses, see ``is_immutable()``, can always be cached.
+        """
+        return bool(headers.get("ETag") or headers.get("Last-Modified"))
+
+    def get(self, key):
+        """Get a cached response, ``None`` if not cached."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, immutable, stored "
+                "FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            # Access times are only needed for eviction, write them in
+            # batches instead of a transaction per hit
+            now = time.time()
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_BATCH or \
+                    now - self._flushed > ACCESS_INTERVAL:
+                self._flush()
+                self._db.commit()
+        return CachedResponse(row[0], row[1], row[2], bool(row[3]), row[4])
+
+    def put(self, key, body, etag=None, last_modified=None, immutable=False):
+        """Store a response and evict old entries if needed."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        now = time.time()
+        with self._lock:
+            self._total += len(body) - self._stored_size(key)
+            self._accessed.pop(key, None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, int(immutable), now, now,
+                 len(body)))
+            if self._total > self.max_size:
+                self._evict()
+            self._db.commit()
+
+    def delete(self, key):
+        """Remove a cached response."""
+        with self._lock:
+            self._total -= self._stored_size(key)
+            self._accessed.pop(key, None)
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def clear(self):
+        """Remove all cached responses."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._total = 0
+            self._accessed = {}
+
+    def size(self):
+        """Get total size of cached bodies in bytes."""
+        with self._lock:
+            return self._count()
+
+    def close(self):
+        """Close the database, writing pending access times."""
+        with self._lock:
+            self._flush()
+            self._db.commit()
+            self._db.close()
+
+    def _count(self):
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _stored_size(self, key):
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?",
+                               (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _flush(self):
+        """Write access times of hits kept in memory."""
+        self._db.executemany(
+            "UPDATE responses SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._accessed.items()])
+        self._accessed = {}
+        self._flushed = time.time()
+
+    def _evict(self):
+        # Other processes sharing the database change the total as well
+        total = self._count()
+        self._flush()
+        if total <= self.max_size:
+            self._total = total
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._total = total
@@ -0,0 +1,286 @@
+"""Local index of object metadata.
+
+``MetadataIndex`` stores object versions from search results in SQLite and
+answers lookups by class, property value and name locally, falling back to
+a server search when nothing is found::
+
+    index = MetadataIndex(client, "metadata.db")
+    index.refresh("o=0")
+    drawings = index.by_class(1)
+    reports = index.by_name("Report")
+
+Titles are indexed with FTS5 for word prefix search. An object is stored
+once, an older version never replaces a newer one, so results from any
+search can be added at any time. ``refresh()`` searches again, replaces
+what changed and drops deleted objects.
+"""
+
+# Standard modules
+from itertools import islice
+import json
+import sqlite3
+from threading import Lock
+from urllib.parse import quote
+
+# Internal modules
+from mfiles.bulk import DEFAULT_WORKERS, run_parallel
+from mfiles.properties import CLASS_PROPERTY
+
+# Number of object versions written to the database at a time
+BATCH_SIZE = 500
+
+def _typed_value(value):
+    """Get the indexed text of a property value."""
+    typed_value = value.get("TypedValue", {})
+    if typed_value.get("Lookup"):
+        return str(typed_value["Lookup"]["Item"])
+    if typed_value.get("Lookups"):
+        return [str(lookup["Item"]) for lookup in typed_value["Lookups"]]
+    return str(typed_value.get("Value"))
+
+class MetadataIndex():
+    """SQLite index of object versions.
+
+    Parameters:
+        client (MFilesClient): Client used for searches on a miss. ``None``
+                               disables the fallback.
+        path (str): Database file path. Defaults to ``":memory:"``.
+    """
+
+    def __init__(self, client=None, path=":memory:"):
+        self.client = client
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                type INTEGER, id INTEGER, version INTEGER, class INTEGER,
+                title TEXT, data TEXT, PRIMARY KEY (type, id));
+            CREATE INDEX IF NOT EXISTS objects_class ON objects (class);
+            CREATE TABLE IF NOT EXISTS property_values (
+                type INTEGER, id INTEGER, property INTEGER, value TEXT);
+            CREATE INDEX IF NOT EXISTS property_values_value
+                ON property_values (property, value);
+            CREATE INDEX IF NOT EXISTS property_values_object
+                ON property_values (type, id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS titles USING fts5 (title);
+        """)
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+
+    def add(self, items, properties=None):
+        """Add object versions, keeping the newest version of each object.
+
+        Items are written in batches, lookups are answered while the next
+        batch is read. Versions already indexed are skipped unless
+        ``properties`` are supplied for them. Deleted objects are removed.
+
+        Parameters:
+            items (iterable, dict): Object versions or a search result.
+            properties (dict): Optional property value lists by ``(type,
+                               id)``, used instead of the ``Properties`` of
+                               the items.
+
+        Returns:
+            int: Number of objects added, replaced or removed.
+        """
+        if isinstance(items, dict):
+            items = items["Items"]
+        properties = properties or {}
+        added = 0
+        items = iter(items)
+        # Items may be paged from the server, so each batch is read before
+        # lookups are blocked to write it
+        for batch in iter(lambda: list(islice(items, BATCH_SIZE)), []):
+            with self._lock:
+                for item in batch:
+                    added += self._add(item, properties.get(
+                        (item["ObjVer"]["Type"], item["ObjVer"]["ID"])))
+                self._db.commit()
+        return added
+
+    def _add(self, item, values):
+        obj_ver = item["ObjVer"]
+        key = (obj_ver["Type"], obj_ver["ID"])
+        row = self._db.execute("SELECT rowid, version FROM objects "
+                               "WHERE type = ? AND id = ?", key).fetchone()
+        deleted = bool(item.get("Deleted"))
+        if row is not None and (row[1] > obj_ver["Version"] or (
+                row[1] == obj_ver["Version"] and values is None and
+                not deleted)):
+            # Indexed version is newer or the same
+            return False
+        if row is not None:
+            self._remove(row[0], key)
+        if deleted:
+            return row is not None
+        values = values if values is not None else item.get("Properties", [])
+        object_class = item.get("Class")
+        for value in values:
+            if value["PropertyDef"] == CLASS_PROPERTY and object_class is None:
+                object_class = int(_typed_value(value))
+        cursor = self._db.execute(
+            "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?)",
+            key + (obj_ver["Version"], object_class, item.get("Title"),
+                   json.dumps(item)))
+        self._db.execute("INSERT INTO titles (rowid, title) VALUES (?, ?)",
+                         (cursor.lastrowid, item.get("Title") or ""))
+        rows = []
+        for value in values:
+            text = _typed_value(value)
+            for part in text if isinstance(text, list) else [text]:
+                rows.append(key + (value["PropertyDef"], part))
+        self._db.executemany("INSERT INTO property_values VALUES (?, ?, ?, ?)",
+                             rows)
+        return True
+
+    def _remove(self, rowid, key):
+        self._db.execute("DELETE FROM objects WHERE rowid = ?", (rowid,))
+        self._db.execute("DELETE FROM titles WHERE rowid = ?", (rowid,))
+        self._db.execute("DELETE FROM property_values "
+                         "WHERE type = ? AND id = ?", key)
+
+    def invalidate(self, object_type, object_id):
+        """Remove an object from the index."""
+        key = (object_type, object_id)
+        with self._lock:
+            row = self._db.execute("SELECT rowid FROM objects "
+                                   "WHERE type = ? AND id = ?", key).fetchone()
+            if row is not None:
+                self._remove(row[0], key)
+                self._db.commit()
+
+    def is_current(self, obj_ver):
+        """Check if the index holds version ``obj_ver`` of an object."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version FROM objects WHERE type = ? AND id = ?",
+                (obj_ver["Type"], obj_ver["ID"])).fetchone()
+        return row is not None and row[0] == obj_ver["Version"]
+
+    def get(self, object_type, object_id):
+        """Get the indexed version of an object, ``None`` if not indexed."""
+        rows = self._select("SELECT data FROM objects "
+                            "WHERE type = ? AND id = ?",
+                            (object_type, object_id))
+        return rows[0] if rows else None
+
+    def refresh(self, query="", workers=DEFAULT_WORKERS):
+        """Search the server and index the results.
+
+        Search results hold no property values, they are fetched for the
+        objects not already indexed at the found version. Deleted objects
+        are searched too and dropped from the index.
+
+        Parameters:
+            query (str): Search query. Defaults to all objects.
+            workers (int): Number of threads fetching property values.
+                           Defaults to 8.
+
+        Returns:
+            int: Number of objects added, replaced or removed.
+        """
+        query = "&".join(filter(None, [query, "d=include"]))
+        items = iter(self.client.iter_search(query, prefetch=True))
+        added = 0
+        for batch in iter(lambda: list(islice(items, BATCH_SIZE)), []):
+            added += self.add(batch, self._properties(batch, workers))
+        return added
+
+    def _properties(self, items, workers):
+        """Fetch property values of items not indexed at their version."""
+        changed = [item["ObjVer"] for item in items
+                   if "Properties" not in item and not item.get("Deleted")
+                   and not self.is_current(item["ObjVer"])]
+        properties = {}
+        for result in run_parallel(
+                self.client.threaded(lambda obj_ver: self.client.get_properties(
+                    obj_ver["ID"], obj_ver["Version"], obj_ver["Type"])),
+                changed, workers):
+            if result.error:
+                raise result.error
+            properties[(result.item["Type"], result.item["ID"])] = \
+                result.result
+        return properties
+
+    def by_class(self, object_class, object_type=None, fallback=True):
+        """Get objects of a class.
+
+        Parameters:
+            object_class (int): Class ID.
+            object_type (int): Optional object type ID.
+            fallback (bool): Search the server if nothing is indexed.
+        """
+        sql = "SELECT data FROM objects WHERE class = ?"
+        params = (object_class,)
+        if object_type is not None:
+            sql += " AND type = ?"
+            params += (object_type,)
+        return self._query(sql, params, fallback and "p%d=%d" %
+                           (CLASS_PROPERTY, object_class))
+
+    def by_property(self, property_def, value, fallback=True):
+        """Get objects with a property value.
+
+        Parameters:
+            property_def (int): Property definition ID.
+            value (any): Value, the item ID for lookup properties.
+            fallback (bool): Search the server if nothing is indexed.
+        """
+        return self._query(
+            "SELECT objects.data FROM property_values JOIN objects "
+            "USING (type, id) WHERE property = ? AND value = ?",
+            (property_def, str(value)),
+            fallback and "p%d=%s" % (property_def, quote(str(value))))
+
+    def by_name(self, prefix, fallback=True):
+        """Get objects whose title starts with ``prefix``.
+
+        Parameters:
+            prefix (str): Title prefix, case insensitive.
+            fallback (bool): Search the server if nothing is indexed.
+        """
+        words = prefix.split()
+        if not words:
+            return []
+        match = " ".join('"%s"' % word.replace('"', '""') for word in words)
+        rows = self._select(
+            "SELECT objects.data FROM titles JOIN objects "
+            "ON objects.rowid = titles.rowid WHERE titles MATCH ? "
+            "AND objects.title LIKE ? ESCAPE '\\'",
+            (match + "*", prefix.replace("\\", "\\\\")
+             .replace("%", "\\%").replace("_", "\\_") + "%"))
+        if rows or not fallback or self.client is None:
+            return rows
+        self.refresh("q=" + quote(prefix))
+        return self.by_name(prefix, fallback=False)
+
+    def search(self, text):
+        """Full text search of titles, e.g. ``"annual report"``.
+
+        Parameters:
+            text (str): FTS5 query.
+        """
+        return self._select(
+            "SELECT objects.data FROM titles JOIN objects "
+            "ON objects.rowid = titles.rowid WHERE titles MATCH ? "
+            "ORDER BY rank", (text,))
+
+    def _query(self, sql, params, fallback):
+        rows = self._select(sql, params)
+        if rows or not fallback or self.client is None:
+            return rows
+        self.refresh(fallback)
+        return self._select(sql, params)
+
+    def _select(self, sql, params):
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
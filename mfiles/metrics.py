@@ -0,0 +1,223 @@
+"""Request metrics.
+
+Clients report one ``RequestEvent`` per request to each registered sink. A
+sink is any callable taking the event, e.g.::
+
+    histogram = HistogramSink()
+    client.add_metrics_sink(histogram)
+    client.add_metrics_sink(lambda event: print(event.endpoint, event.latency))
+
+When no sink is registered nothing is measured.
+"""
+
+# Standard modules
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache
+from threading import Lock
+
+# Internal modules
+from mfiles.errors import MFilesException
+
+RequestEvent = namedtuple("RequestEvent", [
+    "method", "endpoint", "status", "bytes_in", "bytes_out", "latency",
+    "retries", "cache"
+])
+RequestEvent.__doc__ = """Metrics for one request.
+
+Attributes:
+    method (str): HTTP method.
+    endpoint (str): Endpoint template, e.g. ``"objects/{type}/{id}"``.
+    status (int): Response status, ``None`` if no response was received.
+    bytes_in (int): Response body size, ``None`` if unknown.
+    bytes_out (int): Request body size, ``None`` if unknown.
+    latency (float): Seconds from first attempt to final response.
+    retries (int): Number of retries made.
+    cache (str): ``"hit"`` or ``"miss"`` for cacheable requests, else
+                 ``None``.
+"""
+
+# Default latency histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Names of the IDs following each collection in endpoint paths
+_PARAMETERS = {
+    "objects": ("{type}", "{id}", "{version}"),
+    "objecttypes": ("{type}",),
+    "classes": ("{class}",),
+    "properties": ("{property}",),
+    "valuelists": ("{list}",),
+    "items": ("{item}",),
+    "files": ("{file}",)
+}
+
+@lru_cache(maxsize=1024)
+def endpoint_template(endpoint):
+    """Turn an endpoint into a template by replacing IDs with names.
+
+    ``"objects/0/123/latest/files/5/content?x=1"`` becomes
+    ``"objects/{type}/{id}/{version}/files/{file}/content"``.
+    """
+    segments = []
+    names = ()
+    for segment in endpoint.split("?", 1)[0].strip("/").split("/"):
+        if names and (segment.lstrip("-").isdigit() or segment == "latest"):
+            segments.append(names[0])
+            names = names[1:]
+            continue
+        names = _PARAMETERS.get(segment, ())
+        segments.append(segment)
+    return "/".join(segments)
+
+def data_size(data):
+    """Get size of a request body, None if unknown."""
+    if isinstance(data, str):
+        return len(data.encode())
+    if isinstance(data, bytes):
+        return len(data)
+    return getattr(data, "size", None) if data is not None else 0
+
+def body_size(response):
+    """Get size of a response body without reading a streamed body."""
+    if response is None:
+        return None
+    # pylint: disable=protected-access
+    if response._content_consumed:
+        return len(response.content)
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+class HistogramSink():
+    """In-memory aggregation of request metrics.
+
+    Events are grouped by method and endpoint template.
+
+    Parameters:
+        buckets (tuple): Latency histogram bucket upper bounds in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self._stats = {}
+
+    def __call__(self, event):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = {"count": 0, "errors": 0, "retries": 0,
+                         "latency": 0.0, "max_latency": 0.0,
+                         "bytes_in": 0, "bytes_out": 0, "cache_hits": 0,
+                         "cache_misses": 0,
+                         "buckets": [0] * (len(self.buckets) + 1)}
+                self._stats[key] = stats
+            stats["count"] += 1
+            stats["errors"] += event.status is None or event.status >= 400
+            stats["retries"] += event.retries
+            stats["latency"] += event.latency
+            stats["max_latency"] = max(stats["max_latency"], event.latency)
+            stats["bytes_in"] += event.bytes_in or 0
+            stats["bytes_out"] += event.bytes_out or 0
+            stats["cache_hits"] += event.cache == "hit"
+            stats["cache_misses"] += event.cache == "miss"
+            stats["buckets"][bisect_left(self.buckets, event.latency)] += 1
+
+    def reset(self):
+        """Drop all aggregated metrics."""
+        with self._lock:
+            self._stats = {}
+
+    def summary(self):
+        """Get aggregated metrics.
+
+        Returns:
+            dict: Dictionary keyed on ``(method, endpoint)`` with dicts
+            holding ``count``, ``errors``, ``retries``, ``latency`` (total
+            seconds), ``max_latency``, ``mean_latency``, ``bytes_in``,
+            ``bytes_out``, ``cache_hits``, ``cache_misses`` and ``buckets``
+            (counts per latency bucket, last one is overflow).
+        """
+        with self._lock:
+            summary = {key: dict(stats, buckets=list(stats["buckets"]))
+                       for key, stats in self._stats.items()}
+        for stats in summary.values():
+            stats["mean_latency"] = stats["latency"] / stats["count"]
+        return summary
+
+class PrometheusSink():
+    """Report request metrics to Prometheus.
+
+    Requires ``prometheus_client``.
+
+    Parameters:
+        registry (CollectorRegistry): Registry to register metrics in.
+                                      Defaults to the global registry.
+        prefix (str): Metric name prefix. Defaults to ``"mfiles"``.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, registry=None, prefix="mfiles"):
+        try:
+            # pylint: disable=import-outside-toplevel
+            from prometheus_client import REGISTRY, Counter, Histogram
+        except ImportError as error:
+            raise MFilesException("PrometheusSink requires "
+                                  "prometheus_client") from error
+        registry = registry or REGISTRY
+        labels = ["method", "endpoint", "status"]
+        self.latency = Histogram(prefix + "_request_seconds",
+                                 "M-Files request latency", labels,
+                                 registry=registry)
+        self.retries = Counter(prefix + "_request_retries",
+                               "M-Files request retries", labels,
+                               registry=registry)
+        self.bytes = Counter(prefix + "_request_bytes",
+                             "M-Files request body bytes",
+                             labels + ["direction"], registry=registry)
+
+    def __call__(self, event):
+        labels = (event.method, event.endpoint, str(event.status))
+        self.latency.labels(*labels).observe(event.latency)
+        self.retries.labels(*labels).inc(event.retries)
+        self.bytes.labels(*labels, "in").inc(event.bytes_in or 0)
+        self.bytes.labels(*labels, "out").inc(event.bytes_out or 0)
+
+class OpenTelemetrySink():
+    """Report request metrics to OpenTelemetry.
+
+    Requires ``opentelemetry-api``.
+
+    Parameters:
+        meter (Meter): Meter to create instruments with. Defaults to a meter
+                       named ``"mfiles"`` from the global meter provider.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, meter=None):
+        try:
+            # pylint: disable=import-outside-toplevel
+            from opentelemetry import metrics
+        except ImportError as error:
+            raise MFilesException("OpenTelemetrySink requires "
+                                  "opentelemetry-api") from error
+        meter = meter or metrics.get_meter("mfiles")
+        self.latency = meter.create_histogram(
+            "mfiles.request.duration", unit="s",
+            description="M-Files request latency")
+        self.retries = meter.create_counter(
+            "mfiles.request.retries", description="M-Files request retries")
+        self.bytes = meter.create_counter(
+            "mfiles.request.bytes", unit="By",
+            description="M-Files request body bytes")
+
+    def __call__(self, event):
+        attributes = {"http.method": event.method,
+                      "mfiles.endpoint": event.endpoint,
+                      "http.status_code": event.status or 0}
+        self.latency.record(event.latency, attributes)
+        self.retries.add(event.retries, attributes)
+        self.bytes.add(event.bytes_in or 0,
+                       dict(attributes, direction="in"))
+        self.bytes.add(event.bytes_out or 0,
+                       dict(attributes, direction="out"))
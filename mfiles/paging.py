@@ -0,0 +1,91 @@
+"""Paging through M-Files results.
+
+Search and value list endpoints return their results in pages of at most
+``limit`` items, with ``MoreResults`` set when another page follows.
+``iter_pages`` yields the items of all pages, fetching the next page only
+when needed::
+
+    items = iter_pages(lambda page: client.value_list_items(
+        101, page=page, limit=1000))
+"""
+
+# Standard modules
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+# Internal modules
+from mfiles.streaming import ItemStream
+
+def value_list_endpoint(list_id, page=None, limit=None, name_filter=None):
+    """Build endpoint for getting a page of value list items.
+
+    Parameters:
+        list_id (int): Value list ID.
+        page (int): Page number, from 1.
+        limit (int): Maximum number of items per page.
+        name_filter (str): Only items whose name contains this text.
+
+    Returns:
+        str: Endpoint on form ``"valuelists/<id>/items?<query>"``.
+    """
+    endpoint = "valuelists/%d/items" % list_id
+    query = []
+    if name_filter is not None:
+        query.append("filter=" + quote(name_filter))
+    if page is not None:
+        query.append("page=%d" % page)
+    if limit is not None:
+        query.append("limit=%d" % limit)
+    if query:
+        endpoint += "?" + "&".join(query)
+    return endpoint
+
+def more_pages(result, count):
+    """Check if another page follows a page of results.
+
+    Servers may return fewer items than asked for per page, so the size of
+    a page tells nothing, only ``MoreResults`` does. An empty page ends the
+    results in any case, so a server always reporting more can't loop
+    forever.
+
+    Parameters:
+        result (dict, ItemStream): Page of results.
+        count (int): Number of items in the page.
+    """
+    return bool(result.get("MoreResults")) and count > 0
+
+def iter_pages(fetch, prefetch=False):
+    """Yield the items of all pages of a paged result.
+
+    Parameters:
+        fetch (callable): Called with a page number, from 1, and returning
+                          the page as a dict or an ``ItemStream``.
+        prefetch (bool): Fetch the next page in a background thread while
+                         the items of a page are consumed. Streamed pages
+                         are never prefetched, their items are read as they
+                         arrive.
+
+    Yields:
+        dict: Items of all pages in order.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = 1
+        result = fetch(page)
+        while True:
+            streamed = isinstance(result, ItemStream)
+            upcoming = None
+            if prefetch and not streamed and more_pages(
+                    result, len(result.get("Items", []))):
+                upcoming = executor.submit(fetch, page + 1)
+            count = 0
+            try:
+                for item in result.get("Items", []):
+                    count += 1
+                    yield item
+            finally:
+                if streamed:
+                    result.close()
+            if not more_pages(result, count):
+                return
+            page += 1
+            result = upcoming.result() if upcoming else fetch(page)
@@ -0,0 +1,176 @@
+"""Clients for many vaults and servers.
+
+``MFilesClientPool`` hands out one authenticated client per server, vault
+and user. Clients of the same server share one connection pool, so
+switching between vaults reuses open connections and logged in clients::
+
+    with MFilesClientPool(user="user", password="pass") as pool:
+        pool.client(SALES_VAULT).quick_search("offer")
+        pool.client(HR_VAULT, server="https://hr.example.com/REST/")
+
+Clients not used for ``idle_timeout`` seconds are dropped. When
+``refresh_interval`` is set, a background thread renews the tokens of the
+clients in use before they expire.
+"""
+
+# Standard modules
+from threading import Event, Lock, Thread
+import time
+from urllib.parse import urlsplit
+
+# External modules
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+
+# Internal modules
+from mfiles.client import DEFAULT_POOL_SIZE, MFilesClient
+from mfiles.definitions import DEFAULT_URL
+from mfiles.errors import MFilesException
+
+# Default seconds before an unused client is dropped
+DEFAULT_IDLE_TIMEOUT = 600
+
+class MFilesClientPool():
+    """Pool of clients keyed on server, vault and user.
+
+    Parameters:
+        user (str): Default user to login with.
+        password (str): Default user password.
+        idle_timeout (float): Seconds before an unused client is dropped.
+                              Defaults to 600.
+        refresh_interval (float): Seconds between background renewals of
+                                  authentication tokens. ``None`` disables
+                                  background renewal, tokens are then
+                                  renewed when they are rejected.
+        pool_size (int): Maximum number of connections kept alive per
+                         server. Defaults to 10.
+        **client_options: Further arguments for every ``MFilesClient``.
+                          Clients are thread safe unless ``thread_safe`` is
+                          set to False.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, user=None, password=None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, refresh_interval=None,
+                 pool_size=DEFAULT_POOL_SIZE, **client_options):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.user = user
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.refresh_interval = refresh_interval
+        self.pool_size = pool_size
+        self.client_options = dict({"thread_safe": True}, **client_options)
+        self._lock = Lock()
+        self._clients = {}
+        self._adapters = {}
+        self._stopped = Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def client(self, vault, server=DEFAULT_URL, user=None, password=None):
+        """Get the client for a vault, creating it on first use.
+
+        Parameters:
+            vault (str): M-Files vault GUID.
+            server (str): API URL. Defaults to
+                          ``"http://localhost/m-files/REST/"``.
+            user (str): User, defaults to the pool user.
+            password (str): Password, defaults to the pool password.
+
+        Returns:
+            MFilesClient: Client logging in on its first request.
+        """
+        if server[-1] != "/":
+            server += "/"
+        user = user or self.user
+        key = (server, vault, user)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                host = urlsplit(server).netloc
+                adapter = self._adapters.get(host)
+                if adapter is None:
+                    adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                          pool_maxsize=self.pool_size)
+                    self._adapters[host] = adapter
+                client = MFilesClient(server=server, user=user,
+                                      password=password or self.password,
+                                      vault=vault, adapter=adapter,
+                                      **self.client_options)
+                entry = self._clients[key] = [client, now]
+            entry[1] = now
+        self.evict_idle()
+        return entry[0]
+
+    def evict_idle(self):
+        """Drop clients not used for ``idle_timeout`` seconds.
+
+        Returns:
+            int: Number of clients dropped.
+        """
+        limit = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [key for key, (_client, used) in self._clients.items()
+                    if used < limit]
+            for key in idle:
+                del self._clients[key]
+        return len(idle)
+
+    def refresh_tokens(self):
+        """Renew the authentication tokens of all logged in clients.
+
+        Clients without stored credentials are skipped, the user is never
+        prompted. Clients that fail to log in keep their token and log in
+        again when it is rejected.
+
+        Returns:
+            int: Number of tokens renewed.
+        """
+        with self._lock:
+            clients = [client for client, _used in self._clients.values()
+                       if client.headers["X-Authentication"]]
+        renewed = 0
+        for client in clients:
+            try:
+                # Serialized with renewals by requests of the client
+                renewed += client.threaded(client.renew_token)()
+            except (MFilesException, RequestException, KeyError, ValueError):
+                continue
+        return renewed
+
+    def start(self):
+        """Start background token renewal and idle eviction, if enabled."""
+        if self.refresh_interval is None or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True,
+                              name="mfiles-pool")
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.evict_idle()
+            self.refresh_tokens()
+
+    def close(self):
+        """Stop background work, drop all clients and close connections."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._clients = {}
+            adapters = list(self._adapters.values())
+            self._adapters = {}
+        for adapter in adapters:
+            adapter.close()
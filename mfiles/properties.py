@@ -0,0 +1,363 @@
+"""Building and resolution of M-Files property values.
+
+Objects of the same type and class usually share the same set of
+properties. ``PropertyResolver`` compiles the property definitions of such
+a set once into a ``PropertyTemplate`` and resolves lookups for a whole
+batch of objects, fetching every value list involved at most once.
+Templates render object creation requests straight to JSON bytes, using
+``orjson`` when it is installed.
+"""
+
+# Standard modules
+import json
+from threading import Lock
+
+# External modules
+try:
+    import orjson
+except ImportError: # pragma: no cover
+    orjson = None
+
+# Internal modules
+from mfiles.definitions import LOOKUP_DATATYPES
+
+# Property IDs and datatypes of the name and class properties every object
+# is created with
+NAME_PROPERTY = 0
+CLASS_PROPERTY = 100
+TEXT_DATATYPE = 1
+LOOKUP_DATATYPE_ID = 9
+
+def dumps(data):
+    """Serialize ``data`` to compact JSON bytes.
+
+    Uses ``orjson`` if installed, otherwise the standard ``json`` module.
+    """
+    if orjson is not None:
+        return orjson.dumps(data) # pylint: disable=no-member
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def file_list(file_info):
+    """Get the file infos of an object as a list.
+
+    Parameters:
+        file_info (dict, list): File info of one uploaded file, a list of
+                                them or ``None`` for no files.
+    """
+    if not file_info:
+        return []
+    return list(file_info) if isinstance(file_info, (list, tuple)) \
+        else [file_info]
+
+class Lookup():
+    """Reference to a value list item or object."""
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("item", "version")
+
+    def __init__(self, item, version=-1):
+        self.item = item
+        self.version = version
+
+    def to_dict(self):
+        """Get lookup as M-Files expects it."""
+        return {"Item": self.item, "Version": self.version}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Get lookup from a lookup dict returned by M-Files."""
+        return cls(data["Item"], data.get("Version", -1))
+
+class PropertyValue():
+    """Property value of an object.
+
+    Parameters:
+        property_def (int): Property definition ID.
+        data_type (int): M-Files datatype of the property.
+        value (any): Value. For lookup datatypes the value list item ID or a
+                     ``Lookup``, a list of them for multi-select lookups.
+    """
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("property_def", "data_type", "value")
+
+    def __init__(self, property_def, data_type, value):
+        self.property_def = property_def
+        self.data_type = data_type
+        if data_type in LOOKUP_DATATYPES:
+            if isinstance(value, list):
+                value = [lookup if isinstance(lookup, Lookup)
+                         else Lookup(lookup) for lookup in value]
+            elif value is not None and not isinstance(value, Lookup):
+                value = Lookup(value)
+        self.value = value
+
+    def to_dict(self):
+        """Get property value as M-Files expects it."""
+        typed_value = {"DataType": self.data_type}
+        if isinstance(self.value, Lookup):
+            typed_value["Lookup"] = self.value.to_dict()
+        elif self.data_type in LOOKUP_DATATYPES and \
+                isinstance(self.value, list):
+            typed_value["Lookups"] = [lookup.to_dict()
+                                      for lookup in self.value]
+        else:
+            typed_value["Value"] = self.value
+        return {"PropertyDef": self.property_def, "TypedValue": typed_value}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Get property value from a property value dict returned by M-Files.
+
+        Lookups become ``Lookup`` objects, multi-select lookups a list of
+        them.
+        """
+        typed_value = data["TypedValue"]
+        if typed_value.get("Lookup"):
+            value = Lookup.from_dict(typed_value["Lookup"])
+        elif "Lookups" in typed_value:
+            value = [Lookup.from_dict(lookup)
+                     for lookup in typed_value["Lookups"] or ()]
+        else:
+            value = typed_value.get("Value")
+        return cls(data["PropertyDef"], typed_value["DataType"], value)
+
+class ObjectCreation():
+    """Object to be created in M-Files.
+
+    Parameters:
+        name (str): Name of new object.
+        object_class (int): Object class ID.
+        properties (list): Additional ``PropertyValue`` objects or property
+                           value dicts.
+        files (dict, list): File info dict of an uploaded file, or a list of
+                            them. Defaults to no files.
+    """
+    __slots__ = ("name", "object_class", "properties", "files")
+
+    def __init__(self, name, object_class, properties=(), files=None):
+        self.name = name
+        self.object_class = object_class
+        self.properties = list(properties)
+        self.files = file_list(files)
+
+    def to_dict(self):
+        """Get object as M-Files expects it."""
+        properties = [
+            PropertyValue(NAME_PROPERTY, TEXT_DATATYPE, self.name).to_dict(),
+            PropertyValue(CLASS_PROPERTY, LOOKUP_DATATYPE_ID,
+                          self.object_class).to_dict()
+        ]
+        properties.extend(prop.to_dict() if isinstance(prop, PropertyValue)
+                          else prop for prop in self.properties)
+        return {"PropertyValues": properties, "Files": self.files}
+
+    def to_json(self):
+        """Get object as JSON bytes."""
+        return dumps(self.to_dict())
+
+def build_property(property_info, property_value):
+    """Build a property value as M-Files expects it.
+
+    For lookup datatypes ``property_value`` is the ID of the value list item.
+    """
+    return PropertyValue(property_info["ID"], property_info["DataType"],
+                         property_value).to_dict()
+
+def build_object(name, object_class, properties, file_info=None):
+    """Build an object for object creation as M-Files expects it.
+
+    ``file_info`` is the file info of one uploaded file, a list of them or
+    ``None``, see ``create_object()``.
+    """
+    return ObjectCreation(name, object_class, properties,
+                          file_info).to_dict()
+
+class PropertyTemplate():
+    """Compiled object template for one object type, class and property set.
+
+    The JSON of everything but the varying values is rendered once, so
+    building an object only serializes the values themselves.
+
+    Parameters:
+        property_infos (list): Property definitions, in the order values
+                               are supplied to ``build()``.
+        object_type (int): Object type ID.
+        object_class (int): Object class ID.
+    """
+    __slots__ = ("property_infos", "owners", "value_lists", "_head",
+                 "_class", "_fragments")
+
+    def __init__(self, property_infos, object_type, object_class):
+        self.property_infos = list(property_infos)
+        self.owners = [object_class, object_type]
+        self.value_lists = {info["ValueList"] for info in self.property_infos
+                            if info["DataType"] in LOOKUP_DATATYPES}
+        self._head = b'{"PropertyValues":[{"PropertyDef":%d,' \
+            b'"TypedValue":{"DataType":%d,"Value":' % \
+            (NAME_PROPERTY, TEXT_DATATYPE)
+        self._class = b'}},' + dumps(PropertyValue(
+            CLASS_PROPERTY, LOOKUP_DATATYPE_ID, object_class).to_dict())
+        self._fragments = []
+        for info in self.property_infos:
+            prefix = b',{"PropertyDef":%d,"TypedValue":{"DataType":%d,' % \
+                (info["ID"], info["DataType"])
+            if info["DataType"] in LOOKUP_DATATYPES:
+                prefix += b'"Lookup":{"Item":'
+                suffix = b',"Version":-1}}}'
+            else:
+                prefix += b'"Value":'
+                suffix = b'}}'
+            self._fragments.append((prefix, suffix))
+
+    def _values(self, values, get_value_id):
+        for info, value in zip(self.property_infos, values):
+            if info["DataType"] in LOOKUP_DATATYPES:
+                value = get_value_id(value, info["ValueList"], self.owners)
+            yield value
+
+    def build(self, values, get_value_id):
+        """Build property values for one object.
+
+        Parameters:
+            values (iterable): Property values, in template order.
+            get_value_id (callable): Function resolving a lookup value as
+                                     ``get_value_id(value, list_id, owners)``.
+
+        Returns:
+            list: Property values as M-Files expects them.
+        """
+        return [build_property(info, value) for info, value in
+                zip(self.property_infos, self._values(values, get_value_id))]
+
+    def build_json(self, name, values, file_info, get_value_id):
+        """Build the JSON for creating one object.
+
+        Parameters:
+            name (str): Name of new object.
+            values (iterable): Property values, in template order.
+            file_info (dict, list): File information, or a list of it for
+                                    several files, see ``create_object()``.
+            get_value_id (callable): Function resolving lookup values.
+
+        Returns:
+            bytes: Object creation request body.
+        """
+        parts = [self._head, dumps(name), self._class]
+        resolved = self._values(values, get_value_id)
+        for (prefix, suffix), value in zip(self._fragments, resolved):
+            parts.extend((prefix, dumps(value), suffix))
+        parts.extend((b'],"Files":', dumps(file_list(file_info)), b"}"))
+        return b"".join(parts)
+
+class PropertyResolver():
+    """Resolves property values of objects in batches.
+
+    Templates are compiled per object type, class and set of property names
+    and reused until the cached property definitions expire.
+
+    Parameters:
+        client (MFilesClient): Client used for structure and value list
+                               lookups.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = Lock()
+        self._templates = {}
+
+    def template(self, object_type, object_class, property_names):
+        """Get the compiled template for a set of properties.
+
+        Parameters:
+            object_type (int): Object type ID.
+            object_class (int): Object class ID.
+            property_names (iterable): Property names.
+
+        Raises:
+            MFilesException: If a property name can't be found.
+
+        Returns:
+            PropertyTemplate: The compiled template.
+        """
+        key = (object_type, object_class, tuple(property_names))
+        with self._lock:
+            if not self.client.structure.fresh("property"):
+                # Property definitions may have changed
+                self._templates = {}
+            template = self._templates.get(key)
+        if template is None:
+            infos = [self.client.get_info(name, "property")
+                     for name in key[2]]
+            template = PropertyTemplate(infos, object_type, object_class)
+            with self._lock:
+                self._templates[key] = template
+        return template
+
+    def resolve(self, object_type, object_class, extra_info):
+        """Resolve the properties of one object.
+
+        Parameters:
+            object_type (int): Object type ID.
+            object_class (int): Object class ID.
+            extra_info (dict): Property values by property name.
+
+        Returns:
+            list: Property values as M-Files expects them.
+        """
+        return self.resolve_many([(object_type, object_class, extra_info)])[0]
+
+    def resolve_many(self, objects):
+        """Resolve the properties of a batch of objects in one pass.
+
+        Every value list needed by the batch is indexed with a single fetch
+        before any lookup is made.
+
+        Parameters:
+            objects (iterable): Items on form ``(object_type, object_class,
+                                extra_info)`` with numeric type and class.
+
+        Returns:
+            list: List of property value lists, one per object.
+        """
+        objects = list(objects)
+        templates = self.prepare(objects)
+        return [template.build(obj[2].values(), self.client.get_value_id)
+                for template, obj in zip(templates, objects)]
+
+    def prepare(self, objects):
+        """Compile templates and index the value lists of a batch.
+
+        Parameters:
+            objects (iterable): Items on form ``(object_type, object_class,
+                                extra_info)`` with numeric type and class.
+
+        Returns:
+            list: ``PropertyTemplate`` for each object.
+        """
+        templates = [self.template(obj_type, obj_class, extra_info)
+                     for obj_type, obj_class, extra_info in objects]
+        index = self.client.value_list_index
+        for list_id in set().union(*[template.value_lists
+                                     for template in templates]):
+            if not index.fresh(list_id):
+                index.items(list_id)
+        return templates
+
+    def build_json(self, name, object_type, object_class, extra_info,
+                   file_info):
+        """Build the JSON for creating one object.
+
+        Parameters:
+            name (str): Name of new object.
+            object_type (int): Object type ID.
+            object_class (int): Object class ID.
+            extra_info (dict): Property values by property name.
+            file_info (dict, list): File information, see
+                                    ``create_object()``.
+
+        Returns:
+            bytes: Object creation request body.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        template = self.template(object_type, object_class, extra_info)
+        return template.build_json(name, extra_info.values(), file_info,
+                                   self.client.get_value_id)
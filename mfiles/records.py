@@ -0,0 +1,250 @@
+"""Typed records for object metadata.
+
+Search results and object information are nested dicts. ``ObjectVersion``
+wraps such a dict and decodes its parts on first access, so code reads
+``item.id`` and ``item.files[0].id`` instead of walking the dict::
+
+    for item in map(ObjectVersion, client.iter_search("o=0")):
+        client.download_file(item.title, item.type, item.id,
+                             item.files[0].id, item.version)
+
+``ObjectVersionBatch`` holds many object versions in columns: IDs in
+arrays of integers and every object as compact JSON bytes, which takes a
+fraction of the memory of the dicts. Records and the raw dicts are
+decoded from a batch on demand.
+"""
+
+# Standard modules
+from array import array
+import json
+
+# Internal modules
+from mfiles.properties import PropertyValue, dumps
+
+class ObjVer():
+    """Object type, ID and version.
+
+    Parameters:
+        object_type (int): Object type ID.
+        object_id (int): Object ID.
+        version (int): Object version.
+    """
+    __slots__ = ("type", "id", "version")
+
+    def __init__(self, object_type, object_id, version):
+        self.type = object_type
+        self.id = object_id # pylint: disable=invalid-name
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, data):
+        """Get object version from an ``ObjVer`` dict."""
+        return cls(data["Type"], data["ID"], data["Version"])
+
+    def to_dict(self):
+        """Get object version as M-Files expects it."""
+        return {"Type": self.type, "ID": self.id, "Version": self.version}
+
+    def __eq__(self, other):
+        return isinstance(other, ObjVer) and \
+            (self.type, self.id, self.version) == \
+            (other.type, other.id, other.version)
+
+    def __hash__(self):
+        return hash((self.type, self.id, self.version))
+
+    def __repr__(self):
+        return "ObjVer(%r, %r, %r)" % (self.type, self.id, self.version)
+
+class FileInfo():
+    """File of an object version, decoded from the raw dict on access.
+
+    Parameters:
+        raw (dict): File information returned by M-Files.
+    """
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    @property
+    def id(self): # pylint: disable=invalid-name
+        """File ID."""
+        return self.raw["ID"]
+
+    @property
+    def name(self):
+        """File name without extension."""
+        return self.raw.get("Name") or self.raw.get("Title")
+
+    @property
+    def extension(self):
+        """File extension without the dot."""
+        return self.raw.get("Extension")
+
+    @property
+    def size(self):
+        """File size in bytes."""
+        return self.raw.get("Size")
+
+    @property
+    def version(self):
+        """File version."""
+        return self.raw.get("Version")
+
+class ObjectVersion():
+    """Object version, decoded from the raw dict on access.
+
+    Item access and ``get()`` read the raw dict, so a record can be used
+    where a dict is expected.
+
+    Parameters:
+        raw (dict): Object version returned by M-Files, e.g. a search result
+                    item.
+    """
+    __slots__ = ("raw", "_obj_ver", "_files", "_properties")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._obj_ver = None
+        self._files = None
+        self._properties = None
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def get(self, key, default=None):
+        """Get a field of the raw dict."""
+        return self.raw.get(key, default)
+
+    def __repr__(self):
+        return "ObjectVersion(%r, %r)" % (self.obj_ver, self.title)
+
+    @property
+    def obj_ver(self):
+        """Object type, ID and version as an ``ObjVer``."""
+        if self._obj_ver is None:
+            self._obj_ver = ObjVer.from_dict(self.raw["ObjVer"])
+        return self._obj_ver
+
+    @property
+    def type(self):
+        """Object type ID."""
+        return self.obj_ver.type
+
+    @property
+    def id(self): # pylint: disable=invalid-name
+        """Object ID."""
+        return self.obj_ver.id
+
+    @property
+    def version(self):
+        """Object version."""
+        return self.obj_ver.version
+
+    @property
+    def title(self):
+        """Object title."""
+        return self.raw.get("Title")
+
+    @property
+    def object_class(self):
+        """Class ID, ``None`` if not included."""
+        return self.raw.get("Class")
+
+    @property
+    def deleted(self):
+        """True if the object is deleted."""
+        return bool(self.raw.get("Deleted"))
+
+    @property
+    def last_modified(self):
+        """Last modification time as returned by M-Files."""
+        return self.raw.get("LastModifiedUtc") or self.raw.get("LastModified")
+
+    @property
+    def files(self):
+        """Files as a list of ``FileInfo``."""
+        if self._files is None:
+            self._files = [FileInfo(file_info)
+                           for file_info in self.raw.get("Files", [])]
+        return self._files
+
+    @property
+    def properties(self):
+        """Property values as a list of ``PropertyValue``, if included."""
+        if self._properties is None:
+            self._properties = [PropertyValue.from_dict(value)
+                                for value in self.raw.get("Properties", [])]
+        return self._properties
+
+class ObjectVersionBatch():
+    """Columnar store of many object versions.
+
+    Types, IDs, versions and classes are kept in integer arrays and titles
+    in a list, every object version itself as compact JSON bytes.
+
+    Parameters:
+        items (iterable, dict): Object versions, records or a search result.
+
+    Attributes:
+        types (array): Object type IDs.
+        ids (array): Object IDs.
+        versions (array): Object versions.
+        classes (array): Class IDs, -1 if not included.
+        titles (list): Object titles.
+    """
+
+    def __init__(self, items=()):
+        self.types = array("q")
+        self.ids = array("q")
+        self.versions = array("q")
+        self.classes = array("q")
+        self.titles = []
+        self._data = []
+        self.extend(items)
+
+    def extend(self, items):
+        """Add object versions."""
+        if isinstance(items, dict):
+            items = items["Items"]
+        for item in items:
+            self.append(item)
+
+    def append(self, item):
+        """Add an object version, a dict or an ``ObjectVersion``."""
+        raw = item.raw if isinstance(item, ObjectVersion) else item
+        obj_ver = raw["ObjVer"]
+        self.types.append(obj_ver["Type"])
+        self.ids.append(obj_ver["ID"])
+        self.versions.append(obj_ver["Version"])
+        object_class = raw.get("Class")
+        self.classes.append(-1 if object_class is None else object_class)
+        self.titles.append(raw.get("Title"))
+        self._data.append(dumps(raw))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, index):
+        return ObjectVersion(self.raw(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def raw(self, index):
+        """Decode the raw dict of the object version at ``index``."""
+        return json.loads(self._data[index])
+
+    def obj_ver(self, index):
+        """Get the ``ObjVer`` at ``index`` without decoding the object."""
+        return ObjVer(self.types[index], self.ids[index],
+                      self.versions[index])
+
+    def find(self, object_type, object_id):
+        """Get the index of an object, ``None`` if not in the batch."""
+        for index, found in enumerate(self.ids):
+            if found == object_id and self.types[index] == object_type:
+                return index
+        return None
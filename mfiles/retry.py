@@ -0,0 +1,179 @@
+"""Retry policy for M-Files requests.
+
+Transient failures (connection errors, ``429``, ``502``, ``503`` and ``504``
+responses) are retried with exponential backoff and jitter. A retry budget
+shared by all requests of a client keeps a struggling server from being
+flooded with retries.
+"""
+
+# Standard modules
+import random
+from threading import Lock
+import time
+
+# External modules
+import requests
+from urllib3.exceptions import NewConnectionError
+
+# Methods that can safely be sent again
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+
+# Statuses meaning the request was rejected without being processed
+REJECTED_STATUSES = (429, 503)
+
+# Statuses worth retrying for idempotent requests
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Statuses meaning the authentication token may be invalid or expired
+AUTH_STATUSES = (401, 403)
+
+# Texts of 403 responses meaning the session is missing or expired
+SESSION_ERRORS = ("not authenticated", "login to application failed",
+                  "authentication token", "expired")
+
+def session_expired(status, body):
+    """Check if a response rejects the authentication token.
+
+    M-Files also answers ``403`` when the user lacks permissions, so a
+    ``403`` only counts when its body tells of a missing or expired session.
+
+    Parameters:
+        status (int): Response status.
+        body (bytes): Response body.
+
+    Returns:
+        bool: True if logging in again may help.
+    """
+    if status == 401:
+        return True
+    if status != 403:
+        return False
+    text = body.decode(errors="replace").lower()
+    return any(error in text for error in SESSION_ERRORS)
+
+def connect_failed(error):
+    """Check if a connection error happened before the request was sent."""
+    reason = getattr(error.args[0] if error.args else None, "reason", None)
+    return isinstance(error, requests.ConnectTimeout) or \
+        isinstance(reason, NewConnectionError)
+
+class RetryPolicy():
+    """Retry policy with exponential backoff, jitter and a retry budget.
+
+    Non-idempotent requests (``POST``, e.g. object creation) are only
+    retried when the server certainly did not process them: when the
+    connection could not be made or the server answered ``429`` or ``503``.
+    This avoids creating duplicate objects.
+
+    Parameters:
+        retries (int): Maximum number of retries per request. Defaults to 3.
+        backoff (float): Delay in seconds before the first retry, doubled
+                         for every following retry. Defaults to 0.5.
+        max_backoff (float): Maximum delay in seconds. Defaults to 30.
+        jitter (bool): Randomize delays to spread out retries from many
+                       clients. Defaults to True.
+        budget (float): Maximum number of retries that can be spent in a
+                        burst. Defaults to 10.
+        budget_ratio (float): Retry tokens earned per successful request.
+                              Defaults to 0.1, i.e. at most one retry per
+                              ten requests in the long run.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, jitter=True,
+                 budget=10, budget_ratio=0.1):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        self._tokens = budget
+        self._lock = Lock()
+
+    def should_retry(self, method, attempt, status=None, connect_error=False):
+        """Decide whether a failed request should be retried.
+
+        A positive answer spends one token of the retry budget.
+
+        Parameters:
+            method (str): HTTP method of the request.
+            attempt (int): Number of retries already made.
+            status (int): Response status, ``None`` if no response.
+            connect_error (bool): True if the connection could not be made.
+
+        Returns:
+            bool: True if the request should be retried.
+        """
+        if attempt >= self.retries:
+            return False
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        if status is None:
+            retryable = connect_error or idempotent
+        elif idempotent:
+            retryable = status in RETRY_STATUSES
+        else:
+            retryable = status in REJECTED_STATUSES
+        if not retryable:
+            return False
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        return True
+
+    def record_success(self):
+        """Earn retry budget for a successful request."""
+        with self._lock:
+            self._tokens = min(self.budget, self._tokens + self.budget_ratio)
+
+    def delay(self, attempt):
+        """Get seconds to wait before retry number ``attempt`` (from 0)."""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+class RequestAttempts():
+    """Retry and token renewal state of one request.
+
+    Both clients send a request in a loop until it succeeds or can't be
+    retried, this keeps track of the attempts made.
+
+    Parameters:
+        policy (RetryPolicy): Retry policy of the client.
+        method (str): HTTP method of the request.
+        data (any): Request body. A streamed body can't be sent again, so
+                    the request is never retried.
+    """
+
+    def __init__(self, policy, method, data=None):
+        self.policy = policy
+        self.method = method
+        self.replayable = data is None or isinstance(data, (str, bytes))
+        self.started = time.perf_counter()
+        self.count = 0
+        self.renewed = False
+
+    def should_retry(self, status=None, connect_error=False):
+        """Decide whether a failed attempt should be retried.
+
+        See ``RetryPolicy.should_retry()``.
+        """
+        return self.replayable and self.policy.should_retry(
+            self.method, self.count, status, connect_error)
+
+    def next_delay(self):
+        """Get seconds to wait before the next attempt, counting it."""
+        delay = self.policy.delay(self.count)
+        self.count += 1
+        return delay
+
+    def done(self, status):
+        """Record the final status of the request."""
+        if status < 400:
+            self.policy.record_success()
+
+# Policy that never retries
+NO_RETRY = RetryPolicy(retries=0)
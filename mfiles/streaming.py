@@ -0,0 +1,166 @@
+"""Incremental decoding of large JSON responses.
+
+Value list and search responses hold their results in an ``Items`` array
+that can be very large. ``ItemStream`` decodes such a response from its
+chunks as they arrive and yields the entries of ``Items`` one at a time,
+so only one item is held in memory and a caller can stop reading early::
+
+    stream = client.value_list_items(101, stream=True)
+    customer = next(item for item in stream if item["Name"] == "ACME")
+
+Only the standard ``json`` module is used, every item is decoded with
+``json.JSONDecoder.raw_decode`` as soon as it is complete.
+"""
+
+# Standard modules
+import codecs
+import json
+import re
+
+# Internal modules
+from mfiles.errors import MFilesException
+
+# Bytes read from the response at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Characters that may follow the decoded part of a number split across chunks
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+_MISSING = object()
+
+class ItemStream():
+    """Read-once view of a JSON object whose ``Items`` are decoded lazily.
+
+    Supports ``get()`` and item access like the dict ``get()`` returns, but
+    the items can only be iterated once. Fields after the items are read
+    when asked for, skipping items not iterated yet.
+
+    Parameters:
+        chunks (iterable): Response body as chunks of bytes.
+        key (str): Name of the array to stream. Defaults to ``"Items"``.
+        close (callable): Called once the body has been read or the
+                          iteration is stopped, e.g. ``response.close``.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, chunks, key="Items", close=None):
+        self.key = key
+        self.fields = {}
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._close = close
+        self._iterator = None
+        self._done = False
+
+    def __iter__(self):
+        if self._iterator is not None:
+            raise MFilesException("Items can only be read once")
+        self._iterator = self._items()
+        return self._iterator
+
+    def get(self, key, default=None):
+        """Get the items iterator for ``key``, or another field."""
+        if key == self.key:
+            return iter(self)
+        if not self._done:
+            for _item in self._iterator or iter(self):
+                pass
+        return self.fields.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def close(self):
+        """Stop reading and release the response."""
+        if self._iterator is not None:
+            self._iterator.close()
+        if not self._done:
+            self._done = True
+            if self._close is not None:
+                self._close()
+
+    def _fill(self):
+        """Read the next chunk, False at the end of the body."""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        if self._pos > STREAM_CHUNK_SIZE:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += self._text.decode(chunk)
+        return True
+
+    def _peek(self):
+        """Skip whitespace and get the next character, "" at the end."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, characters):
+        character = self._peek()
+        if not character or character not in characters:
+            raise MFilesException("Invalid JSON response, expected %s at %r"
+                                  % (characters, character))
+        self._pos += 1
+        return character
+
+    def _value(self):
+        """Decode the next complete JSON value."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as error:
+                if self._fill():
+                    continue
+                raise MFilesException("Invalid JSON response: %s" % error) \
+                    from error
+            # A number at the end of the buffer may continue in the next
+            # chunk, e.g. "1." is decoded as 1 until the "5" arrives
+            if isinstance(value, (int, float)) and \
+                    _NUMBER_TAIL.match(self._buffer, end).end() == \
+                    len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _array(self):
+        """Yield the values of the array at the current position."""
+        self._pos += 1
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def _items(self):
+        try:
+            self._expect("{")
+            if self._peek() == "}":
+                self._pos += 1
+                return
+            while True:
+                name = self._value()
+                self._expect(":")
+                if name == self.key and self._peek() == "[":
+                    yield from self._array()
+                else:
+                    self.fields[name] = self._value()
+                if self._expect(",}") == "}":
+                    return
+        finally:
+            self._done = True
+            if self._close is not None:
+                self._close()
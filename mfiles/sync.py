@@ -0,0 +1,245 @@
+"""Incremental mirror of vault objects and files.
+
+``VaultMirror`` keeps a local copy of the objects matching a search, with
+their metadata in a SQLite state store and their files in a directory
+tree ``<directory>/<object type>/<object ID>/``::
+
+    mirror = VaultMirror(client, "mirror")
+    summary = mirror.sync()
+
+The first sync fetches everything. Later syncs only search for objects
+modified since the newest modification seen (the high-water mark) and
+compare object versions with the state store, so their cost depends on
+what changed, not on the size of the vault. Applying a change is
+idempotent: objects and files already at the stored version are skipped,
+so an interrupted sync is simply run again.
+"""
+
+# Standard modules
+import json
+import os
+from os.path import basename, isfile, join
+import shutil
+import sqlite3
+from urllib.parse import quote
+
+# Internal modules
+from mfiles.bulk import DEFAULT_WORKERS, run_parallel
+from mfiles.cache import DEFAULT_PAGE_SIZE
+from mfiles.transfer import download_tasks, part_file
+
+# Property ID of the last modification time of an object
+LAST_MODIFIED_PROPERTY = 21
+
+class SyncState():
+    """SQLite store of the mirrored objects and the high-water mark.
+
+    Parameters:
+        path (str): Database file path.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS mirror_state ("
+                         "name TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS mirror_objects ("
+                         "type INTEGER, id INTEGER, version INTEGER, "
+                         "deleted INTEGER, data TEXT, "
+                         "PRIMARY KEY (type, id))")
+        self._db.commit()
+
+    def get_value(self, name):
+        """Get a stored value, ``None`` if not set."""
+        row = self._db.execute("SELECT value FROM mirror_state WHERE name = ?",
+                               (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_value(self, name, value):
+        """Store a value."""
+        self._db.execute("INSERT OR REPLACE INTO mirror_state VALUES (?, ?)",
+                         (name, value))
+        self._db.commit()
+
+    def get_object(self, object_type, object_id):
+        """Get the stored object version, ``None`` if not mirrored."""
+        row = self._db.execute("SELECT data FROM mirror_objects "
+                               "WHERE type = ? AND id = ?",
+                               (object_type, object_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_object(self, item):
+        """Store an object version."""
+        obj_ver = item["ObjVer"]
+        self._db.execute(
+            "INSERT OR REPLACE INTO mirror_objects VALUES (?, ?, ?, ?, ?)",
+            (obj_ver["Type"], obj_ver["ID"], obj_ver["Version"],
+             int(bool(item.get("Deleted"))), json.dumps(item)))
+        self._db.commit()
+
+    def objects(self, deleted=False):
+        """Yield all stored object versions.
+
+        Parameters:
+            deleted (bool): Include deleted objects.
+        """
+        query = "SELECT data FROM mirror_objects"
+        if not deleted:
+            query += " WHERE deleted = 0"
+        for row in self._db.execute(query):
+            yield json.loads(row[0])
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+def _modified(item):
+    """Get the last modification time of an object version."""
+    return item.get("LastModifiedUtc") or item.get("LastModified")
+
+class VaultMirror():
+    """Incremental mirror of the objects matching a search.
+
+    Parameters:
+        client (MFilesClient): Client to search and download with.
+        directory (str): Directory to mirror files to.
+        query (str): Search query selecting the objects, e.g. ``"o=0"``.
+                     Defaults to all objects.
+        state_path (str): Path of the state store. Defaults to
+                          ``.mirror.db`` in ``directory``.
+        workers (int): Number of objects transferred in parallel. Defaults
+                       to 8.
+        page_size (int): Search results fetched per request. Defaults to
+                         1000.
+    """
+
+    def __init__(self, client, directory, query="", state_path=None,
+                 workers=DEFAULT_WORKERS, page_size=DEFAULT_PAGE_SIZE):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.client = client
+        self.directory = directory
+        self.query = query
+        self.workers = workers
+        self.page_size = page_size
+        os.makedirs(directory, exist_ok=True)
+        self.state = SyncState(state_path or join(directory, ".mirror.db"))
+
+    def path(self, object_type, object_id):
+        """Get the directory of the files of an object."""
+        return join(self.directory, str(object_type), str(object_id))
+
+    def changes(self):
+        """Yield objects created, changed or deleted since the last sync.
+
+        Objects modified at the high-water mark itself are searched again,
+        so changes made in the same instant as the last sync are not missed.
+        Versions already in the state store are left out.
+
+        Yields:
+            tuple: ``(item, stored)`` with the object version found and the
+            version in the state store, ``None`` for new objects.
+        """
+        conditions = [self.query] if self.query else []
+        high_water_mark = self.state.get_value("last_modified")
+        if high_water_mark:
+            conditions.append("p%d>>=%s" % (LAST_MODIFIED_PROPERTY,
+                                             quote(high_water_mark)))
+        conditions.append("d=include")
+        for item in self.client.iter_search("&".join(conditions),
+                                            self.page_size, prefetch=True):
+            obj_ver = item["ObjVer"]
+            stored = self.state.get_object(obj_ver["Type"], obj_ver["ID"])
+            if stored is not None and \
+                    stored["ObjVer"]["Version"] == obj_ver["Version"] and \
+                    bool(stored.get("Deleted")) == bool(item.get("Deleted")):
+                continue
+            if stored is None and item.get("Deleted"):
+                continue
+            yield item, stored
+
+    def _apply(self, change):
+        """Bring the local files of an object up to date.
+
+        Files whose ID and file version match the stored object version and
+        exist locally are kept, others are downloaded or removed.
+        """
+        item, stored = change
+        obj_ver = item["ObjVer"]
+        folder = self.path(obj_ver["Type"], obj_ver["ID"])
+        if item.get("Deleted"):
+            shutil.rmtree(folder, ignore_errors=True)
+            return "deleted"
+        previous = {file_info["ID"]: file_info.get("Version")
+                    for file_info in (stored or {}).get("Files", [])
+                    if not stored.get("Deleted")}
+        os.makedirs(folder, exist_ok=True)
+        keep = set()
+        for task, file_info in zip(download_tasks([item], self.directory),
+                                   item["Files"]):
+            keep.add(basename(task["path"]))
+            if isfile(task["path"]) and file_info["ID"] in previous and \
+                    previous[file_info["ID"]] == file_info.get("Version"):
+                continue
+            part_path, resume = part_file(task)
+            self.client.download_file(part_path, obj_ver["Type"],
+                                      obj_ver["ID"], task["file_id"],
+                                      obj_ver["Version"], resume=resume)
+            os.replace(part_path, task["path"])
+        for name in os.listdir(folder):
+            if name not in keep:
+                os.remove(join(folder, name))
+        return "created" if stored is None else "changed"
+
+    def sync(self, progress=None):
+        """Apply all changes since the last sync.
+
+        The high-water mark only advances when every change was applied,
+        failed objects are retried by the next sync.
+
+        Parameters:
+            progress (callable): Optional callback called as
+                                 ``progress(done, failed)`` after each
+                                 object.
+
+        Returns:
+            dict: Counts of ``created``, ``changed``, ``deleted`` and
+            ``failed`` objects, and the ``errors`` by ``(type, id)``.
+        """
+        summary = {"created": 0, "changed": 0, "deleted": 0, "failed": 0,
+                   "errors": {}}
+        high_water_mark = self.state.get_value("last_modified")
+        newest = high_water_mark
+        done = 0
+        for result in run_parallel(self.client.threaded(self._apply),
+                                   self.changes(), self.workers):
+            item = result.item[0]
+            obj_ver = item["ObjVer"]
+            done += 1
+            if result.error is not None:
+                summary["failed"] += 1
+                summary["errors"][(obj_ver["Type"], obj_ver["ID"])] = \
+                    str(result.error)
+            else:
+                summary[result.result] += 1
+                self.state.put_object(item)
+            modified = _modified(item)
+            if modified and (newest is None or modified > newest):
+                newest = modified
+            if progress is not None:
+                progress(done, summary["failed"])
+        if not summary["failed"] and newest != high_water_mark:
+            self.state.set_value("last_modified", newest)
+        return summary
+
+    def objects(self):
+        """Yield the metadata of all mirrored objects."""
+        return self.state.objects()
+
+    def close(self):
+        """Close the state store."""
+        self.state.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,82 @@
+"""Authentication tokens shared between processes.
+
+Short-lived tools connecting to the same vault can reuse the token of an
+earlier run instead of logging in every time::
+
+    client = MFilesClient(vault=VAULT, token_cache=TokenCache("~/.mfiles_tokens"))
+
+Tokens are stored in a JSON file readable by the owner only, keyed on a
+hash of server, vault and user. Passwords are never stored. A token that
+has expired is renewed by the client and written back to the file.
+"""
+
+# Standard modules
+import hashlib
+import json
+import os
+from os.path import dirname, expanduser
+from tempfile import mkstemp
+
+def cached_token(client):
+    """Get the token stored for a client in its token cache.
+
+    Parameters:
+        client (MFilesClient, AsyncMFilesClient): Client with ``token_cache``,
+                                                  ``server``, ``vault`` and
+                                                  ``user`` attributes.
+
+    Returns:
+        str: Stored token, ``None`` if there is none or no token cache.
+    """
+    if client.token_cache is None:
+        return None
+    return client.token_cache.get(client.server, client.vault, client.user)
+
+class TokenCache():
+    """File backed store of authentication tokens.
+
+    Parameters:
+        path (str): Path of the token file, created on first use.
+    """
+
+    def __init__(self, path):
+        self.path = expanduser(path)
+
+    @staticmethod
+    def key(server, vault, user):
+        """Get the key of the token for a server, vault and user."""
+        return hashlib.sha256(
+            json.dumps([server, vault, user]).encode()).hexdigest()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as file_stream:
+                return json.load(file_stream)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, server, vault, user):
+        """Get the stored token, ``None`` if there is none."""
+        return self._read().get(self.key(server, vault, user))
+
+    def put(self, server, vault, user, token):
+        """Store a token, ``None`` removes it.
+
+        The file is replaced atomically, so concurrent readers always see a
+        complete file.
+        """
+        tokens = self._read()
+        key = self.key(server, vault, user)
+        if token is None:
+            tokens.pop(key, None)
+        else:
+            tokens[key] = token
+        handle, temporary = mkstemp(prefix=".tokens-",
+                                    dir=dirname(self.path) or ".")
+        try:
+            with os.fdopen(handle, mode="w", encoding="utf-8") as file_stream:
+                json.dump(tokens, file_stream)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.remove(temporary)
+            raise
@@ -0,0 +1,435 @@
+"""File transfers.
+
+Streaming of file content to and from the server in chunks, with
+checksums and progress reporting. ``FileTransferMixin`` holds the file methods
+of ``MFilesClient``.
+"""
+
+# Standard modules
+import hashlib
+from os import PathLike, fspath, fstat, getcwd, listdir, remove
+from os.path import basename, dirname, getsize, isfile, join, splitext
+import re
+import time
+
+# External modules
+import requests
+
+# Internal modules
+from mfiles.errors import MFilesException
+from mfiles.http_cache import is_checked_in
+from mfiles.records import ObjectVersion
+from mfiles.retry import AUTH_STATUSES, RequestAttempts, connect_failed
+
+# Bytes read or written at a time when streaming files
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(file_path, checksum, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Update ``checksum`` with the content of a local file."""
+    with open(file_path, mode="rb") as file_stream:
+        for chunk in iter(lambda: file_stream.read(chunk_size), b""):
+            checksum.update(chunk)
+
+def resume_offset(local_path, resume):
+    """Get the size of a partial download to resume, 0 to start over."""
+    if resume and not hasattr(local_path, "write") and isfile(local_path):
+        return getsize(local_path)
+    return 0
+
+def write_chunk(file_stream, chunk, done, total, checksum, progress):
+    """Write a chunk of a download, returns the number of bytes done."""
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    file_stream.write(chunk)
+    done += len(chunk)
+    if checksum is not None:
+        checksum.update(chunk)
+    if progress is not None:
+        progress(done, total)
+    return done
+
+def write_chunks(response, file_stream, chunk_size, done, total, checksum,
+                 progress):
+    """Write a streamed response body to a file object chunk by chunk."""
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        done = write_chunk(file_stream, chunk, done, total, checksum,
+                           progress)
+    return done
+
+class UploadBody():
+    """Request body streaming a file object in chunks.
+
+    Has a length when the size is known so the request is sent with
+    ``Content-Length``, otherwise it is sent with chunked transfer encoding.
+    """
+
+    def __init__(self, chunks, size=None, progress=None):
+        self.chunks = chunks
+        self.size = size
+        self.progress = progress
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        done = 0
+        for chunk in self.chunks:
+            done += len(chunk)
+            if self.progress is not None:
+                self.progress(done, self.size)
+            yield chunk
+
+def file_size(file_stream):
+    """Get number of bytes left to read in a file object, None if unknown."""
+    try:
+        return fstat(file_stream.fileno()).st_size - file_stream.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def local_name(file_info):
+    """Get the local file name of a file, never containing a directory."""
+    file_name = file_info["Name"]
+    if file_info.get("Extension"):
+        file_name += "." + file_info["Extension"]
+    # Never let a file name escape the target directory
+    return basename(file_name.replace("\\", "/"))
+
+def download_tasks(items, directory):
+    """Turn download items or search results into download tasks.
+
+    Files of search results are put in ``<directory>/<object type>/<object
+    ID>/``, so objects with files of the same name don't overwrite each
+    other.
+    """
+    if isinstance(items, dict):
+        items = items["Items"]
+    for item in items:
+        if not isinstance(item, dict):
+            obj_type, obj_id, file_id, version, local_path = item
+            yield {"path": local_path, "object_type": obj_type,
+                   "object_id": obj_id, "file_id": file_id,
+                   "version": version, "size": None}
+            continue
+        obj_ver = item["ObjVer"]
+        folder = join(directory or getcwd(), str(obj_ver["Type"]),
+                      str(obj_ver["ID"]))
+        for file_info in item["Files"]:
+            yield {"path": join(folder, local_name(file_info)),
+                   "object_type": obj_ver["Type"], "object_id": obj_ver["ID"],
+                   "file_id": file_info["ID"], "version": obj_ver["Version"],
+                   "size": file_info.get("Size")}
+
+def part_file(task):
+    """Get the partial file a download task is streamed to.
+
+    The name of the partial file holds the object, file and version, so
+    only an interrupted download of the same file version is resumed. Other
+    partial files of the same target are removed, as is the partial file of
+    a download without a fixed version, which is never resumed.
+
+    Returns:
+        tuple: Path to the partial file and True if it can be resumed.
+    """
+    key = "%s-%s-%s-%s" % (task["object_type"], task["object_id"],
+                           task["file_id"], task["version"])
+    path = "%s.%s.part" % (task["path"], key)
+    resume = str(task["version"]).isdigit()
+    folder = dirname(task["path"]) or "."
+    pattern = re.compile(re.escape(basename(task["path"])) +
+                         r"(\.[^.]+-[^.]+-[^.]+-[^.]+)?\.part")
+    for name in listdir(folder):
+        if pattern.fullmatch(name) and \
+                (not resume or name != basename(path)):
+            try:
+                remove(join(folder, name))
+            except FileNotFoundError:
+                pass
+    return path, resume
+
+def is_present(task, previous, verify):
+    """Check if the local file of a download task is already up to date."""
+    if not isfile(task["path"]):
+        return False
+    same_file = previous is not None and all(
+        previous.get(key) == task[key]
+        for key in ("object_type", "object_id", "file_id", "version"))
+    if verify == "checksum":
+        if not same_file or not previous.get("sha256"):
+            return False
+        checksum = hashlib.sha256()
+        hash_file(task["path"], checksum)
+        return checksum.hexdigest() == previous["sha256"]
+    if previous is not None and not same_file:
+        # Another version of the file, its size tells nothing
+        return False
+    size = task["size"]
+    if size is None and same_file:
+        size = previous.get("size")
+    return size is not None and getsize(task["path"]) == size
+
+def upload_file_info(file_path, upload_info):
+    """Build file info for object creation from a temporary upload."""
+    object_name, objext_ext = splitext(file_path)
+    return {
+        "UploadID": upload_info["UploadID"],
+        "Title": object_name,
+        "Extension": objext_ext[1:],
+        "Size": upload_info["Size"]
+    }
+
+class FileTransferMixin():
+    """File methods of ``MFilesClient``.
+
+    File content is streamed in chunks of ``chunk_size`` bytes, it is never
+    held in memory as a whole.
+    """
+
+    def upload_temporary_file(self, source, chunk_size=DEFAULT_CHUNK_SIZE,
+                              progress=None):
+        """Upload file content to the temporary upload area of the vault.
+
+        The content is streamed, it is never read into memory as a whole.
+        The returned upload info can be used as ``file_info`` in
+        ``create_object()`` together with ``Title`` and ``Extension``.
+
+        Parameters:
+            source (str, PathLike, file, iterable): Path to file, open binary
+                                                    file or iterable of
+                                                    ``bytes`` chunks.
+            chunk_size (int): Bytes read from files at a time. Defaults to
+                              1 MiB.
+            progress (callable): Optional callback called as
+                                 ``progress(bytes_done, bytes_total)`` after
+                                 each chunk. ``bytes_total`` is ``None`` if
+                                 unknown.
+
+        Raises:
+            MFilesException: If the content can't be uploaded.
+
+        Returns:
+            dict: Upload info with keys ``UploadID`` and ``Size``.
+        """
+        if isinstance(source, (str, PathLike)):
+            response = self._upload_path(fspath(source), chunk_size, progress)
+        else:
+            response = self._upload(source, chunk_size, progress)
+        if response.status_code != 200:
+            raise MFilesException(response.text)
+        return response.json()
+
+    def _upload_path(self, file_path, chunk_size, progress):
+        """Send a local file to the temporary upload area.
+
+        Unlike other streamed bodies a file can be read again, so failures
+        are retried according to ``retry_policy`` and once more after the
+        token has been renewed.
+        """
+        self._ensure_login()
+        attempts = RequestAttempts(self.retry_policy, "POST")
+        while True:
+            auth_headers = self.headers
+            try:
+                with open(file_path, mode="rb") as file_stream:
+                    response = self._upload(file_stream, chunk_size, progress)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if not attempts.should_retry(
+                        connect_error=connect_failed(error)):
+                    raise
+            else:
+                status = response.status_code
+                if status in AUTH_STATUSES and not attempts.renewed and \
+                        self.headers is not auth_headers:
+                    # The token has been renewed, send the file again
+                    attempts.renewed = True
+                    response.close()
+                    continue
+                if status < 400 or not attempts.should_retry(status):
+                    return response
+                response.close()
+            time.sleep(attempts.next_delay())
+
+    def _upload(self, source, chunk_size, progress):
+        """Send file content to the temporary upload area."""
+        if hasattr(source, "read"):
+            chunks = iter(lambda: source.read(chunk_size), b"")
+            body = UploadBody(chunks, file_size(source), progress)
+        else:
+            body = UploadBody(source, progress=progress)
+        if body.size is None:
+            # Sent with chunked transfer encoding
+            body = iter(body)
+        return self._request("POST", self.server + "files", body)
+
+    def upload_file(self, file_path, object_type=0, object_class=0,
+                    extra_info=None, progress=None):
+        """Upload a file to M-Files.
+
+        Parameters:
+            file_path (str): Path to file to upload.
+            object_type (str, int): Object type. If integer, the type will
+                                    not be attempted to be translated. If
+                                    string, the type will be transated into
+                                    the property ID the server expects for the
+                                    given type.
+            object_class (str, int): Object class, same translation principle
+                                     as for object_type.
+            extra_info (dict): Additional object information.
+            progress (callable): Optional upload progress callback, see
+                                 ``upload_temporary_file()``.
+
+        Raises:
+            MFilesException: If the file can't be uploaded.
+
+        Returns:
+            dict: Dictionary with API request result.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # Upload file to temporary storage
+        upload_info = self.upload_temporary_file(file_path, progress=progress)
+
+        # Create object
+        object_name = splitext(file_path)[0]
+        file_info = upload_file_info(file_path, upload_info)
+        obj_info = self.create_object(object_name, object_type, object_class,
+                                      extra_info, file_info)
+        return obj_info
+
+    def delete_temporary_file(self, upload_id):
+        """Discard a file in temporary storage.
+
+        Failures are ignored, the server also discards temporary files
+        when they expire.
+
+        Parameters:
+            upload_id (int): Upload ID from ``upload_temporary_file()``.
+
+        Returns:
+            bool: True if the file was discarded.
+        """
+        request_url = "%sfiles/%s" % (self.server, upload_id)
+        try:
+            response = self._request("DELETE", request_url)
+        except requests.RequestException:
+            return False
+        return response.status_code == 200
+
+    def download_file(self, local_path, object_type, object_id, file_id,
+                      object_version="latest", chunk_size=DEFAULT_CHUNK_SIZE,
+                      resume=False, checksum=None, progress=None, cache=True):
+        """Download a file from M-Files.
+
+        The file is streamed to disk in chunks, so memory use does not depend
+        on the file size. With a ``file_cache`` files of a specific object
+        version are served from the cache. On a miss the file is added to
+        the cache if the version is checked in, a checked out version still
+        changes.
+
+        Parameters:
+            object_type (int): Object type ID.
+            object_id (int): Object ID.
+            file_id (int): File ID.
+            object_version (int, str): Object version. Defaults to
+                                       ``"latest"``.
+            local_path (str, file): Path to download file to, or a writable
+                                    binary file-like object.
+            chunk_size (int): Bytes read from the server at a time. Defaults
+                              to 1 MiB.
+            resume (bool): If True and ``local_path`` is a partially
+                           downloaded file, only the missing bytes are
+                           requested using a HTTP Range header.
+            checksum (hash): Optional ``hashlib`` hash object, updated with
+                             the complete file content while downloading.
+            progress (callable): Optional callback called as
+                                 ``progress(bytes_done, bytes_total)`` after
+                                 each chunk. ``bytes_total`` is ``None`` if
+                                 unknown.
+            cache (bool): Use ``file_cache`` if set. Defaults to True.
+
+        Raises:
+            MFilesException: If the file can't be downloaded.
+
+        Returns:
+            bool: True if file is found and downloaded successfully.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # pylint: disable=too-many-locals
+        key = (self.vault, object_type, object_id, object_version, file_id)
+        if cache and self._file_cacheable(key):
+            size = self.file_cache.read(
+                key, local_path, checksum=checksum, download=lambda path:
+                self.download_file(path, object_type, object_id, file_id,
+                                   object_version, chunk_size, cache=False))
+            if progress is not None:
+                progress(size, size)
+            return True
+        request_url = "%sobjects/%s/%s/%s/files/%s/content" % \
+            (self.server, object_type, object_id, object_version, file_id)
+        is_path = not hasattr(local_path, "write")
+        offset = resume_offset(local_path, resume)
+        headers = {"Range": "bytes=%d-" % offset} if offset else {}
+        with self._request("GET", request_url, headers=headers,
+                           stream=True) as response:
+            if response.status_code == 416 and offset:
+                # Requested range not satisfiable, file already complete
+                if checksum is not None:
+                    hash_file(local_path, checksum)
+                return True
+            if response.status_code == 200:
+                offset = 0
+            elif response.status_code != 206 or not offset:
+                raise MFilesException(response.text)
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length is not None else None
+            if is_path:
+                mode = "ab" if offset else "wb"
+                if offset and checksum is not None:
+                    hash_file(local_path, checksum)
+                with open(local_path, mode=mode) as file_stream:
+                    write_chunks(response, file_stream, chunk_size, offset,
+                                 total, checksum, progress)
+            else:
+                write_chunks(response, local_path, chunk_size, offset, total,
+                             checksum, progress)
+        return True
+
+    def _file_cacheable(self, key):
+        """Check if the file of a ``file_cache`` key can use the cache.
+
+        Only files of checked in versions are added, so a cached file is
+        always current.
+        """
+        if self.file_cache is None or not str(key[3]).isdigit():
+            return False
+        return key in self.file_cache or \
+            is_checked_in(self.get("objects/%s/%s/%s" % key[1:4]))
+
+    def download_file_name(self, file_name, local_path=None):
+        """Download a file from M-Files by its name.
+
+        Caution:
+            This searches for the file and downloads the top
+            result. This is not always guaranteed to be the
+            intended file. A better way is to use search to
+            find the correct file and then use the function
+            ``download_file()`` to download the file by using
+            file and object id.
+
+        Parameters:
+            file_name (str): Name of file to download.
+            local_path (str): Path to download file to. Defaults
+                            to file name and current directory.
+
+        Returns:
+            bool: True if file is found and downloaded.
+        """
+        items = self.quick_search(file_name)
+        if not items:
+            return False
+        item = ObjectVersion(items["Items"][0])
+        local_path = local_path or getcwd() + "\\" + file_name
+        download_ok = self.download_file(local_path=local_path,
+                                         object_type=item.type,
+                                         object_id=item.id,
+                                         file_id=item.files[0].id,
+                                         object_version=item.version)
+        return download_ok
@@ -10,7 +10,8 @@ Documentation: https://mfiles.readthedocs.io/en/latest/
 
 setup(
     name='mfiles',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmark', 'benchmark.*',
+                                    'test', 'test.*']),
     version='0.5.4',
     license='MIT',
     description='M-Files API wrapper',
@@ -22,6 +23,10 @@ setup(
     install_requires=[
         'requests',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
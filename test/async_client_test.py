@@ -0,0 +1,145 @@
+"""Test cases for async_client.py"""
+
+import asyncio
+import io
+
+import pytest
+
+from mfiles.async_client import AsyncMFilesClient
+from mfiles.retry import RetryPolicy
+from benchmark.stub_server import StubServer, VAULT
+
+pytest.importorskip("aiohttp")
+
+TEST_USER = "test_user"
+TEST_PASS = "test_pass"
+
+def test_upload_download(tmp_path):
+    """Test concurrent uploads and downloads against a stub server."""
+    paths = []
+    for i in range(5):
+        path = tmp_path / ("file%d.txt" % i)
+        path.write_bytes(b"content %d" % i * 1000)
+        paths.append(str(path) if i else path)
+    async def run(server):
+        async with AsyncMFilesClient(server.url, TEST_USER, TEST_PASS, VAULT,
+                                     concurrency=2) as client:
+            objs = await asyncio.gather(
+                *[client.upload_file(path, "Document", "Drawing",
+                                     {"Customer": "Initech"})
+                  for path in paths])
+            streams = [io.BytesIO() for _obj in objs]
+            await asyncio.gather(
+                *[client.download_file(stream, obj["ObjVer"]["Type"],
+                                       obj["ObjVer"]["ID"],
+                                       obj["Files"][0]["ID"])
+                  for stream, obj in zip(streams, objs)])
+            found = await client.quick_search("file3")
+            await client.destroy_object(0, objs[0]["ObjVer"]["ID"])
+            return objs, streams, found
+    with StubServer() as server:
+        objs, streams, found = asyncio.run(run(server))
+        logins = [request for request in server.vault.requests
+                  if request[1] == "server/authenticationtokens"]
+    for path, stream in zip(paths, streams):
+        with open(path, mode="rb") as file_stream:
+            assert stream.getvalue() == file_stream.read()
+    assert objs[0]["Properties"][1]["TypedValue"]["Lookup"]["Item"] == 1
+    assert objs[0]["Properties"][2]["TypedValue"]["Lookup"]["Item"] == 2
+    assert len(found["Items"]) == 1
+    assert len(logins) == 1
+
+def test_reauthentication():
+    """Test that downloads are retried and tokens renewed once."""
+    async def run(server, obj):
+        async with AsyncMFilesClient(server.url, TEST_USER, TEST_PASS, VAULT,
+                                     retry_policy=RetryPolicy(backoff=0)) \
+                as client:
+            await client.objects()
+            server.vault.token = "renewed-token"
+            await asyncio.gather(*[client.objects() for _ in range(32)])
+            streams = [io.BytesIO(), io.BytesIO()]
+            server.vault.token = "other-token"
+            await client.download_file(streams[0], 0, obj["ObjVer"]["ID"],
+                                       obj["Files"][0]["ID"])
+            server.vault.failures = [503]
+            await client.download_file(streams[1], 0, obj["ObjVer"]["ID"],
+                                       obj["Files"][0]["ID"])
+            return streams
+    with StubServer() as server:
+        obj = server.vault.add_object(0, "report", b"x" * 1000)
+        streams = asyncio.run(run(server, obj))
+        logins = [request for request in server.vault.requests
+                  if request[1] == "server/authenticationtokens"]
+    assert [stream.getvalue() for stream in streams] == [b"x" * 1000] * 2
+    assert len(logins) == 3
+
+def test_shared_caches():
+    """Test that concurrent tasks fetch structure and value lists once."""
+    async def run(server):
+        async with AsyncMFilesClient(server.url, TEST_USER, TEST_PASS,
+                                     VAULT) as client:
+            await asyncio.gather(
+                *[client.create_object("object %d" % i, "Document", "Drawing",
+                                       {"Customer": "ACME"})
+                  for i in range(20)])
+    with StubServer(value_list_size=5) as server:
+        server.vault.max_page_size = 3
+        asyncio.run(run(server))
+        paths = [request[1] for request in server.vault.requests
+                 if request[0] == "GET"]
+    assert len(server.vault.objects) == 20
+    assert sorted(paths) == ["structure/classes", "structure/objecttypes",
+                             "structure/properties", "valuelists/101/items",
+                             "valuelists/101/items", "valuelists/101/items"]
+
+def test_structure_ttl():
+    """Test that structure expiring at once is fetched for every lookup."""
+    async def run(server):
+        async with AsyncMFilesClient(server.url, TEST_USER, TEST_PASS, VAULT,
+                                     structure_ttl=0) as client:
+            assert await client.translate_name("Drawing", "class") == 1
+            assert len(await client.get_types("class")) == 2
+            assert (await client.get_info_id(1, "class"))["Name"] == "Drawing"
+    with StubServer() as server:
+        asyncio.run(run(server))
+        paths = [request[1] for request in server.vault.requests
+                 if request[0] == "GET"]
+    assert paths == ["structure/classes"] * 3
+
+def test_upload_retry(tmp_path):
+    """Test that uploads from a path are retried and renew the token."""
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(b"scan")
+    async def run(server):
+        async with AsyncMFilesClient(server.url, TEST_USER, TEST_PASS, VAULT,
+                                     retry_policy=RetryPolicy(backoff=0)) \
+                as client:
+            await client.objects()
+            server.vault.token = "renewed-token"
+            server.vault.failures = [503, 503]
+            return await client.upload_temporary_file(str(path))
+    with StubServer() as server:
+        assert asyncio.run(run(server))["Size"] == 4
+        assert not server.vault.failures
+
+def test_create_object_files():
+    """Test creating objects with several files and with none."""
+    async def run(server):
+        async with AsyncMFilesClient(server.url, TEST_USER, TEST_PASS,
+                                     VAULT) as client:
+            uploads = [await client.upload_temporary_file(iter([content]))
+                       for content in (b"first", b"second")]
+            file_info = [{"UploadID": upload["UploadID"], "Title": title,
+                          "Extension": "txt", "Size": upload["Size"]}
+                         for upload, title in zip(uploads, ("a", "b"))]
+            several = await client.create_object("several", 0, 0, None,
+                                                 file_info)
+            empty = await client.create_object("empty")
+            return several, empty
+    with StubServer() as server:
+        several, empty = asyncio.run(run(server))
+        contents = {obj["Title"]: content
+                    for obj, content in server.vault.objects.values()}
+    assert contents == {"several": b"firstsecond", "empty": b""}
+    assert several["ObjVer"]["ID"] != empty["ObjVer"]["ID"]
@@ -0,0 +1,18 @@
+"""Test cases for the benchmark harness."""
+
+from benchmark.run import run_benchmarks
+
+def test_run_benchmarks():
+    """Test a minimal benchmark run."""
+    results = run_benchmarks([3], [100], [2], value_list_size=10)
+    names = [result["benchmark"] for result in results]
+    assert names == ["metadata_cold", "metadata_warm", "upload",
+                     "create_object", "search", "download"]
+    assert all(result["errors"] == 0 for result in results)
+    assert results[1]["requests"] == 0
+
+def test_benchmark_errors():
+    """Test that failed lookups are counted instead of stopping the run."""
+    results = run_benchmarks([2], [10], [1], value_list_size=0)
+    errors = {result["benchmark"]: result["errors"] for result in results}
+    assert errors["metadata_cold"] == 1 and errors["metadata_warm"] == 2
@@ -0,0 +1,113 @@
+"""Test cases for cache.py"""
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from mfiles.cache import StructureCache, ValueListIndex
+
+TYPES = {
+    "object": [{"ID": 0, "Name": "Document"}, {"ID": 9, "Name": "Project"}],
+    "class": [{"ID": 1, "Name": "Drawing"}],
+    "property": [{"ID": 1020, "Name": "Customer", "DataType": 9}]
+}
+
+def counting_fetch():
+    """Create a fetch function recording the categories fetched."""
+    def fetch(category):
+        fetch.calls.append(category)
+        return TYPES[category]
+    fetch.calls = []
+    return fetch
+
+def test_structure_lookup():
+    """Test that lookups by name and ID only fetch once."""
+    fetch = counting_fetch()
+    cache = StructureCache(fetch)
+    assert cache.by_name("object", "Project")["ID"] == 9
+    assert cache.by_id("object", 0)["Name"] == "Document"
+    assert cache.by_name("object", "Missing") is None
+    assert fetch.calls == ["object"]
+    cache.invalidate("object")
+    cache.by_name("object", "Project")
+    assert fetch.calls == ["object", "object"]
+
+def test_structure_snapshot(tmp_path):
+    """Test that a snapshot lets a new cache start warm."""
+    snapshot = str(tmp_path / "structure.json")
+    cache = StructureCache(counting_fetch(), snapshot_path=snapshot)
+    cache.set_scope("server", "vault")
+    cache.refresh()
+    cache.save()
+    fetch = counting_fetch()
+    warm = StructureCache(fetch, snapshot_path=snapshot)
+    warm.set_scope("server", "vault")
+    assert warm.by_name("property", "Customer")["ID"] == 1020
+    assert not fetch.calls
+    other = StructureCache(fetch, snapshot_path=snapshot)
+    other.set_scope("server", "other vault")
+    assert other.by_name("class", "Drawing")["ID"] == 1
+    assert fetch.calls == ["class"]
+
+def test_structure_concurrency(tmp_path):
+    """Test that concurrent misses fetch once and snapshot writes don't fail."""
+    calls = []
+    def fetch(category):
+        calls.append(category)
+        time.sleep(0.01)
+        return TYPES[category]
+    snapshot = str(tmp_path / "structure.json")
+    caches = [StructureCache(fetch, snapshot_path=snapshot) for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = list(executor.map(
+            lambda i: caches[i % 2].by_name("object", "Project")["ID"],
+            range(16)))
+    assert found == [9] * 16
+    assert calls == ["object"] * 2
+    unwritable = StructureCache(
+        fetch, snapshot_path=str(tmp_path / "missing" / "structure.json"))
+    assert unwritable.by_id("class", 1)["Name"] == "Drawing"
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ["structure.json"]
+
+def test_value_list_lookup():
+    """Test owner aware lookups, paging and misses on indexed lists."""
+    items = [
+        {"ID": 1, "Name": "Alpha", "HasOwner": True, "OwnerID": 5},
+        {"ID": 2, "Name": "Alpha", "HasOwner": True, "OwnerID": 6},
+        {"ID": 3, "Name": "Beta", "HasOwner": False, "OwnerID": 0}
+    ]
+    requests = []
+    def fetch(list_id, page, limit, name_filter):
+        requests.append((list_id, page, name_filter))
+        matching = [item for item in items
+                    if name_filter in (None, item["Name"])]
+        start = (page - 1) * limit
+        return {"Items": matching[start:start + limit],
+                "MoreResults": start + limit < len(matching)}
+    index = ValueListIndex(fetch, page_size=2)
+    assert index.lookup(7, "Alpha", [6])["ID"] == 2
+    assert index.lookup(7, "Beta", [])["ID"] == 3
+    assert requests == [(7, 1, None), (7, 2, None)]
+    items.append({"ID": 4, "Name": "Gamma", "HasOwner": False, "OwnerID": 0})
+    assert index.lookup(7, "Gamma", [])["ID"] == 4
+    assert requests[-1] == (7, 1, "Gamma")
+    assert index.stats() == {"hits": 1, "misses": 2, "lists": 1}
+
+def test_value_list_concurrency():
+    """Test that concurrent misses fetch a list once, in capped pages."""
+    items = [{"ID": i, "Name": "Item %d" % i, "HasOwner": False,
+              "OwnerID": 0} for i in range(5)]
+    requests = []
+    def fetch(list_id, page, limit, name_filter):
+        requests.append((list_id, page, name_filter))
+        time.sleep(0.01)
+        limit = min(limit, 2) # Server page size limit
+        start = (page - 1) * limit
+        return {"Items": items[start:start + limit],
+                "MoreResults": start + limit < len(items)}
+    index = ValueListIndex(fetch, page_size=10)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = list(executor.map(
+            lambda _: index.lookup(7, "Item 4", [])["ID"], range(8)))
+    assert found == [4] * 8
+    assert requests == [(7, 1, None), (7, 2, None), (7, 3, None)]
@@ -1,6 +1,17 @@
 """Test cases for client.py"""
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+from threading import current_thread
+
+import pytest
+
 from mfiles.client import MFilesClient
+from mfiles.errors import MFilesException
+from mfiles.retry import RetryPolicy
+from mfiles.token_cache import TokenCache
+from benchmark.stub_server import StubServer, VAULT
 
 TEST_USER = "test_user"
 TEST_PASS = "test_pass"
@@ -8,3 +19,440 @@ TEST_PASS = "test_pass"
 def test_init():
     """Test creation of MFilesClient object."""
     MFilesClient(user=TEST_USER, password=TEST_PASS)
+
+def stub_client(server):
+    """Create client logged in to a stub server."""
+    return MFilesClient(server=server.url, user=TEST_USER, password=TEST_PASS,
+                        vault=VAULT)
+
+def test_download_file(tmp_path):
+    """Test streamed download to path and file object, with checksum."""
+    content = bytes(range(256)) * 100
+    with StubServer() as server:
+        client = stub_client(server)
+        obj = server.vault.add_object(0, "drawing", content)
+        obj_id = obj["ObjVer"]["ID"]
+        file_id = obj["Files"][0]["ID"]
+        local_path = str(tmp_path / "drawing.bin")
+        checksum = hashlib.sha256()
+        progress = []
+        client.download_file(local_path, 0, obj_id, file_id, chunk_size=1000,
+                             checksum=checksum,
+                             progress=lambda done, total: progress.append(done))
+        with open(local_path, mode="rb") as file_stream:
+            assert file_stream.read() == content
+        assert checksum.hexdigest() == hashlib.sha256(content).hexdigest()
+        assert progress[0] == 1000 and progress[-1] == len(content)
+        file_stream = io.BytesIO()
+        client.download_file(file_stream, 0, obj_id, file_id)
+        assert file_stream.getvalue() == content
+
+def test_download_file_resume(tmp_path):
+    """Test resuming a partially downloaded file."""
+    content = b"0123456789" * 1000
+    with StubServer() as server:
+        client = stub_client(server)
+        obj = server.vault.add_object(0, "partial", content)
+        local_path = str(tmp_path / "partial.bin")
+        with open(local_path, mode="wb") as file_stream:
+            file_stream.write(content[:4000])
+        checksum = hashlib.md5()
+        client.download_file(local_path, 0, obj["ObjVer"]["ID"],
+                             obj["Files"][0]["ID"], resume=True,
+                             checksum=checksum)
+        with open(local_path, mode="rb") as file_stream:
+            assert file_stream.read() == content
+        assert checksum.hexdigest() == hashlib.md5(content).hexdigest()
+
+def test_upload_file(tmp_path):
+    """Test streamed uploads from a path and from a generator."""
+    local_path = str(tmp_path / "report.txt")
+    with open(local_path, mode="wb") as file_stream:
+        file_stream.write(b"x" * 5000)
+    with StubServer() as server:
+        client = stub_client(server)
+        progress = []
+        obj = client.upload_file(local_path, progress=lambda done, total:
+                                 progress.append((done, total)))
+        assert obj["Files"][0]["Size"] == 5000
+        assert progress == [(5000, 5000)]
+        upload = client.upload_temporary_file(iter([b"abc", b"def"]))
+        assert upload["Size"] == 6
+        assert server.vault.uploads[upload["UploadID"]] == b"abcdef"
+        (tmp_path / "x").write_bytes(b"path")
+        obj = client.upload_file(tmp_path / "x")
+        assert obj["Files"][0]["Size"] == 4
+
+def test_upload_many(tmp_path):
+    """Test parallel uploads with a failing item."""
+    paths = []
+    for i in range(10):
+        path = tmp_path / ("scan%d.pdf" % i)
+        path.write_bytes(b"%d" % i)
+        paths.append(str(path))
+    items = [(path, "Document", "Drawing", {"Customer": "ACME"})
+             for path in paths]
+    items.append((str(tmp_path / "missing.pdf"),))
+    progress = []
+    items += [tmp_path / "scan0.pdf", 42,
+              (paths[1], "Document", 0, None, lambda *done: progress.append(done))]
+    with StubServer() as server:
+        client = stub_client(server)
+        results = list(client.upload_many(items, workers=4))
+        structure_requests = [request for request in server.vault.requests
+                              if request[1].startswith("structure/")]
+        paths_requested = [request[1] for request in server.vault.requests]
+        list_requests = [path for path in paths_requested
+                         if path.startswith("valuelists/")]
+    errors = sorted((result for result in results if result.error),
+                    key=lambda result: str(result.item))
+    assert len(results) == 14
+    assert [result.item for result in errors] == [items[10], 42]
+    assert progress == [(1, 1)]
+    assert len(structure_requests) == 3
+    # Value lists are indexed before any worker starts
+    assert len(list_requests) == 1
+    assert paths_requested.index(list_requests[0]) < \
+        paths_requested.index("files")
+
+def test_upload_reauthentication(tmp_path):
+    """Test that uploads renew an expired token."""
+    paths = []
+    for i in range(4):
+        path = tmp_path / ("scan%d.pdf" % i)
+        path.write_bytes(b"%d" % i)
+        paths.append(str(path))
+    with StubServer() as server:
+        client = stub_client(server)
+        list(client.upload_many([(paths[0], "Document", "Drawing")]))
+        server.vault.token = "renewed-token"
+        results = list(client.upload_many(
+            [(path, "Document", "Drawing") for path in paths], workers=4))
+        assert not [result for result in results if result.error]
+        server.vault.token = "other-token"
+        with pytest.raises(MFilesException):
+            client.upload_temporary_file(iter([b"abc"]))
+        assert client.upload_temporary_file(iter([b"abc"]))["Size"] == 3
+
+def test_download_many(tmp_path):
+    """Test parallel download of search results and incremental reruns."""
+    manifest_path = str(tmp_path / "manifest.json")
+    with StubServer() as server:
+        client = stub_client(server)
+        for i in range(6):
+            server.vault.add_object(0, "export%d" % i, b"%d" % i * 100)
+        result = client.search("q=export")
+        manifest = client.download_many(result, str(tmp_path / "out"),
+                                        workers=3, verify="checksum",
+                                        manifest_path=manifest_path)
+        assert [entry["status"] for entry in manifest] == ["downloaded"] * 6
+        out = tmp_path / "out" / "0"
+        with open(str(out / "5" / "export4.bin"), mode="rb") as file_stream:
+            assert file_stream.read() == b"4" * 100
+        (out / "3" / "export2.bin").write_bytes(b"corrupt")
+        manifest = client.download_many(result, str(tmp_path / "out"),
+                                        verify="checksum",
+                                        manifest_path=manifest_path)
+        statuses = {entry["path"]: entry["status"] for entry in manifest}
+        assert statuses.pop(str(out / "3" / "export2.bin")) == "downloaded"
+        assert set(statuses.values()) == {"skipped"}
+
+def test_download_many_new_version(tmp_path):
+    """Test that a new version of the same size is downloaded again."""
+    manifest_path = str(tmp_path / "manifest.json")
+    with StubServer() as server:
+        client = stub_client(server)
+        obj = server.vault.add_object(0, "doc", b"old!")
+        client.download_many(client.search("q=doc"), str(tmp_path),
+                             manifest_path=manifest_path)
+        obj["ObjVer"]["Version"] = 2
+        server.vault.objects[(0, obj["ObjVer"]["ID"])] = (obj, b"new!")
+        manifest = client.download_many(client.search("q=doc"), str(tmp_path),
+                                        manifest_path=manifest_path)
+    assert manifest[0]["status"] == "downloaded"
+    assert (tmp_path / "0" / str(obj["ObjVer"]["ID"]) / "doc.bin") \
+        .read_bytes() == b"new!"
+
+def test_download_many_names(tmp_path):
+    """Test that objects with the same file name get separate paths."""
+    with StubServer() as server:
+        client = stub_client(server)
+        server.vault.add_object(0, "report", b"x" * 100000)
+        server.vault.add_object(0, "report", b"y" * 50)
+        server.vault.add_object(0, "../../escape", b"z")
+        manifest = client.download_many(client.search("q="),
+                                        str(tmp_path / "out"))
+        obj_id = manifest[0]["object_id"]
+        duplicate = client.download_many(
+            [(0, obj_id, obj_id, 1, str(tmp_path / "one.bin"))] * 2)
+    assert [entry["status"] for entry in manifest] == ["downloaded"] * 3
+    assert [(tmp_path / "out" / "0" / str(i) / "report.bin").stat().st_size
+            for i in (1, 2)] == [100000, 50]
+    assert (tmp_path / "out" / "0" / "3" / "escape.bin").is_file()
+    assert sorted(entry["status"] for entry in duplicate) == \
+        ["downloaded", "failed"]
+
+def test_download_many_duplicate(tmp_path):
+    """Test that only files sharing a path with an earlier file fail."""
+    with StubServer() as server:
+        client = stub_client(server)
+        obj = server.vault.add_object(0, "file", b"x")
+        obj_id, file_id = obj["ObjVer"]["ID"], obj["Files"][0]["ID"]
+        for position in (0, 2, 5, 10):
+            items = [(0, obj_id, file_id, 1, str(tmp_path / ("f%d" % i)))
+                     for i in range(20)]
+            items.insert(position + 1, items[position])
+            for workers in (1, 2, 4):
+                manifest = client.download_many(items, workers=workers)
+                failed = [entry["path"] for entry in manifest
+                          if entry["status"] == "failed"]
+                assert failed == [str(tmp_path / ("f%d" % position))]
+                assert all("duplicate" not in entry for entry in manifest)
+
+def test_download_many_stale_part(tmp_path):
+    """Test that partial files of other versions are never resumed."""
+    target = tmp_path / "file.bin"
+    with StubServer() as server:
+        client = stub_client(server)
+        obj_id = server.vault.add_object(0, "file", b"new" * 10)["ObjVer"]["ID"]
+        (tmp_path / "file.bin.part").write_bytes(b"old")
+        (tmp_path / ("file.bin.0-%d-%d-9.part" % (obj_id, obj_id))) \
+            .write_bytes(b"old")
+        (tmp_path / ("file.bin.0-%d-%d-latest.part" % (obj_id, obj_id))) \
+            .write_bytes(b"old")
+        manifest = client.download_many(
+            [(0, obj_id, obj_id, "latest", str(target))])
+        assert target.read_bytes() == b"new" * 10
+        assert manifest[0]["sha256"] == hashlib.sha256(b"new" * 10).hexdigest()
+        (tmp_path / ("file.bin.0-%d-%d-1.part" % (obj_id, obj_id))) \
+            .write_bytes(b"new")
+        target.unlink()
+        client.download_many([(0, obj_id, obj_id, 1, str(target))])
+    assert target.read_bytes() == b"new" * 10
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["file.bin"]
+
+def test_iter_search():
+    """Test lazily paging through search results."""
+    with StubServer() as server:
+        client = stub_client(server)
+        for i in range(25):
+            server.vault.add_object(0, "hit%d" % i, b"")
+        titles = [item["Title"] for item in
+                  client.iter_quick_search("hit", page_size=10, prefetch=True)]
+        pages = [request for request in server.vault.requests
+                 if request[1] == "objects"]
+    assert titles == ["hit%d" % i for i in range(25)]
+    assert len(pages) == 3
+
+def test_iter_search_capped():
+    """Test paging when the server returns smaller pages than asked for."""
+    with StubServer() as server:
+        client = stub_client(server)
+        for i in range(12):
+            server.vault.add_object(0, "hit%d" % i, b"")
+        server.vault.max_page_size = 5
+        for stream in (False, True):
+            titles = [item["Title"] for item in client.iter_search(
+                "q=hit", page_size=10, prefetch=True, stream=stream)]
+            assert titles == ["hit%d" % i for i in range(12)]
+
+def test_retry_and_reauthentication():
+    """Test retries of transient failures and renewal of expired tokens."""
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user=TEST_USER,
+                              password=TEST_PASS, vault=VAULT,
+                              retry_policy=RetryPolicy(backoff=0))
+        server.vault.token = "renewed-token"
+        server.vault.failures = [503, 502]
+        assert client.objects()[0]["Name"] == "Document"
+        assert client.headers["X-Authentication"] == "renewed-token"
+        # Object creation is not retried on errors that may have created it
+        server.vault.failures = [502]
+        with pytest.raises(MFilesException):
+            client.create_object("once")
+        assert not server.vault.objects
+        server.vault.failures = [503]
+        client.create_object("retried")
+        assert len(server.vault.objects) == 1
+
+def test_reauthentication_without_credentials(monkeypatch):
+    """Test that rejected tokens are renewed only with stored credentials."""
+    def prompt(*_args):
+        raise AssertionError("prompted from a request")
+    monkeypatch.setattr("builtins.input", prompt)
+    monkeypatch.setattr("mfiles.client.getpass", prompt)
+    for name in ("MFILES_USER", "MFILES_PASS"):
+        monkeypatch.delenv(name, raising=False)
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, vault=VAULT,
+                              token="stale-token")
+        with pytest.raises(MFilesException):
+            client.objects()
+        client = stub_client(server)
+        client.objects()
+        # Permission denied, not an expired session
+        server.vault.failures = [403]
+        with pytest.raises(MFilesException):
+            client.create_object("forbidden")
+        logins = [request for request in server.vault.requests
+                  if request[1] == "server/authenticationtokens"]
+    assert len(logins) == 1
+
+def test_upload_retry(tmp_path):
+    """Test that uploads from a path are retried, iterators are not."""
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(b"scan")
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user=TEST_USER,
+                              password=TEST_PASS, vault=VAULT,
+                              retry_policy=RetryPolicy(backoff=0))
+        server.vault.token = "renewed-token"
+        server.vault.failures = [503, 503]
+        assert client.upload_temporary_file(str(path))["Size"] == 4
+        server.vault.failures = [503]
+        with pytest.raises(MFilesException):
+            client.upload_temporary_file(iter([b"scan"]))
+        server.vault.failures = [503] * 4
+        with pytest.raises(MFilesException):
+            client.upload_temporary_file(str(path))
+        assert not server.vault.failures
+
+def test_thread_safe():
+    """Test many threads sharing a client and renewing the token once."""
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user=TEST_USER,
+                              password=TEST_PASS, vault=VAULT, pool_size=16,
+                              thread_safe=True)
+        client.login()
+        server.vault.token = "renewed-token"
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(lambda _: client.objects(), range(64)))
+        logins = [request for request in server.vault.requests
+                  if request[1] == "server/authenticationtokens"]
+    assert all(result[0]["Name"] == "Document" for result in results)
+    assert len(logins) == 2
+
+def test_worker_sessions(tmp_path):
+    """Test that threads started by the client never share its session."""
+    with StubServer() as server:
+        client = stub_client(server)
+        obj = server.vault.add_object(0, "file", b"x")
+        for i in range(4):
+            server.vault.add_object(0, "hit%d" % i, b"")
+        threads = set()
+        send = client.session.request
+        def request(*args, **kwargs):
+            threads.add(current_thread())
+            return send(*args, **kwargs)
+        client.session.request = request
+        client.objects()
+        client.download_many([(0, obj["ObjVer"]["ID"], obj["Files"][0]["ID"],
+                               1, str(tmp_path / ("f%d" % i)))
+                              for i in range(8)], workers=4)
+        assert len(list(client.iter_quick_search("hit", page_size=1,
+                                                 prefetch=True))) == 4
+    assert threads == {current_thread()}
+
+def test_lazy_login(tmp_path):
+    """Test that clients log in on first request and share cached tokens."""
+    token_cache = TokenCache(str(tmp_path / "tokens.json"))
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user=TEST_USER,
+                              password=TEST_PASS, vault=VAULT,
+                              token_cache=token_cache)
+        assert not server.vault.requests
+        client.objects()
+        assert token_cache.get(client.server, VAULT, TEST_USER) == \
+            server.vault.token
+        other = MFilesClient(server=server.url, user=TEST_USER,
+                             password=TEST_PASS, vault=VAULT,
+                             token_cache=token_cache)
+        other.objects()
+        logins = [request for request in server.vault.requests
+                  if request[1] == "server/authenticationtokens"]
+        assert len(logins) == 1
+        server.vault.token = "renewed-token"
+        other.objects()
+        assert token_cache.get(client.server, VAULT, TEST_USER) == \
+            "renewed-token"
+
+def test_update_many():
+    """Test bulk updates with rollback of failed objects."""
+    with StubServer() as server:
+        client = stub_client(server)
+        objects = [server.vault.add_object(0, "doc%d" % i, b"")
+                   for i in range(10)]
+        items = [(0, obj["ObjVer"]["ID"], {"Customer": "Initech",
+                                            "Name or title": "renamed"})
+                 for obj in objects[:9]]
+        items.append((0, objects[9]["ObjVer"]["ID"], {"Name or title": "x" * 101}))
+        report = client.update_many(items, workers=4)
+        item_lists = [request for request in server.vault.requests
+                      if request[1].startswith("valuelists")]
+    assert len(item_lists) == 1
+    updated = [entry for entry in report if entry["status"] == "updated"]
+    assert len(updated) == 9 and all(entry["version"] == 2
+                                     for entry in updated)
+    assert objects[0]["Properties"][0]["TypedValue"]["Lookup"]["Item"] == 2
+    failed = [entry for entry in report if entry["status"] == "failed"]
+    assert len(failed) == 1 and failed[0]["rolled_back"]
+    restored = server.vault.objects[(0, objects[9]["ObjVer"]["ID"])][0]
+    assert not restored["ObjectCheckedOut"] and restored["ObjVer"]["Version"] == 1
+
+def test_delete_many(tmp_path):
+    """Test bulk deletion with dry run and resumable checkpoints."""
+    checkpoint_path = str(tmp_path / "checkpoint.txt")
+    with StubServer() as server:
+        client = stub_client(server)
+        ids = [server.vault.add_object(0, "old%d" % i, b"")["ObjVer"]["ID"]
+               for i in range(20)]
+        report = client.delete_many(ids, dry_run=True)
+        assert {entry["status"] for entry in report} == {"dry run"}
+        assert not any(obj["Deleted"] for obj, _content
+                       in server.vault.objects.values())
+        progress = []
+        report = client.destroy_many(ids[:5], rate=1000,
+                                    checkpoint_path=checkpoint_path,
+                                    progress=lambda done, failed:
+                                    progress.append(done))
+        assert progress[-1] == 5
+        report = client.destroy_many(ids, checkpoint_path=checkpoint_path)
+        assert len(report) == 15
+        assert {entry["status"] for entry in report} == {"destroyed"}
+        assert not server.vault.objects
+        for i in range(30):
+            server.vault.add_object(0, "paged%d" % i, b"")
+        report = client.delete_many(client.iter_search("q=paged",
+                                                       page_size=10))
+        assert len(report) == 30
+        assert all(obj["Deleted"] for obj, _content
+                   in server.vault.objects.values())
+
+def test_upload_files(tmp_path):
+    """Test creating one object from several files and cleaning up."""
+    paths = []
+    for i, extension in enumerate(["dwg", "pdf", "txt"]):
+        paths.append(str(tmp_path / ("drawing.%s" % extension)))
+        with open(paths[-1], mode="wb") as file_stream:
+            file_stream.write(b"%d" % i * 1000)
+    with StubServer() as server:
+        client = stub_client(server)
+        obj = client.upload_files(paths, name="Drawing")
+        assert obj["Title"] == "Drawing"
+        content = server.vault.objects[(0, obj["ObjVer"]["ID"])][1]
+        assert content == b"0" * 1000 + b"1" * 1000 + b"2" * 1000
+        creations = [request for request in server.vault.requests
+                     if request == ("POST", "objects/0")]
+        assert len(creations) == 1
+        obj = client.upload_files([paths[1], paths[1]])
+        assert obj["Title"] == paths[1][:-len(".pdf")]
+        assert server.vault.objects[(0, obj["ObjVer"]["ID"])][1] == \
+            b"1" * 2000
+        with pytest.raises(MFilesException, match="No files"):
+            client.upload_files([])
+        server.vault.uploads.clear()
+        with pytest.raises(MFilesException):
+            client.upload_files(paths + [paths[0],
+                                         str(tmp_path / "missing.pdf")])
+        assert not server.vault.uploads
+        assert len(server.vault.objects) == 2
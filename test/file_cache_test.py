@@ -0,0 +1,96 @@
+"""Test cases for file_cache.py"""
+
+# Standard modules
+import hashlib
+import io
+import os
+
+# Internal modules
+from mfiles.client import MFilesClient
+from mfiles.file_cache import FileCache
+from benchmark.stub_server import StubServer, VAULT
+
+def test_cached_download(tmp_path):
+    """Test that specific versions are downloaded once and then linked."""
+    content = b"template" * 1000
+    cache = FileCache(str(tmp_path / "cache"), link=True)
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT, file_cache=cache)
+        obj = server.vault.add_object(0, "template", content)
+        args = (0, obj["ObjVer"]["ID"], obj["Files"][0]["ID"], 1)
+        first = str(tmp_path / "first.bin")
+        second = str(tmp_path / "second.bin")
+        client.download_file(first, *args)
+        requests = len(server.vault.requests)
+        checksum = hashlib.sha256()
+        client.download_file(second, *args, checksum=checksum)
+        assert len(server.vault.requests) == requests
+        assert checksum.hexdigest() == hashlib.sha256(content).hexdigest()
+        assert os.path.samefile(first, second)
+        file_stream = io.BytesIO()
+        client.download_file(file_stream, *args)
+        assert file_stream.getvalue() == content
+        client.download_file(str(tmp_path / "latest.bin"), *args[:3])
+        assert len(server.vault.requests) == requests + 1
+    assert cache.size() == len(content)
+
+def test_eviction(tmp_path):
+    """Test that least recently used files are evicted."""
+    cache = FileCache(str(tmp_path), max_size=10)
+    def writer(content):
+        def download(path):
+            with open(path, mode="wb") as file_stream:
+                file_stream.write(content)
+        return download
+    first = cache.fetch(("vault", 0, 1, 1, 1), writer(b"12345"))
+    os.utime(first, (0, 0))
+    cache.fetch(("vault", 0, 2, 1, 2), writer(b"12345"))
+    cache.fetch(("vault", 0, 3, 1, 3), writer(b"12345"))
+    assert not os.path.exists(first)
+    assert cache.size() == 10
+    large = cache.fetch(("vault", 0, 4, 1, 4), writer(b"x" * 20))
+    assert os.path.exists(large)
+
+def test_running_size(tmp_path, monkeypatch):
+    """Test that misses only scan the cache directory when it may be full."""
+    cache = FileCache(str(tmp_path), max_size=100)
+    scans = []
+    entries = cache._entries # pylint: disable=protected-access
+    monkeypatch.setattr(cache, "_entries",
+                        lambda: scans.append(1) or entries())
+    def download(path):
+        with open(path, mode="wb") as file_stream:
+            file_stream.write(b"x" * 10)
+    for i in range(10):
+        cache.fetch(("vault", 0, i, 1, i), download)
+    assert len(scans) == 1
+    cache.fetch(("vault", 0, 10, 1, 10), download)
+    assert len(scans) == 2
+    assert cache.size() == 100
+
+def test_checked_out_version(tmp_path):
+    """Test that files of checked out versions are never cached."""
+    cache = FileCache(str(tmp_path / "cache"))
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT, file_cache=cache)
+        obj = server.vault.add_object(0, "draft", b"draft 1")
+        key = (0, obj["ObjVer"]["ID"])
+        version = client.check_out(key[1])["ObjVer"]["Version"]
+        args = (0, key[1], obj["Files"][0]["ID"], version)
+        file_stream = io.BytesIO()
+        client.download_file(file_stream, *args)
+        assert file_stream.getvalue() == b"draft 1"
+        server.vault.objects[key] = (server.vault.objects[key][0], b"draft 2")
+        file_stream = io.BytesIO()
+        client.download_file(file_stream, *args)
+        assert file_stream.getvalue() == b"draft 2"
+        assert cache.size() == 0
+        client.check_in(key[1], version)
+        client.download_file(io.BytesIO(), *args)
+        requests = len(server.vault.requests)
+        file_stream = io.BytesIO()
+        client.download_file(file_stream, *args)
+        assert file_stream.getvalue() == b"draft 2"
+        assert len(server.vault.requests) == requests
@@ -0,0 +1,97 @@
+"""Test cases for http_cache.py"""
+
+from mfiles.client import MFilesClient
+from mfiles.http_cache import ACCESS_BATCH, ResponseCache
+from benchmark.stub_server import StubServer, VAULT
+
+def test_revalidation(tmp_path):
+    """Test that cached responses are revalidated and shared between runs."""
+    path = str(tmp_path / "responses.db")
+    events = []
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT, response_cache=ResponseCache(path))
+        client.add_metrics_sink(events.append)
+        first = client.objects()
+        assert client.objects() == first
+        assert [event.cache for event in events] == ["miss", "hit"]
+        assert events[1].status == 304 and events[1].bytes_in == 0
+        server.vault.structure["objecttypes"].append({"ID": 10,
+                                                      "Name": "Customer"})
+        assert len(client.objects()) == len(first) + 1
+        assert events[2].cache == "miss"
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT, response_cache=ResponseCache(path))
+        client.add_metrics_sink(events.append)
+        client.objects()
+        assert events[3].cache == "hit"
+        other = MFilesClient(server=server.url, user="other", password="pass",
+                             vault=VAULT, response_cache=ResponseCache(path))
+        other.add_metrics_sink(events.append)
+        other.objects()
+        assert events[4].cache == "miss"
+
+def test_object_version(tmp_path):
+    """Test that object versions are served without requests."""
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT, response_cache=cache)
+        obj = server.vault.add_object(0, "cached", b"x")
+        endpoint = "objects/0/%d/1" % obj["ObjVer"]["ID"]
+        assert client.get(endpoint)["Title"] == "cached"
+        requests = len(server.vault.requests)
+        assert client.get(endpoint)["Title"] == "cached"
+        assert len(server.vault.requests) == requests
+        # Checked out versions and sub-resources change, they are revalidated
+        version = client.check_out(obj["ObjVer"]["ID"])["ObjVer"]["Version"]
+        endpoint = "objects/0/%d/%d" % (obj["ObjVer"]["ID"], version)
+        assert client.get(endpoint)["Properties"] == []
+        value = {"PropertyDef": 1020,
+                 "TypedValue": {"DataType": 1, "Value": "changed"}}
+        client.set_properties(obj["ObjVer"]["ID"], [value], version)
+        assert client.get(endpoint)["Properties"] == [value]
+
+def test_token_scope(tmp_path):
+    """Test that clients given other tokens don't share cached responses."""
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    with StubServer() as server:
+        obj = server.vault.add_object(0, "secret", b"x")
+        endpoint = "objects/0/%d/1" % obj["ObjVer"]["ID"]
+        client = MFilesClient(server=server.url, vault=VAULT,
+                              token=server.vault.token, response_cache=cache)
+        assert client.get(endpoint)["Title"] == "secret"
+        server.vault.token = "other-token"
+        other = MFilesClient(server=server.url, vault=VAULT,
+                             token="other-token", response_cache=cache)
+        requests = len(server.vault.requests)
+        assert other.get(endpoint)["Title"] == "secret"
+        assert len(server.vault.requests) == requests + 1
+
+def test_eviction():
+    """Test that least recently used entries are evicted."""
+    cache = ResponseCache(max_size=10)
+    cache.put("a", b"12345", etag='"a"')
+    cache.put("b", b"12345", etag='"b"')
+    assert cache.get("a").etag == '"a"'
+    cache.put("c", b"12345", etag='"c"')
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size() == 10
+
+def test_batched_bookkeeping():
+    """Test that hits and puts below the size limit write little."""
+    cache = ResponseCache()
+    statements = []
+    cache._db.set_trace_callback( # pylint: disable=protected-access
+        statements.append)
+    for i in range(ACCESS_BATCH):
+        cache.put(str(i), b"12345", etag='"%d"' % i)
+    for i in range(ACCESS_BATCH - 1):
+        assert cache.get(str(i)).etag == '"%d"' % i
+    assert not [sql for sql in statements
+                if "SUM" in sql or sql.startswith("UPDATE")]
+    cache.get(str(ACCESS_BATCH - 1))
+    assert [sql for sql in statements if sql.startswith("UPDATE")]
+    cache.put("0", b"123")
+    assert cache.size() == 5 * ACCESS_BATCH - 2
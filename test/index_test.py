@@ -0,0 +1,79 @@
+"""Test cases for index.py"""
+
+from threading import Thread
+
+from mfiles.client import MFilesClient
+from mfiles.index import BATCH_SIZE, MetadataIndex
+from benchmark.stub_server import StubServer, VAULT
+
+def test_local_queries():
+    """Test class, property and name lookups with version invalidation."""
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        client.create_object("Annual report 2023", object_class=1,
+                             extra_info={"Customer": "ACME"})
+        client.create_object("Annual summary", object_class=0,
+                             extra_info={"Customer": "Initech"})
+        index = MetadataIndex(client)
+        # Search results hold no property values, they are fetched once
+        assert index.refresh() == 2
+        assert index.refresh() == 0
+        assert len([request for request in server.vault.requests
+                    if request[1].startswith("objects/0/")]) == 2
+        requests = len(server.vault.requests)
+        assert [obj["Title"] for obj in index.by_class(1)] == \
+            ["Annual report 2023"]
+        assert [obj["Title"] for obj in index.by_property(1020, 2)] == \
+            ["Annual summary"]
+        assert len(index.by_name("annual")) == 2
+        assert [obj["Title"] for obj in index.by_name("Annual rep")] == \
+            ["Annual report 2023"]
+        assert len(server.vault.requests) == requests
+        obj = index.by_class(1)[0]
+        assert index.is_current(obj["ObjVer"])
+        stale = dict(obj, ObjVer=dict(obj["ObjVer"], Version=0))
+        assert index.add([stale]) == 0
+        newer = dict(obj, ObjVer=dict(obj["ObjVer"], Version=5),
+                     Title="Annual report 2024")
+        assert index.add([newer]) == 1
+        assert index.get(0, obj["ObjVer"]["ID"])["Title"] == \
+            "Annual report 2024"
+        assert not index.by_name("Annual report 2023", fallback=False)
+        server.vault.add_object(0, "Budget", b"")
+        assert [obj["Title"] for obj in index.by_name("Budget")] == ["Budget"]
+        assert len(index) == 3
+
+def test_refresh_deleted():
+    """Test that objects deleted on the server are dropped by refresh."""
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        kept = client.create_object("Annual report", object_class=1)
+        gone = client.create_object("Annual summary", object_class=1)
+        index = MetadataIndex(client)
+        assert index.refresh() == 2
+        client.delete_object(0, gone["ObjVer"]["ID"])
+        assert index.refresh() == 1
+        assert index.refresh() == 0
+        assert [obj["Title"] for obj in index.by_class(1)] == \
+            ["Annual report"]
+        assert [obj["Title"] for obj in index.by_name("Annual")] == \
+            ["Annual report"]
+        assert index.get(0, gone["ObjVer"]["ID"]) is None
+        assert index.get(0, kept["ObjVer"]["ID"]) is not None
+
+def test_add_unlocked():
+    """Test that lookups are answered while items are read."""
+    index = MetadataIndex()
+    def items():
+        for i in range(BATCH_SIZE + 1):
+            if i == BATCH_SIZE:
+                lookup = Thread(target=len, args=(index,))
+                lookup.start()
+                lookup.join(timeout=5)
+                assert not lookup.is_alive()
+            yield {"ObjVer": {"Type": 0, "ID": i, "Version": 1},
+                   "Title": "Object %d" % i}
+    assert index.add(items()) == BATCH_SIZE + 1
+    assert len(index) == BATCH_SIZE + 1
@@ -0,0 +1,22 @@
+"""Test cases for __init__.py"""
+
+import subprocess
+import sys
+
+import mfiles
+
+def test_public_names():
+    """Test that the lazily imported clients are still public names."""
+    names = {}
+    exec("from mfiles import *", names) # pylint: disable=exec-used
+    assert {"AsyncMFilesClient", "MFilesClient", "MFilesClientPool",
+            "MFilesException"} <= set(names)
+    assert {"AsyncMFilesClient", "MFilesClient", "MFilesClientPool"} <= \
+        set(dir(mfiles))
+
+def test_lazy_import():
+    """Test that importing the package does not load the clients."""
+    code = "import sys, mfiles; print('requests' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,33 @@
+"""Test cases for metrics.py"""
+
+from mfiles.client import MFilesClient
+from mfiles.metrics import HistogramSink, endpoint_template
+from benchmark.stub_server import StubServer, VAULT
+
+def test_endpoint_template():
+    """Test that IDs are replaced with names."""
+    assert endpoint_template("objects/0/123/latest/files/5/content") == \
+        "objects/{type}/{id}/{version}/files/{file}/content"
+    assert endpoint_template("valuelists/101/items?page=2") == \
+        "valuelists/{list}/items"
+    assert endpoint_template("objects?q=test") == "objects"
+
+def test_histogram_sink():
+    """Test metrics aggregation of client requests."""
+    histogram = HistogramSink()
+    events = []
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        client.add_metrics_sink(histogram)
+        client.add_metrics_sink(events.append)
+        obj = server.vault.add_object(0, "measured", b"x" * 10)
+        client.objects()
+        client.objects()
+        client.check_out(obj["ObjVer"]["ID"])
+    summary = histogram.summary()
+    assert summary[("GET", "structure/objecttypes")]["count"] == 2
+    assert summary[("GET", "structure/objecttypes")]["bytes_in"] > 0
+    checkout = summary[("PUT", "objects/{type}/{id}/{version}/checkedout")]
+    assert checkout["count"] == 1 and checkout["bytes_out"] > 0
+    assert len(events) == 3 and events[0].retries == 0
@@ -0,0 +1,28 @@
+"""Test cases for paging.py"""
+
+import json
+
+from mfiles.paging import iter_pages
+from mfiles.streaming import ItemStream
+
+def test_short_and_empty_pages():
+    """Test paging on short pages and stopping at an empty page."""
+    pages = {1: [1, 2], 2: [3], 3: []}
+    requested = []
+    def fetch(page):
+        requested.append(page)
+        return {"Items": pages[page], "MoreResults": True}
+    assert list(iter_pages(fetch, prefetch=True)) == [1, 2, 3]
+    assert requested == [1, 2, 3]
+
+def test_streamed_pages():
+    """Test that streamed pages are closed when the items are left."""
+    closed = []
+    def fetch(page):
+        data = json.dumps({"Items": [page], "MoreResults": page < 3})
+        return ItemStream([data.encode()], close=lambda: closed.append(page))
+    items = iter_pages(fetch, prefetch=True)
+    assert next(items) == 1
+    items.close()
+    assert closed == [1]
+    assert list(iter_pages(fetch)) == [1, 2, 3]
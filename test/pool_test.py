@@ -0,0 +1,69 @@
+"""Test cases for pool.py"""
+
+from threading import Thread
+import time
+
+from mfiles.pool import MFilesClientPool
+from benchmark.stub_server import TOKEN, StubServer, VAULT
+
+OTHER_VAULT = "{11111111-1111-1111-1111-111111111111}"
+
+def logins(server):
+    """Count logins made to a stub server."""
+    return len([request for request in server.vault.requests
+                if request[1] == "server/authenticationtokens"])
+
+def test_routing_and_eviction():
+    """Test that clients are reused per vault and share connections."""
+    with StubServer() as server, \
+            MFilesClientPool(user="user", password="pass") as pool:
+        client = pool.client(VAULT, server=server.url)
+        assert pool.client(VAULT, server=server.url.rstrip("/")) is client
+        other = pool.client(OTHER_VAULT, server=server.url)
+        assert other is not client and other.adapter is client.adapter
+        assert other.thread_safe
+        client.objects()
+        other.objects()
+        assert logins(server) == 2
+        assert len(pool) == 2
+        pool.idle_timeout = 0
+        assert pool.evict_idle() == 2
+        assert len(pool) == 0
+
+def test_background_refresh():
+    """Test that tokens are renewed in the background."""
+    with StubServer() as server:
+        with MFilesClientPool(user="user", password="pass",
+                              refresh_interval=0.05) as pool:
+            client = pool.client(VAULT, server=server.url)
+            client.objects()
+            server.vault.token = "renewed-token"
+            deadline = time.monotonic() + 5
+            while client.headers["X-Authentication"] != "renewed-token" and \
+                    time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert client.headers["X-Authentication"] == "renewed-token"
+        assert pool._thread is None # pylint: disable=protected-access
+
+def test_refresh_tokens(monkeypatch):
+    """Test that renewals take the client lock and never prompt."""
+    def prompt(*_args):
+        raise AssertionError("prompted for credentials")
+    monkeypatch.setattr("builtins.input", prompt)
+    monkeypatch.setattr("mfiles.client.getpass", prompt)
+    monkeypatch.delenv("MFILES_PASS", raising=False)
+    with StubServer() as server, MFilesClientPool(user="user") as pool:
+        anonymous = pool.client(VAULT, server=server.url)
+        anonymous.headers = {"X-Authentication": TOKEN}
+        assert pool.refresh_tokens() == 0
+        client = pool.client(OTHER_VAULT, server=server.url, password="pass")
+        client.objects()
+        renewal = Thread(target=pool.refresh_tokens)
+        # pylint: disable=protected-access
+        with client._auth_lock:
+            renewal.start()
+            renewal.join(timeout=0.2)
+            assert renewal.is_alive()
+            assert logins(server) == 1
+        renewal.join()
+        assert logins(server) == 2
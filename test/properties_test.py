@@ -0,0 +1,53 @@
+"""Test cases for properties.py"""
+
+import json
+
+from mfiles.client import MFilesClient
+from mfiles.properties import PropertyTemplate, build_object, build_property
+from benchmark.stub_server import StubServer, VAULT
+
+def test_resolve_many():
+    """Test that a batch resolves each definition and value list once."""
+    with StubServer(value_list_size=50) as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        objects = [(0, 1, {"Customer": "Item %d" % i, "Comment": "c%d" % i})
+                   for i in range(20)]
+        resolved = client.property_resolver.resolve_many(objects)
+        paths = [request[1] for request in server.vault.requests]
+    assert paths.count("structure/properties") == 1
+    assert paths.count("valuelists/101/items") == 1
+    assert resolved[3][0]["TypedValue"]["Lookup"]["Item"] == 1003
+    assert resolved[3][1]["TypedValue"]["Value"] == "c3"
+    template = client.property_resolver.template(0, 1, ["Customer", "Comment"])
+    assert template.value_lists == {101}
+
+def test_build_json():
+    """Test that compiled templates render the same object as builders."""
+    infos = [{"ID": 1020, "Name": "Customer", "DataType": 9, "ValueList": 101},
+             {"ID": 1021, "Name": "Comment", "DataType": 13}]
+    template = PropertyTemplate(infos, 0, 1)
+    file_info = {"UploadID": 7, "Title": "drawing", "Extension": "pdf",
+                 "Size": 3}
+    data = template.build_json("Drawing \"A\"", ["ACME", "Ünïcode"],
+                               file_info, lambda value, list_id, owners: 42)
+    properties = [build_property(infos[0], 42),
+                  build_property(infos[1], "Ünïcode")]
+    assert json.loads(data) == build_object("Drawing \"A\"", 1, properties,
+                                            file_info)
+    assert not build_object("A", 1, [])["Files"]
+    assert build_object("A", 1, [], [file_info] * 2)["Files"] == \
+        [file_info] * 2
+    assert json.loads(data) == {
+        "PropertyValues": [
+            {"PropertyDef": 0, "TypedValue": {"DataType": 1,
+                                              "Value": "Drawing \"A\""}},
+            {"PropertyDef": 100, "TypedValue": {"DataType": 9, "Lookup": {
+                "Item": 1, "Version": -1}}},
+            {"PropertyDef": 1020, "TypedValue": {"DataType": 9, "Lookup": {
+                "Item": 42, "Version": -1}}},
+            {"PropertyDef": 1021, "TypedValue": {"DataType": 13,
+                                                 "Value": "Ünïcode"}}
+        ],
+        "Files": [file_info]
+    }
@@ -0,0 +1,57 @@
+"""Test cases for records.py"""
+
+from mfiles.client import MFilesClient
+from mfiles.properties import Lookup, PropertyValue
+from mfiles.records import ObjVer, ObjectVersion, ObjectVersionBatch
+from benchmark.stub_server import StubServer, VAULT
+
+ITEM = {
+    "ObjVer": {"Type": 0, "ID": 7, "Version": 3},
+    "Title": "Report",
+    "Class": 1,
+    "Files": [{"ID": 12, "Name": "Report", "Extension": "pdf", "Size": 10,
+               "Version": 2}],
+    "Properties": [
+        {"PropertyDef": 0, "TypedValue": {"DataType": 1, "Value": "Report"}},
+        {"PropertyDef": 100, "TypedValue": {
+            "DataType": 9, "Lookup": {"Item": 1, "Version": -1}}},
+        {"PropertyDef": 1020, "TypedValue": {
+            "DataType": 10, "Lookups": [{"Item": 4, "Version": -1},
+                                        {"Item": 5, "Version": 2}]}}
+    ]
+}
+
+def test_object_version():
+    """Test lazily decoded records and access to the raw dict."""
+    item = ObjectVersion(ITEM)
+    assert item.obj_ver == ObjVer(0, 7, 3)
+    assert (item.type, item.id, item.version) == (0, 7, 3)
+    assert item["Title"] == item.title == "Report"
+    assert item.object_class == 1 and not item.deleted
+    assert [(f.id, f.extension, f.version) for f in item.files] == \
+        [(12, "pdf", 2)]
+    properties = item.properties
+    assert isinstance(properties[1].value, Lookup)
+    assert [lookup.item for lookup in properties[2].value] == [4, 5]
+    assert [prop.to_dict() for prop in properties] == ITEM["Properties"]
+    assert item.raw is ITEM
+    multi = PropertyValue(1020, 10, [4, Lookup(5, 2)])
+    assert multi.to_dict() == ITEM["Properties"][2]
+
+def test_batch():
+    """Test columnar batches of search results."""
+    with StubServer() as server:
+        for i in range(5):
+            server.vault.add_object(0, "doc %d" % i, b"x")
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        batch = client.search_batch("", page_size=2, stream=True)
+        items = list(client.iter_search(""))
+    assert len(batch) == len(ObjectVersionBatch({"Items": items})) == 5
+    assert list(batch.ids) == [item["ObjVer"]["ID"] for item in items]
+    assert batch.titles == [item["Title"] for item in items]
+    index = batch.find(0, items[3]["ObjVer"]["ID"])
+    assert index == 3 and batch.raw(index) == items[3]
+    assert batch[index].obj_ver == batch.obj_ver(index)
+    batch.append(ObjectVersion(ITEM))
+    assert batch.classes[-1] == 1 and batch[-1].files[0].id == 12
@@ -0,0 +1,59 @@
+"""Test cases for streaming.py"""
+
+import json
+
+import pytest
+
+from mfiles.client import MFilesClient
+from mfiles.errors import MFilesException
+from mfiles.streaming import ItemStream
+from benchmark.stub_server import StubServer, VAULT
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_chunk_boundaries(size):
+    """Test that items split across chunks are decoded."""
+    result = {"Count": 12345, "Items": [{"ID": 1, "Name": "Å \"x\""},
+                                        [1.5, None], 678, "y"],
+              "MoreResults": True}
+    closed = []
+    data = json.dumps(result, indent=1, ensure_ascii=False).encode()
+    stream = ItemStream(_chunks(data, size), close=lambda: closed.append(1))
+    assert list(stream.get("Items")) == result["Items"]
+    assert stream["MoreResults"] and stream["Count"] == 12345
+    assert closed == [1]
+    with pytest.raises(MFilesException):
+        iter(stream)
+    assert not list(ItemStream([b'{"Items": []}']))
+    with pytest.raises(MFilesException):
+        list(ItemStream([b'{"Items": [1, 2']))
+
+def test_split_numbers():
+    """Test that numbers split across one byte chunks are not cut short."""
+    data = b'{"Count":1.5,"Items":[2.25,-3e+10,4.5E-2,10,[6.5]],"Total":-7.75}'
+    stream = ItemStream(_chunks(data, 1))
+    assert list(stream) == [2.25, -3e+10, 4.5E-2, 10, [6.5]]
+    assert stream["Count"] == 1.5 and stream["Total"] == -7.75
+    assert list(ItemStream([b'{"Items":[1', b'.', b'5', b"]}"])) == [1.5]
+
+def test_streamed_requests():
+    """Test streamed value lists and searches with early stop."""
+    with StubServer(value_list_size=50) as server:
+        for i in range(5):
+            server.vault.add_object(0, "doc %d" % i, b"x")
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT, stream_items=True)
+        stream = client.value_list_items(101)
+        item = next(item for item in stream.get("Items")
+                    if item["Name"] == "Item 3")
+        assert item["ID"] == 1003
+        stream.close()
+        page = client.value_list_items(101, page=1, limit=10)
+        assert len(list(page.get("Items"))) == 10 and page["MoreResults"]
+        assert client.get_value_id("Item 42", 101, []) == 1042
+        titles = [item["Title"] for item in client.iter_search("", 2)]
+        assert titles == [item["Title"] for item in
+                          client.iter_search("", 2, stream=False)]
+        assert len(titles) == 5
@@ -0,0 +1,57 @@
+"""Test cases for sync.py"""
+
+import os
+
+from mfiles.client import MFilesClient
+from mfiles.sync import VaultMirror
+from benchmark.stub_server import StubServer, VAULT
+
+def test_incremental_sync(tmp_path):
+    """Test that only changes since the last sync are transferred."""
+    directory = str(tmp_path / "mirror")
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        objects = [server.vault.add_object(0, "doc%d" % i, b"v1-%d" % i)
+                   for i in range(10)]
+        with VaultMirror(client, directory, workers=4) as mirror:
+            summary = mirror.sync()
+            assert summary["created"] == 10 and not summary["failed"]
+            path = os.path.join(mirror.path(0, 3), "doc2.bin")
+            with open(path, mode="rb") as file_stream:
+                assert file_stream.read() == b"v1-2"
+            assert mirror.sync()["created"] == 0
+        downloads = [request for request in server.vault.requests
+                     if request[1].endswith("/content")]
+        assert len(downloads) == 10
+        client.check_out(objects[0]["ObjVer"]["ID"])
+        client.check_in(objects[0]["ObjVer"]["ID"])
+        client.delete_object(0, objects[1]["ObjVer"]["ID"])
+        server.vault.add_object(0, "new", b"new")
+        with VaultMirror(client, directory) as mirror:
+            summary = mirror.sync()
+            assert (summary["created"], summary["changed"],
+                    summary["deleted"]) == (1, 1, 1)
+            assert not os.path.exists(mirror.path(0, 2))
+            assert len(list(mirror.objects())) == 10
+            assert mirror.sync()["changed"] == 0
+        downloads = [request for request in server.vault.requests
+                     if request[1].endswith("/content")]
+        assert len(downloads) == 11
+
+def test_stale_part(tmp_path):
+    """Test that partial files of another version are not resumed."""
+    with StubServer() as server:
+        client = MFilesClient(server=server.url, user="user", password="pass",
+                              vault=VAULT)
+        server.vault.add_object(0, "doc", b"version 2")
+        with VaultMirror(client, str(tmp_path / "mirror")) as mirror:
+            folder = mirror.path(0, 1)
+            os.makedirs(folder)
+            for name in ("doc.bin.part", "doc.bin.0-1-1-0.part"):
+                with open(os.path.join(folder, name), mode="wb") as file_stream:
+                    file_stream.write(b"version 1")
+            assert mirror.sync()["created"] == 1
+            with open(os.path.join(folder, "doc.bin"), mode="rb") as file_stream:
+                assert file_stream.read() == b"version 2"
+            assert os.listdir(folder) == ["doc.bin"]